@@ -0,0 +1,163 @@
+"""Group broadcast throughput of the Redis channel layers over 1, 2 and 4 Redis instances.
+
+    python -m benchmarks.channel_layer --redis 1 2 4 --messages 50000 --local-fraction 0.5
+
+Starts one throwaway redis-server per shard on consecutive ports from
+--base-port (or uses --hosts as given), then for every shard count runs the
+same workload through channels_redis' RedisChannelLayer and
+config.channel_layers.LocalRedisChannelLayer. Each simulated worker is a
+separate layer instance with its own client prefix; every room has two
+members, both on one worker with probability --local-fraction and on
+different workers otherwise. Workers share this process, so compare the
+numbers with each other rather than with production.
+"""
+import asyncio
+import random
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager, nullcontext
+from .common import setup_django, argument_parser, report
+
+LAYERS = {
+    'redis': 'channels_redis.core.RedisChannelLayer',
+    'local': 'config.channel_layers.LocalRedisChannelLayer',
+}
+
+
+@contextmanager
+def redis_servers(ports):
+    if not shutil.which('redis-server'):
+        raise SystemExit('redis-server is not on PATH; start Redis yourself and pass --hosts')
+    processes = [
+        subprocess.Popen(
+            ['redis-server', '--port', str(port), '--save', '', '--appendonly', 'no'],
+            stdout=subprocess.DEVNULL,
+        )
+        for port in ports
+    ]
+    try:
+        for port in ports:
+            wait_for_redis(port)
+        yield [f'redis://127.0.0.1:{port}' for port in ports]
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def wait_for_redis(port, timeout=10):
+    import redis
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            redis.Redis(port=port).ping()
+            return
+        except redis.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+async def run_workload(backend, hosts, args):
+    from django.utils.module_loading import import_string
+
+    layer_class = import_string(backend)
+    workers = [layer_class(hosts=hosts, capacity=args.capacity) for _ in range(args.workers)]
+    random.seed(42)
+
+    rooms = []
+    members = []
+    for room in range(args.rooms):
+        group = f'chat_{room}'
+        first = random.randrange(args.workers)
+        second = first
+        if args.workers > 1 and random.random() >= args.local_fraction:
+            second = (first + random.randrange(1, args.workers)) % args.workers
+        for index in (first, second):
+            channel = await workers[index].new_channel()
+            await workers[index].group_add(group, channel)
+            members.append((workers[index], channel))
+        rooms.append((workers[first], group))
+
+    expected = args.messages * 2
+    received = 0
+    done = asyncio.Event()
+
+    async def receive(layer, channel):
+        nonlocal received
+        while True:
+            await layer.receive(channel)
+            received += 1
+            if received >= expected:
+                done.set()
+
+    receivers = [asyncio.ensure_future(receive(layer, channel)) for layer, channel in members]
+    payload = 'x' * args.payload
+    counter = iter(range(args.messages))
+
+    async def send():
+        for i in counter:
+            layer, group = rooms[i % len(rooms)]
+            await layer.group_send(group, {'type': 'chat.message', 'id': i, 'json': payload})
+
+    start = time.perf_counter()
+    await asyncio.gather(*[send() for _ in range(args.concurrency)])
+    try:
+        await asyncio.wait_for(done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    seconds = time.perf_counter() - start
+
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    await workers[0].flush()
+    for layer in workers:
+        await layer.close_pools()
+    return {
+        'messages_per_sec': round(args.messages / seconds, 1),
+        'deliveries_per_sec': round(received / seconds, 1),
+        'delivered': received,
+        'expected': expected,
+        'seconds': round(seconds, 3),
+    }
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--redis', type=int, nargs='+', default=[1, 2, 4], help='shard counts to compare')
+    parser.add_argument('--hosts', nargs='+', help='existing Redis URLs to use instead of starting redis-server')
+    parser.add_argument('--base-port', type=int, default=6390)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rooms', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=50_000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--local-fraction', type=float, default=0.5, help='share of rooms with both members on one worker')
+    parser.add_argument('--payload', type=int, default=200, help='bytes of pre-encoded message text')
+    parser.add_argument('--capacity', type=int, default=10_000)
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    setup_django()
+    shards = max(args.redis)
+    if args.hosts:
+        servers = nullcontext(args.hosts)
+    else:
+        servers = redis_servers([args.base_port + i for i in range(shards)])
+
+    results = {}
+    with servers as hosts:
+        if len(hosts) < shards:
+            raise SystemExit(f'need {shards} Redis hosts, got {len(hosts)}')
+        for count in args.redis:
+            results[f'{count}_redis'] = {
+                name: asyncio.run(run_workload(backend, hosts[:count], args))
+                for name, backend in LAYERS.items()
+            }
+    report('channel_layer', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# 벤치마크는 .env 없이도 로컬에서 돌 수 있도록 기본값을 채운다
+DEFAULT_ENV = {
+    'SECRET_KEY': 'benchmark-secret-key',
+    'DEBUG': 'False',
+    'USER_SERVICE_URL': 'http://127.0.0.1:1/',
+    'REDIS_HOST': '127.0.0.1',
+    'REDIS_PORT': '6379',
+    'REDIS_DB': '0',
+    'REDIS_CAPACITY': '1000',
+}
+
+# 채팅을 보내는 벤치마크는 처리량을 재므로 메시지 속도 제한을 환경과 상관없이 끈다
+UNTHROTTLED_ENV = {
+    'CHAT_RATE_PER_CONNECTION': '1000000',
+    'CHAT_BURST_PER_CONNECTION': '1000000',
+    'CHAT_USER_RATE_LIMIT': 'False',
+}
+
+
+def setup_django(env=None):
+    sys.path.insert(0, str(BASE_DIR))
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ.update(env or {})
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database(keepdb=False):
+    # sqlite는 공유 메모리 DB, postgresql은 test_<NAME> DB를 만들고 마이그레이션을 적용
+    from django.db import connection
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+
+async def receive_echo(sender, timeout=30):
+    # 거절된 메시지는 받는 쪽에 가지 않으므로 보낸 쪽의 응답부터 확인해 기다리지 않고 실패한다
+    frame = await sender.receive_json_from(timeout=timeout)
+    if frame.get('type') == 'error':
+        raise RuntimeError(f'chat message rejected: {frame.get("message")}')
+    return frame
+
+
+def argument_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--output', help='append the JSON result to this file')
+    return parser
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    # 초 단위 샘플을 ms 단위 요약으로 변환
+    return {
+        'count': len(samples),
+        'p50_ms': _ms(percentile(samples, 50)),
+        'p99_ms': _ms(percentile(samples, 99)),
+        'max_ms': _ms(max(samples) if samples else None),
+        'mean_ms': _ms(sum(samples) / len(samples) if samples else None),
+    }
+
+
+def _ms(value):
+    return None if value is None else round(value * 1000, 3)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(name, params, results, output=None):
+    from django.db import connection
+
+    document = {
+        'benchmark': name,
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'params': params,
+        'results': results,
+    }
+    line = json.dumps(document)
+    print(line)
+    if output:
+        with open(output, 'a') as f:
+            f.write(line + '\n')
+    return document
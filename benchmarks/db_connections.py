@@ -0,0 +1,122 @@
+"""Database connection churn of the REST endpoints under rising concurrency.
+
+    python -m benchmarks.db_connections --requests 5000 --concurrency 10 50 200
+
+Drives the same room/message list requests as benchmarks.rest_api and
+counts how many database connections they open: Django connects
+(connection_created), physical connections opened by the psycopg pool and,
+on PostgreSQL, new server sessions from pg_stat_database. Pooling and
+CONN_MAX_AGE are read from settings at startup, so run it once per setup
+and compare with --output, e.g.
+
+    DATABASE_ENGINE=postgresql DATABASE_POOL=False python -m benchmarks.db_connections --output churn.jsonl
+    DATABASE_ENGINE=postgresql DATABASE_POOL=True python -m benchmarks.db_connections --output churn.jsonl
+"""
+import asyncio
+from .common import setup_django, test_database, argument_parser, report
+from .loadtest import make_token
+from .rest_api import hammer
+
+
+def server_sessions():
+    from django.db import connection
+
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        # 통계 스냅샷은 트랜잭션 동안 고정되므로 매번 비운다
+        cursor.execute('SELECT pg_stat_clear_snapshot()')
+        cursor.execute('SELECT sessions FROM pg_stat_database WHERE datname = current_database()')
+        return cursor.fetchone()[0]
+
+
+def pool_connections():
+    from django.db import connection
+
+    pool = getattr(connection, 'pool', None)
+    return pool.get_stats().get('connections_num', 0) if pool else None
+
+
+def delta(after, before):
+    return None if after is None or before is None else after - before
+
+
+async def run(args):
+    from asgiref.sync import sync_to_async
+    from django.db.backends.signals import connection_created
+    from chat_app.models import ChatRoom, Message
+    from chat_app.tests.user_service_stub import UserServiceStub
+    from config.http_client import user_service_client
+    from config.asgi import application
+
+    chatrooms = await ChatRoom.objects.abulk_create(
+        ChatRoom(user1_id=1, user2_id=i + 2) for i in range(args.rooms)
+    )
+    await Message.objects.abulk_create(
+        Message(chatroom=chatroom, sender_id=chatroom.user1_id, content=f'message {i}')
+        for chatroom in chatrooms
+        for i in range(args.messages)
+    )
+    user_ids = {1} | {chatroom.user2_id for chatroom in chatrooms}
+    tokens = {user_id: make_token(user_id) for user_id in user_ids}
+    stub = await UserServiceStub({
+        user_id: {'id': user_id, 'nickname': f'user{user_id}', 'avatar': None} for user_id in user_ids
+    }).start()
+    user_service_client.base_url = stub.url
+    paths = [(1, '/api/chat/rooms/')] + [
+        (chatroom.user2_id, f'/api/chat/{chatroom.id}/messages/') for chatroom in chatrooms
+    ]
+
+    connects = 0
+
+    def count_connect(**kwargs):
+        nonlocal connects
+        connects += 1
+
+    connection_created.connect(count_connect)
+    results = {}
+    try:
+        for concurrency in args.concurrency:
+            connects = 0
+            sessions_before = await sync_to_async(server_sessions)()
+            pooled_before = pool_connections()
+            stats = await hammer(application, paths, tokens, args.requests, concurrency)
+            results[f'concurrency_{concurrency}'] = {
+                **stats,
+                'django_connects': connects,
+                'pool_connections_opened': delta(pool_connections(), pooled_before),
+                'server_sessions': delta(await sync_to_async(server_sessions)(), sessions_before),
+            }
+    finally:
+        connection_created.disconnect(count_connect)
+        await user_service_client.close()
+        await stub.close()
+    return results
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--requests', type=int, default=5000, help='requests per concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--rooms', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=50, help='messages per room')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+
+    database = connection.settings_dict
+    params = {
+        **vars(args),
+        'pool': database.get('OPTIONS', {}).get('pool'),
+        'conn_max_age': database.get('CONN_MAX_AGE'),
+        'replicas': [alias for alias in settings.DATABASES if alias != 'default'],
+    }
+    with test_database():
+        results = asyncio.run(run(args))
+    report('db_connections', params, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
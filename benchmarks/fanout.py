@@ -0,0 +1,135 @@
+"""Cost of serializing group broadcasts for rooms with many subscribers.
+
+    python -m benchmarks.fanout --subscribers 2 10 100 500 --messages 50
+
+For each JSON backend it reports the encode cost of one broadcast when
+every receiver serializes its own frame (the old chat_message path)
+versus serializing once in handle_chat, and the end-to-end latency of a
+broadcast through ChatConsumer with an in-memory channel layer.
+"""
+import asyncio
+import time
+from unittest.mock import patch
+from .common import setup_django, test_database, argument_parser, summarize, report, receive_echo, UNTHROTTLED_ENV
+
+EVENT = {
+    'type': 'chat.message',
+    'id': 123456789,
+    'sender_id': 1,
+    'sender': 'alice',
+    'avatar': 'https://cdn.example.com/avatars/alice.png',
+    'content': '안녕하세요, 오늘 회의는 3시에 시작합니다. ' * 3,
+    'timestamp': '2024-12-01T12:00:00.000000Z',
+}
+
+
+def per_receiver(backend, subscribers, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for _ in range(subscribers):
+            backend.dumps({
+                "type": "chat.message",
+                "id": EVENT["id"],
+                "sender": EVENT["sender"],
+                "avatar": EVENT["avatar"],
+                "content": EVENT["content"],
+                "timestamp": EVENT["timestamp"]
+            })
+    return (time.perf_counter() - start) / rounds
+
+
+def once(backend, subscribers, rounds):
+    from chat_app.protocol import encode_chat_message
+
+    with patch('chat_app.protocol.json_codec.dumps', backend.dumps):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            encode_chat_message(
+                EVENT['id'], EVENT['sender_id'], EVENT['sender'], EVENT['avatar'], EVENT['content'], EVENT['timestamp']
+            )
+    return (time.perf_counter() - start) / rounds
+
+
+async def broadcast(chatroom, subscribers, messages, subprotocols):
+    from channels.routing import URLRouter
+    from channels.testing import WebsocketCommunicator
+    from chat_app.routing import websocket_urlpatterns
+
+    application = URLRouter(websocket_urlpatterns)
+    sockets = []
+    for i in range(subscribers):
+        communicator = WebsocketCommunicator(
+            application, f'ws/chat/{chatroom.id}/', subprotocols=subprotocols if i else None
+        )
+        communicator.scope['user_id'] = chatroom.user1_id if i % 2 == 0 else chatroom.user2_id
+        communicator.scope['token'] = 'token'
+        connected, _ = await communicator.connect(timeout=30)
+        if not connected:
+            raise RuntimeError('could not connect')
+        sockets.append(communicator)
+
+    sender, receivers = sockets[0], sockets[1:]
+    samples = []
+    for i in range(messages):
+        start = time.perf_counter()
+        await sender.send_json_to({'type': 'chat', 'content': f'{EVENT["content"]} {i}'})
+        await receive_echo(sender)
+        await asyncio.gather(*[ws.receive_from(timeout=30) for ws in receivers])
+        samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[ws.disconnect() for ws in sockets])
+    return samples
+
+
+async def run_broadcasts(args, backends):
+    from chat_app.models import ChatRoom
+    from chat_app.protocol import MSGPACK_SUBPROTOCOL, MsgpackProtocol
+
+    async def get_user(user_id, token):
+        return {'id': user_id, 'nickname': f'user{user_id}', 'avatar': EVENT['avatar']}
+
+    chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+    results = {}
+    # 합치기 창이 지연으로 잡히지 않도록 배치 전송은 끈다
+    with patch('chat_app.services.UserService.get_user', side_effect=get_user), \
+            patch.object(MsgpackProtocol, 'max_events', 1):
+        for name, backend in backends.items():
+            for protocol, subprotocols in (('json', None), ('msgpack', [MSGPACK_SUBPROTOCOL])):
+                for subscribers in args.subscribers:
+                    with patch('chat_app.protocol.json_codec.dumps', backend.dumps):
+                        samples = await broadcast(chatroom, subscribers, args.messages, subprotocols)
+                    results[f'{name}/{protocol}/{subscribers}'] = summarize(samples)
+    return results
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[2, 10, 100, 500])
+    parser.add_argument('--messages', type=int, default=50, help='broadcasts per end-to-end run')
+    parser.add_argument('--rounds', type=int, default=200, help='broadcasts per encode measurement')
+    args = parser.parse_args()
+
+    setup_django(UNTHROTTLED_ENV)
+    from django.test.utils import override_settings
+    from config.json_codec import BACKENDS, orjson
+
+    backends = {name: backend for name, backend in BACKENDS.items() if name != 'orjson' or orjson is not None}
+    encode = {}
+    for name, backend in backends.items():
+        for subscribers in args.subscribers:
+            encode[f'{name}/{subscribers}'] = {
+                'per_receiver_us': round(per_receiver(backend, subscribers, args.rounds) * 1e6, 2),
+                'once_us': round(once(backend, subscribers, args.rounds) * 1e6, 2),
+            }
+
+    override_settings(CHANNEL_LAYERS={'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 10000},
+    }}).enable()
+    with test_database():
+        broadcasts = asyncio.run(run_broadcasts(args, backends))
+
+    report('fanout', vars(args), {'encode': encode, 'broadcast': broadcasts}, args.output)
+
+
+if __name__ == '__main__':
+    main()
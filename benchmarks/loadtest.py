@@ -0,0 +1,202 @@
+"""WebSocket chat and REST history load test against config.asgi:application.
+
+    python -m benchmarks.loadtest --rooms 1000 --messages 20 --readers 200
+    python -m benchmarks.loadtest --channel-layer redis   # uses REDIS_HOST/REDIS_PORT
+
+Runs fully in-process: a throwaway test database, an in-memory (or local
+Redis) channel layer and a stub user service on 127.0.0.1. Prints one
+JSON document so results can be compared between commits.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from .common import setup_django, test_database, argument_parser, summarize, report, receive_echo, UNTHROTTLED_ENV
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        def on_connection_created(sender, connection, **kwargs):
+            if self not in connection.execute_wrappers:
+                connection.execute_wrappers.append(self)
+
+        connection_created.connect(on_connection_created, weak=False)
+        for connection in connections.all():
+            on_connection_created(None, connection)
+
+    def take(self):
+        count, self.count = self.count, 0
+        return count
+
+
+def channel_layers(kind):
+    if kind == 'redis':
+        from config.settings import REDIS_HOST, REDIS_PORT
+        return {'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [(REDIS_HOST, REDIS_PORT)], 'capacity': 10000},
+        }}
+    return {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 10000}}}
+
+
+def make_token(user_id):
+    import jwt
+    from config.settings import JWT_SECRET_KEY
+    return jwt.encode({
+        'user_id': user_id,
+        'exp': datetime.utcnow() + timedelta(hours=1),
+    }, JWT_SECRET_KEY, algorithm='HS256')
+
+
+async def connect_all(application, chatrooms, tokens, concurrency):
+    from channels.testing import WebsocketCommunicator
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    sockets = {}
+
+    async def connect(chatroom, user_id):
+        communicator = WebsocketCommunicator(
+            application, f'/ws/chat/{chatroom.id}/?token={tokens[user_id]}'
+        )
+        async with semaphore:
+            start = time.perf_counter()
+            connected, _ = await communicator.connect(timeout=30)
+            samples.append(time.perf_counter() - start)
+        if not connected:
+            raise RuntimeError(f'user {user_id} could not join chatroom {chatroom.id}')
+        sockets[(chatroom.id, user_id)] = communicator
+
+    await asyncio.gather(*[
+        connect(chatroom, user_id)
+        for chatroom in chatrooms
+        for user_id in (chatroom.user1_id, chatroom.user2_id)
+    ])
+    return sockets, samples
+
+
+async def chat(sockets, chatrooms, messages):
+    samples = []
+
+    async def converse(chatroom):
+        sender = sockets[(chatroom.id, chatroom.user1_id)]
+        receiver = sockets[(chatroom.id, chatroom.user2_id)]
+        for i in range(messages):
+            start = time.perf_counter()
+            await sender.send_json_to({'type': 'chat', 'content': f'message {i}'})
+            await receive_echo(sender)
+            await receiver.receive_json_from(timeout=30)
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[converse(chatroom) for chatroom in chatrooms])
+    return samples, time.perf_counter() - start
+
+
+async def read_history(application, chatrooms, tokens, readers, requests_per_reader):
+    from channels.testing import HttpCommunicator
+
+    samples = []
+
+    async def reader(index):
+        chatroom = chatrooms[index % len(chatrooms)]
+        headers = [(b'authorization', f'Bearer {tokens[chatroom.user1_id]}'.encode()), (b'host', b'localhost')]
+        for _ in range(requests_per_reader):
+            communicator = HttpCommunicator(application, 'GET', f'/api/chat/{chatroom.id}/messages/', headers=headers)
+            start = time.perf_counter()
+            response = await communicator.get_response(timeout=30)
+            samples.append(time.perf_counter() - start)
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(timeout=30)
+            if response['status'] != 200:
+                raise RuntimeError(f'message_list returned {response["status"]}')
+
+    start = time.perf_counter()
+    await asyncio.gather(*[reader(i) for i in range(readers)])
+    return samples, time.perf_counter() - start
+
+
+async def run(args, queries):
+    from chat_app.models import ChatRoom
+    from chat_app.tests.user_service_stub import UserServiceStub
+    from config.http_client import user_service_client
+    from config.asgi import application
+
+    chatrooms = await ChatRoom.objects.abulk_create(
+        ChatRoom(user1_id=i * 2 + 1, user2_id=i * 2 + 2) for i in range(args.rooms)
+    )
+    user_ids = range(1, args.rooms * 2 + 1)
+    tokens = {user_id: make_token(user_id) for user_id in user_ids}
+    stub = await UserServiceStub({
+        user_id: {'id': user_id, 'nickname': f'user{user_id}', 'avatar': None} for user_id in user_ids
+    }).start()
+    user_service_client.base_url = stub.url
+
+    try:
+        queries.take()
+        sockets, connect_samples = await connect_all(application, chatrooms, tokens, args.concurrency)
+        connect_queries = queries.take()
+
+        fanout_samples, chat_seconds = await chat(sockets, chatrooms, args.messages)
+        chat_queries = queries.take()
+
+        history_samples, history_seconds = await read_history(
+            application, chatrooms, tokens, args.readers, args.requests_per_reader
+        )
+        history_queries = queries.take()
+
+        await asyncio.gather(*[socket.disconnect() for socket in sockets.values()])
+    finally:
+        await user_service_client.close()
+        await stub.close()
+
+    return {
+        'connect': {
+            **summarize(connect_samples),
+            'queries_per_op': round(connect_queries / max(len(connect_samples), 1), 3),
+        },
+        'fanout': {
+            **summarize(fanout_samples),
+            'messages_per_sec': round(len(fanout_samples) / chat_seconds, 1),
+            'queries_per_op': round(chat_queries / max(len(fanout_samples), 1), 3),
+        },
+        'history': {
+            **summarize(history_samples),
+            'requests_per_sec': round(len(history_samples) / history_seconds, 1),
+            'queries_per_op': round(history_queries / max(len(history_samples), 1), 3),
+        },
+    }
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--rooms', type=int, default=1000, help='two sockets are opened per room')
+    parser.add_argument('--messages', type=int, default=20, help='messages sent per room')
+    parser.add_argument('--readers', type=int, default=200)
+    parser.add_argument('--requests-per-reader', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=500, help='max sockets connecting at once')
+    parser.add_argument('--channel-layer', choices=['memory', 'redis'], default='memory')
+    args = parser.parse_args()
+
+    setup_django(UNTHROTTLED_ENV)
+    from django.test.utils import override_settings
+
+    override_settings(CHANNEL_LAYERS=channel_layers(args.channel_layer)).enable()
+    queries = QueryCounter()
+    queries.install()
+    with test_database():
+        results = asyncio.run(run(args, queries))
+    report('loadtest', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    main()
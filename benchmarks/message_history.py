@@ -0,0 +1,117 @@
+"""Message history page latency with and without the (chatroom, -id) index.
+
+    python -m benchmarks.message_history --messages 2000000 --rooms 2000
+
+Uses the configured database engine (DATABASE_ENGINE=postgresql for
+PostgreSQL, sqlite otherwise) on a throwaway test database.
+"""
+import random
+import time
+from .common import setup_django, test_database, argument_parser, summarize, report
+
+INDEX_NAME = 'message_chatroom_id_idx'
+
+
+def seed(rooms, messages, batch_size):
+    from chat_app.models import ChatRoom, Message
+
+    chatrooms = ChatRoom.objects.bulk_create(
+        ChatRoom(user1_id=i * 2 + 1, user2_id=i * 2 + 2) for i in range(rooms)
+    )
+    batch = []
+    for i in range(messages):
+        chatroom = chatrooms[random.randrange(rooms)]
+        batch.append(Message(
+            chatroom=chatroom,
+            sender_id=random.choice([chatroom.user1_id, chatroom.user2_id]),
+            content=f'message {i} ' + 'x' * random.randrange(10, 200),
+        ))
+        if len(batch) == batch_size:
+            Message.objects.bulk_create(batch)
+            batch = []
+    Message.objects.bulk_create(batch)
+    return chatrooms
+
+
+def page_queries(chatrooms, pages, page_size):
+    from chat_app.models import Message
+
+    cursors = []
+    for _ in range(pages):
+        chatroom = random.choice(chatrooms)
+        last_loaded_message_id = None
+        if random.random() < 0.5:
+            ids = list(Message.objects.filter(chatroom=chatroom).values_list('id', flat=True)[:page_size * 4])
+            if ids:
+                last_loaded_message_id = random.choice(ids) + 1
+        cursors.append((chatroom, last_loaded_message_id))
+    return cursors
+
+
+def run_pages(cursors, page_size, fields):
+    from chat_app.models import Message
+
+    samples = []
+    for chatroom, last_loaded_message_id in cursors:
+        query = Message.objects.filter(chatroom=chatroom)
+        if fields:
+            query = query.only(*fields)
+        if last_loaded_message_id:
+            query = query.filter(id__lt=last_loaded_message_id)
+        start = time.perf_counter()
+        list(query.order_by('-id')[:page_size])
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--rooms', type=int, default=1_000)
+    parser.add_argument('--pages', type=int, default=2_000)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from chat_app.models import Message
+    from chat_app.services import ChatRoomService
+
+    random.seed(42)
+    with test_database():
+        start = time.perf_counter()
+        chatrooms = seed(args.rooms, args.messages, args.batch_size)
+        seed_seconds = time.perf_counter() - start
+        cursors = page_queries(chatrooms, args.pages, args.page_size)
+        index = next(index for index in Message._meta.indexes if index.name == INDEX_NAME)
+
+        with connection.schema_editor() as editor:
+            editor.remove_index(Message, index)
+        if connection.vendor == 'postgresql':
+            connection.cursor().execute('ANALYZE chat_app_message')
+        run_pages(cursors[:100], args.page_size, None)
+        before = run_pages(cursors, args.page_size, None)
+
+        with connection.schema_editor() as editor:
+            editor.add_index(Message, index)
+        if connection.vendor == 'postgresql':
+            connection.cursor().execute('ANALYZE chat_app_message')
+        run_pages(cursors[:100], args.page_size, ChatRoomService.MESSAGE_LIST_FIELDS)
+        after = run_pages(cursors, args.page_size, ChatRoomService.MESSAGE_LIST_FIELDS)
+
+        chatroom, cursor = cursors[0]
+        plan = Message.objects.filter(chatroom=chatroom).only(
+            *ChatRoomService.MESSAGE_LIST_FIELDS
+        ).order_by('-id')[:args.page_size].explain()
+
+        report('message_history', vars(args), {
+            'seed_seconds': round(seed_seconds, 2),
+            'before': summarize(before),
+            'after': summarize(after),
+            'plan_after': plan,
+        }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Per-request overhead of CustomHttpMiddleware token handling.
+
+    python -m benchmarks.middleware_overhead --requests 100000
+
+Compares the old unverified decode, full signature/expiry verification
+on every request, and verification through the token cache.
+"""
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from .common import setup_django, argument_parser, report
+
+
+class UnverifiedDecoder:
+    def verify(self, token):
+        import jwt
+        return jwt.decode(token, options={'verify_signature': False})
+
+
+def measure(middleware, requests, count):
+    start = time.perf_counter()
+    for i in range(count):
+        middleware.process_request(requests[i % len(requests)])
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--requests', type=int, default=100_000)
+    parser.add_argument('--clients', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    import jwt
+    from django.test import RequestFactory
+    from config.middleware import CustomHttpMiddleware
+    from config.settings import JWT_SECRET_KEY
+    from config.tokens import TokenVerifier, token_cache_requests
+
+    factory = RequestFactory()
+    requests = []
+    for user_id in range(args.clients):
+        token = jwt.encode({
+            'user_id': user_id,
+            'exp': datetime.utcnow() + timedelta(hours=1),
+        }, JWT_SECRET_KEY, algorithm='HS256')
+        requests.append(factory.get('/api/chat/rooms/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+
+    middleware = CustomHttpMiddleware(lambda request: None)
+    verifiers = {
+        'unverified_decode': UnverifiedDecoder(),
+        'verified_uncached': TokenVerifier(maxsize=0),
+        'verified_cached': TokenVerifier(),
+    }
+
+    results = {}
+    for name, verifier in verifiers.items():
+        with patch('config.middleware.token_verifier', verifier):
+            measure(middleware, requests, min(1000, args.requests))
+            hits = token_cache_requests.get(result='hit')
+            misses = token_cache_requests.get(result='miss')
+            seconds = measure(middleware, requests, args.requests)
+        hits = token_cache_requests.get(result='hit') - hits
+        misses = token_cache_requests.get(result='miss') - misses
+        results[name] = {
+            'us_per_request': round(seconds * 1e6, 3),
+            'cache_hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+
+    report('middleware_overhead', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Requests/sec and latency of the REST endpoints under concurrent load.
+
+    python -m benchmarks.rest_api --requests 5000 --concurrency 100
+
+Drives config.asgi:application in-process (as daphne would) against a
+throwaway database and a stub user service. Run it on two commits with
+--output to compare sync and async views.
+"""
+import asyncio
+import time
+from .common import setup_django, test_database, argument_parser, summarize, report
+from .loadtest import make_token
+
+
+async def request(application, method, path, token, body=b''):
+    from channels.testing import HttpCommunicator
+
+    headers = [(b'authorization', f'Bearer {token}'.encode()), (b'host', b'localhost')]
+    if body:
+        headers.append((b'content-type', b'application/json'))
+    communicator = HttpCommunicator(application, method, path, body=body, headers=headers)
+    response = await communicator.get_response(timeout=30)
+    await communicator.send_input({'type': 'http.disconnect'})
+    await communicator.wait(timeout=30)
+    return response['status']
+
+
+async def hammer(application, paths, tokens, total, concurrency):
+    samples = []
+    statuses = {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            user_id, path = paths[i % len(paths)]
+            start = time.perf_counter()
+            status = await request(application, 'GET', path, tokens[user_id])
+            samples.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    seconds = time.perf_counter() - start
+    return {
+        **summarize(samples),
+        'requests_per_sec': round(len(samples) / seconds, 1),
+        'statuses': statuses,
+    }
+
+
+async def run(args):
+    from chat_app.models import ChatRoom, Message
+    from chat_app.tests.user_service_stub import UserServiceStub
+    from config.http_client import user_service_client
+    from config.asgi import application
+
+    chatrooms = await ChatRoom.objects.abulk_create(
+        ChatRoom(user1_id=1, user2_id=i + 2) for i in range(args.rooms)
+    )
+    await Message.objects.abulk_create(
+        Message(chatroom=chatroom, sender_id=chatroom.user1_id if i % 2 else chatroom.user2_id, content=f'message {i}')
+        for chatroom in chatrooms
+        for i in range(args.messages)
+    )
+    user_ids = {1} | {chatroom.user2_id for chatroom in chatrooms}
+    tokens = {user_id: make_token(user_id) for user_id in user_ids}
+    stub = await UserServiceStub({
+        user_id: {'id': user_id, 'nickname': f'user{user_id}', 'avatar': None} for user_id in user_ids
+    }).start()
+    user_service_client.base_url = stub.url
+
+    try:
+        results = {
+            'room_list': await hammer(
+                application, [(1, '/api/chat/rooms/')], tokens, args.requests, args.concurrency
+            ),
+            'message_list': await hammer(
+                application,
+                [(chatroom.user2_id, f'/api/chat/{chatroom.id}/messages/') for chatroom in chatrooms],
+                tokens, args.requests, args.concurrency
+            ),
+        }
+    finally:
+        await user_service_client.close()
+        await stub.close()
+    return results
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--requests', type=int, default=5000, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--rooms', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=100, help='messages per room')
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        results = asyncio.run(run(args))
+    report('rest_api', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Message search latency: full-text index vs. content__icontains.
+
+    python -m benchmarks.search --messages 2000000 --users 2000 --rooms 20000
+
+Seeds messages drawn from a Zipf-like vocabulary so search terms range from
+rare to common, then runs the same scoped queries through the full-text
+search (tsvector/GIN on PostgreSQL, FTS5 on sqlite) and through a
+content__icontains scan of the caller's rooms.
+"""
+import random
+import time
+from .common import setup_django, test_database, argument_parser, summarize, report
+
+VOCABULARY_SIZE = 5_000
+
+
+def seed(users, rooms, messages, batch_size):
+    from chat_app.models import ChatRoom, Message
+
+    pairs = set()
+    while len(pairs) < rooms:
+        user1_id, user2_id = sorted(random.sample(range(1, users + 1), 2))
+        pairs.add((user1_id, user2_id))
+    chatrooms = ChatRoom.objects.bulk_create(
+        ChatRoom(user1_id=user1_id, user2_id=user2_id) for user1_id, user2_id in pairs
+    )
+
+    vocabulary = [f'word{i}' for i in range(VOCABULARY_SIZE)]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+    batch = []
+    for _ in range(messages):
+        chatroom = chatrooms[random.randrange(rooms)]
+        batch.append(Message(
+            chatroom=chatroom,
+            sender_id=random.choice([chatroom.user1_id, chatroom.user2_id]),
+            content=' '.join(random.choices(vocabulary, weights, k=random.randrange(3, 20))),
+        ))
+        if len(batch) == batch_size:
+            Message.objects.bulk_create(batch)
+            batch = []
+    Message.objects.bulk_create(batch)
+    return vocabulary
+
+
+def run_icontains(queries, limit):
+    from django.db.models import Q
+    from chat_app.models import Message
+
+    samples = []
+    for user_id, term in queries:
+        query = Message.objects.filter(
+            Q(chatroom__user1_id=user_id) | Q(chatroom__user2_id=user_id), content__icontains=term
+        ).order_by('-id')[:limit]
+        start = time.perf_counter()
+        list(query)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_search(queries, limit):
+    from chat_app.search import MessageSearchService
+
+    samples = []
+    for user_id, term in queries:
+        start = time.perf_counter()
+        MessageSearchService.run_query(user_id, [term], None, limit + 1)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--messages', type=int, default=2_000_000)
+    parser.add_argument('--users', type=int, default=2_000)
+    parser.add_argument('--rooms', type=int, default=20_000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+
+    random.seed(42)
+    with test_database():
+        start = time.perf_counter()
+        vocabulary = seed(args.users, args.rooms, args.messages, args.batch_size)
+        seed_seconds = time.perf_counter() - start
+        if connection.vendor == 'postgresql':
+            connection.cursor().execute('ANALYZE chat_app_message')
+
+        # 빈도별로 나눠 잰다. 흔한 단어는 모든 일치 항목의 관련도를 계산하고, 드문 단어는 icontains가 방 전체를 훑는다
+        term_groups = {
+            'common': vocabulary[:10],
+            'medium': vocabulary[100:110],
+            'rare': vocabulary[-10:],
+        }
+        results = {'seed_seconds': round(seed_seconds, 2)}
+        for group, terms in term_groups.items():
+            queries = [(random.randint(1, args.users), random.choice(terms)) for _ in range(args.queries)]
+            run_search(queries[:50], args.limit)
+            results[group] = {
+                'search': summarize(run_search(queries, args.limit)),
+                'icontains': summarize(run_icontains(queries, args.limit)),
+            }
+
+        report('search', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat_app'
+
+    def ready(self):
+        from config.db_metrics import install_query_observer
+        connection_created.connect(install_query_observer, dispatch_uid='install_query_observer')
@@ -0,0 +1,43 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils.timezone import now
+from config.settings import MESSAGE_ARCHIVE_AFTER_DAYS, MESSAGE_ARCHIVE_BATCH_SIZE
+from config import metrics
+from .models import Message, MessageArchive
+
+archived_messages = metrics.counter('chat_archived_messages_total', 'Messages moved from the hot table to the archive.')
+
+
+def archive_cutoff(days=None):
+    return now() - timedelta(days=MESSAGE_ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+@transaction.atomic
+def archive_batch(cutoff, batch_size=None):
+    # 가장 오래된 메시지부터 batch_size개를 복사하고 지운다. 한 트랜잭션이라 중간에 실패해도 양쪽에 남거나 빠지는 메시지가 없다
+    batch_size = batch_size or MESSAGE_ARCHIVE_BATCH_SIZE
+    messages = list(
+        Message.objects.filter(timestamp__lt=cutoff, chatroom__deleted_at__isnull=True)
+        .only(*MessageArchive.ARCHIVED_FIELDS)
+        .order_by('timestamp')[:batch_size]
+    )
+    if not messages:
+        return 0
+    # 이전 실행이 복사 후 커밋 직전에 끊긴 경우를 대비해 이미 있는 id는 건너뛴다
+    MessageArchive.objects.bulk_create(
+        [MessageArchive.from_message(message) for message in messages], ignore_conflicts=True
+    )
+    Message.objects.filter(id__in=[message.id for message in messages]).delete()
+    archived_messages.inc(len(messages))
+    return len(messages)
+
+
+def archive_messages(cutoff, batch_size=None, max_batches=None):
+    # 배치마다 옮긴 수를 돌려준다. 옮길 메시지가 없거나 max_batches에 닿으면 멈춘다
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            return
+        batches += 1
+        yield moved
@@ -1,6 +1,8 @@
-from enum import Enum
+from enum import IntEnum
 
-class CloseCode(Enum):
+class CloseCode(IntEnum):
     CHATROOM_NOT_FOUND = 3000
     USER_NOT_FOUND = 3001
-    INVALID_USER = 3002
\ No newline at end of file
+    INVALID_USER = 3002
+    SLOW_CONSUMER = 3003
+    CHATROOM_DELETED = 3004
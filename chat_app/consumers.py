@@ -1,100 +1,447 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .models import Message
-import json
+import asyncio
+import time
 from .services import UserService, ChatRoomService
+from .message_writer import MessageQueueFull
 from .close_codes import CloseCode
-from django.utils.timezone import now
+from .protocol import negotiate, encode_chat_message, ProtocolError
+from .presence import PresenceService
+from .rate_limit import TokenBucket, user_rate_limiter
+from .outbound import OutboundQueue
+from .history_cache import history_cache
+from .serializers import MessageSerializer
 from config.services import format_datetime
+from config.db_router import pin_to_primary
+from config.settings import (
+    READ_RECEIPT_WINDOW,
+    PRESENCE_HEARTBEAT_INTERVAL,
+    TYPING_TTL,
+    TYPING_MIN_INTERVAL,
+    CHAT_RATE_PER_CONNECTION,
+    CHAT_BURST_PER_CONNECTION,
+    MESSAGE_WRITE_BEHIND,
+    WS_SEND_DRAIN_TIMEOUT,
+    WS_REPLAY_BATCH_SIZE,
+    WS_REPLAY_MAX_MESSAGES,
+)
+from urllib.parse import parse_qs
+from config import metrics
+
+connect_latency = metrics.histogram('chat_connect_seconds', 'WebSocket connection setup latency by phase.')
+chat_latency = metrics.histogram('chat_message_seconds', 'Chat message handling latency by phase.')
+receive_latency = metrics.histogram('ws_receive_seconds', 'Time spent handling one client frame, by message type.')
+publish_latency = metrics.histogram('channel_layer_publish_seconds', 'Channel layer group_send latency by event type.')
+active_connections = metrics.gauge('ws_active_connections', 'Accepted WebSocket connections open on this worker.')
+replayed_messages = metrics.counter('ws_replayed_messages_total', 'Missed messages re-sent to reconnecting clients.')
+typing_throttled = metrics.counter('chat_typing_throttled_total', 'Typing events dropped by the per-connection rate limit.')
+chat_throttled = metrics.counter('chat_throttled_total', 'Chat messages rejected by the rate limiter, by scope.')
+slow_consumers = metrics.counter('ws_slow_consumer_disconnects_total', 'Connections closed because their send queue overflowed.')
 
 class ChatConsumer(AsyncWebsocketConsumer):    
     async def connect(self):
         self.chatroom_id = self.scope['url_route']['kwargs']['chatroom_id']
         self.chatroom_group_name = f'chat_{self.chatroom_id}'
+        self.user_id = self.scope['user_id']
+        self.protocol = negotiate(self, self.scope.get('subprotocols', []))
+        self.pending_read_id = 0
+        self.read_task = None
+        self.presence_task = None
+        self.last_typing_at = 0
+        self.chat_bucket = TokenBucket(CHAT_RATE_PER_CONNECTION, CHAT_BURST_PER_CONNECTION)
+        self.outbound = OutboundQueue(self.base_send)
+        self.closing = False
+        self.accepted = False
+        # 재전송한 메시지 id. 같은 메시지가 라이브 이벤트로 다시 오면 한 번만 걸러낸다
+        self.replayed_ids = set()
+        # 첫 프레임 전에 라이브로 이미 보낸 메시지 id. 이어서 resume이 오면 재전송에서 뺀다
+        self.live_ids = set()
+        self.resumable = True
+        self.connect_timer = metrics.PhaseTimer(connect_latency)
         
-        self.chatroom = await ChatRoomService.get_chatroom_by_id(self.chatroom_id)
-        if not self.chatroom:
-            await self.close(code=CloseCode.CHATROOM_NOT_FOUND)
+        # 가장 싼 멤버십 검사를 먼저 해서 권한 없는 소켓은 외부 호출 없이 닫는다
+        members = ChatRoomService.get_cached_members(self.chatroom_id)
+        self.connect_timer.mark('membership')
+        if members is not None and self.user_id not in members:
+            await self.reject(CloseCode.INVALID_USER)
             return
         
-        self.user_id = self.scope['user_id']
-        self.user = await UserService.get_user(self.user_id, self.scope['token'])
+        self.chatroom, self.user = await asyncio.gather(
+            ChatRoomService.get_chatroom_by_id(self.chatroom_id),
+            UserService.get_user(self.user_id, self.scope['token'])
+        )
+        self.connect_timer.mark('lookup')
+        if not self.chatroom:
+            await self.reject(CloseCode.CHATROOM_NOT_FOUND)
+            return
+        if not await ChatRoomService.is_user_in_chatroom(self.user_id, self.chatroom):
+            await self.reject(CloseCode.INVALID_USER)
+            return
         if not self.user:
-            await self.close(code=CloseCode.USER_NOT_FOUND)
+            await self.reject(CloseCode.USER_NOT_FOUND)
             return
         self.user_name = self.user.get('nickname')
         self.avatar = self.user.get('avatar')
         
-        if not await ChatRoomService.is_user_in_chatroom(self.user_id, self.chatroom):
-            await self.close(code=CloseCode.INVALID_USER)
-            return
-        
         await self.channel_layer.group_add(
             self.chatroom_group_name,
             self.channel_name
         )
+        self.connect_timer.mark('group_add')
+        
+        await self.accept(subprotocol=self.protocol.subprotocol)
+        self.accepted = True
+        active_connections.inc()
+        self.connect_timer.mark('accept')
+        self.connect_timer.total(outcome='accepted')
+        # 접속 처리 지연에 포함되지 않도록 presence 갱신은 accept 이후 백그라운드에서
+        self.presence_task = asyncio.ensure_future(self.keep_presence())
         
-        await self.accept()
+        since = parse_qs(self.scope.get('query_string', b'').decode()).get('since_message_id')
+        if since:
+            if not since[0].isdigit():
+                self.resumable = False
+                await self.send_error("since_message_id must be a non-negative integer.")
+                return
+            await self.replay(int(since[0]))
+    
+    async def reject(self, code):
+        self.connect_timer.total(outcome=code.name.lower())
+        await self.close(code=code)
         
     async def disconnect(self, close_code):
+        if self.accepted:
+            self.accepted = False
+            active_connections.dec()
+        if self.read_task is not None:
+            self.read_task.cancel()
+            self.read_task = None
+            await self.flush_read()
+        if self.presence_task is not None:
+            self.presence_task.cancel()
+            self.presence_task = None
+            await self.leave_presence()
+        await self.protocol.close()
+        self.outbound.close()
         await self.channel_layer.group_discard(
             self.chatroom_group_name,
             self.channel_name
         )
         
-    async def receive(self, text_data):
-        data = None
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
-        except json.JSONDecodeError:
-            await self.send_error("Invalid JSON format.")
+            data = self.protocol.decode(text_data, bytes_data)
+        except ProtocolError as e:
+            await self.send_error(str(e))
             return
             
         type = data.get('type')
-        if type == 'chat':
+        resumable, self.resumable = self.resumable, False
+        live_ids, self.live_ids = self.live_ids, set()
+        started = time.perf_counter()
+        if type == 'resume':
+            await self.handle_resume(data, resumable, live_ids)
+        elif type == 'chat':
             await self.handle_chat(data)
+        elif type == 'read':
+            await self.handle_read(data)
+        elif type == 'typing':
+            await self.handle_typing(data)
         else:
             await self.send_error("Invalid message type.")
+            type = 'invalid'
+        receive_latency.observe(time.perf_counter() - started, type=type)
+    
+    async def handle_resume(self, data, resumable, live_ids):
+        since_message_id = data.get('since_message_id')
+        if not resumable:
+            await self.send_error("resume must be the first frame.")
+            return
+        if type(since_message_id) is not int or since_message_id < 0:
+            await self.send_error("since_message_id must be a non-negative integer.")
+            return
+        await self.replay(since_message_id, live_ids)
+    
+    async def replay(self, since_message_id, live_ids=()):
+        # group_add 이후에 실행되므로 놓친 메시지는 DB 조회나 라이브 이벤트 중 적어도 한쪽에 있다.
+        # 소비자는 이벤트를 하나씩 처리하므로 재전송하는 동안 도착한 라이브 이벤트는 채널 큐에서 기다렸다가
+        # 재전송이 끝난 뒤 전달되고, 그중 이미 보낸 id는 chat_message에서 걸러진다.
+        # accept와 첫 프레임 사이에 라이브로 이미 보낸 메시지(live_ids)는 재전송하지 않는다.
+        # 커서는 메시지 id라서 id 순서와 커밋 순서가 같다고 가정한다. 다른 워커에서 동시에 저장된 메시지가
+        # 더 큰 id보다 늦게 커밋되면 그 짧은 틈의 메시지는 재전송되지 않을 수 있다
+        self.resumable = False
+        if MESSAGE_WRITE_BEHIND:
+            # id를 받은 뒤 배치로 늦게 커밋하므로 id 커서 뒤에 더 작은 id가 나중에 커밋될 수 있다.
+            # 클라이언트는 REST로 최근 메시지를 다시 받는다
+            await self.protocol.send({
+                "type": "chat.replay",
+                "status": "unavailable",
+                "count": 0,
+                "last_message_id": since_message_id
+            })
+            return
+        # 놓친 메시지는 방금 저장된 것일 수 있으므로 복제본이 아니라 기본 DB에서 읽는다
+        pin_to_primary()
+        # 송신 큐 크기가 0이면 제한 없는 큐다
+        maxsize = self.outbound.queue.maxsize
+        batch_size = min(WS_REPLAY_BATCH_SIZE, maxsize) if maxsize > 0 else WS_REPLAY_BATCH_SIZE
+        cursor = since_message_id
+        sent = 0
+        skipped = 0
+        profiles = None
+        truncated = False
+        while sent < WS_REPLAY_MAX_MESSAGES:
+            limit = min(batch_size, WS_REPLAY_MAX_MESSAGES - sent)
+            messages = await ChatRoomService.get_messages_after(self.chatroom, cursor, limit)
+            if messages and profiles is None:
+                profiles = await self.member_profiles()
+            for message in messages:
+                if message.id in live_ids:
+                    skipped += 1
+                    continue
+                profile = profiles.get(message.sender_id) or {}
+                self.replayed_ids.add(message.id)
+                await self.protocol.send_chat_message(encode_chat_message(
+                    message.id,
+                    message.sender_id,
+                    profile.get('nickname'),
+                    profile.get('avatar'),
+                    message.content,
+                    format_datetime(message.timestamp)
+                ))
+            sent += len(messages)
+            if messages:
+                cursor = messages[-1].id
+            if len(messages) < limit:
+                break
+            # 배치마다 소켓으로 다 나갈 때까지 기다려 송신 큐가 넘치지 않게 한다
+            await self.outbound.drained()
+        else:
+            truncated = bool(await ChatRoomService.get_messages_after(self.chatroom, cursor, 1))
+        
+        replayed_messages.inc(sent - skipped)
+        # 잘렸으면 클라이언트는 last_message_id 이후를 REST로 받는다
+        await self.protocol.send({
+            "type": "chat.replay",
+            "status": "truncated" if truncated else "complete",
+            "count": sent - skipped,
+            "last_message_id": cursor
+        })
+    
+    async def member_profiles(self):
+        partner_id = self.chatroom.get_receiver_id(self.user_id)
+        partner = await UserService.get_user(partner_id, self.scope['token'])
+        return {self.user_id: self.user, partner_id: partner}
     
     async def handle_chat(self, data):
         content = data.get('content')
         if not content:
             await self.send_error("content is required.")
             return
+        
+        timer = metrics.PhaseTimer(chat_latency)
+        # 연결 단위 제한을 먼저 확인해 폭주하는 소켓은 Redis까지 가지 않는다
+        if not self.chat_bucket.allow():
+            chat_throttled.inc(scope='connection')
+            await self.send_error("Rate limit exceeded. Slow down.")
+            return
+        if not await user_rate_limiter.allow(self.user_id):
+            chat_throttled.inc(scope='user')
+            await self.send_error("Rate limit exceeded. Slow down.")
+            return
+        timer.mark('rate_limit')
 
-        message = await Message.objects.acreate(
-            chatroom=self.chatroom,
-            sender_id=self.user_id,
-            content=content
-        )
+        try:
+            message = await ChatRoomService.save_message(self.chatroom, self.user_id, content)
+        except MessageQueueFull:
+            await self.send_error("Server is busy. Try again later.")
+            return
+        timer.mark('save')
 
-        await self.channel_layer.group_send(
-            self.chatroom_group_name,
-            {
-                'type': 'chat.message',
+        await self.group_send(encode_chat_message(
+            message.id,
+            self.user_id,
+            self.user_name,
+            self.avatar,
+            content,
+            format_datetime(message.timestamp)
+        ))
+        timer.mark('publish')
+        if history_cache.enabled:
+            await history_cache.append(self.chatroom_id, MessageSerializer({
+                'id': message.id,
                 'sender': self.user_name,
                 'avatar': self.avatar,
                 'content': content,
-                'timestamp': format_datetime(message.timestamp)
-            }
-        )
+                'timestamp': message.timestamp
+            }).data)
+            timer.mark('cache')
+        
+        # 메시지를 받으면 클라이언트가 입력 표시를 지우므로 별도 이벤트 없이 상태만 정리
+        if self.last_typing_at:
+            self.last_typing_at = 0
+            await PresenceService.stop_typing(self.chatroom_id, self.user_id)
+        
+    async def handle_read(self, data):
+        message_id = data.get('message_id')
+        if type(message_id) is not int or message_id <= 0:
+            await self.send_error("message_id is required.")
+            return
         
-        self.chatroom.updated_at = now()
-        await self.chatroom.asave(update_fields=['updated_at'])
+        # 스크롤하며 연달아 오는 읽음 요청은 짧은 창 안에서 가장 큰 id 하나로 합쳐 저장한다
+        self.pending_read_id = max(self.pending_read_id, message_id)
+        if self.read_task is None:
+            self.read_task = asyncio.ensure_future(self.flush_read_later())
+    
+    async def flush_read_later(self):
+        await asyncio.sleep(READ_RECEIPT_WINDOW)
+        self.read_task = None
+        await self.flush_read()
+    
+    async def flush_read(self):
+        message_id, self.pending_read_id = self.pending_read_id, 0
+        if not message_id:
+            return
+        last_read_id = await ChatRoomService.mark_read(self.chatroom.id, self.user_id, message_id)
+        if last_read_id is None:
+            return
+        await self.group_send({
+            'type': 'chat.read',
+            'user_id': self.user_id,
+            'message_id': last_read_id
+        })
+        
+    async def handle_typing(self, data):
+        is_typing = data.get('is_typing', True)
+        if not isinstance(is_typing, bool):
+            await self.send_error("is_typing must be a boolean.")
+            return
+        
+        if not is_typing:
+            self.last_typing_at = 0
+            if await PresenceService.stop_typing(self.chatroom_id, self.user_id):
+                await self.send_typing(False)
+            return
+        
+        # 키 입력마다 오는 이벤트는 연결 단위로 먼저 걸러 Redis 호출도 줄인다
+        now = time.monotonic()
+        if now - self.last_typing_at < TYPING_MIN_INTERVAL:
+            typing_throttled.inc()
+            return
+        self.last_typing_at = now
+        if await PresenceService.start_typing(self.chatroom_id, self.user_id):
+            await self.send_typing(True)
+    
+    async def send_typing(self, is_typing):
+        await self.group_send({
+            'type': 'chat.typing',
+            'user_id': self.user_id,
+            'is_typing': is_typing
+        })
+    
+    async def keep_presence(self):
+        if await PresenceService.connect(self.user_id, self.chatroom_id, self.channel_name):
+            await self.send_presence('online', None)
+        while True:
+            await asyncio.sleep(PRESENCE_HEARTBEAT_INTERVAL)
+            await PresenceService.refresh(self.user_id, self.chatroom_id, self.channel_name)
+    
+    async def leave_presence(self):
+        await PresenceService.stop_typing(self.chatroom_id, self.user_id)
+        last_seen = await PresenceService.disconnect(self.user_id, self.chatroom_id, self.channel_name)
+        if last_seen is not None:
+            await self.send_presence('offline', last_seen)
+    
+    async def send_presence(self, status, last_seen):
+        await self.group_send({
+            'type': 'chat.presence',
+            'user_id': self.user_id,
+            'status': status,
+            'last_seen': last_seen
+        })
+        
+    async def group_send(self, event):
+        with publish_latency.time(type=event['type']):
+            await self.channel_layer.group_send(self.chatroom_group_name, event)
         
     async def chat_message(self, event):
-        await self.send_json({
-            "type": "chat.message",
-            "sender": event.get("sender"),
-            "avatar": event.get("avatar"),
-            "content": event.get("content"),
-            "timestamp": event.get("timestamp")
+        if self.replayed_ids and event.get('id') in self.replayed_ids:
+            self.replayed_ids.discard(event['id'])
+            return
+        await self.protocol.send_chat_message(event)
+        if self.resumable:
+            self.live_ids.add(event.get('id'))
+        
+    async def chat_read(self, event):
+        await self.protocol.send({
+            "type": "chat.read",
+            "user_id": event.get("user_id"),
+            "message_id": event.get("message_id")
+        })
+        
+    async def chat_typing(self, event):
+        if event.get("user_id") == self.user_id:
+            return
+        await self.protocol.send({
+            "type": "chat.typing",
+            "user_id": event.get("user_id"),
+            "is_typing": event.get("is_typing"),
+            "expires_in": TYPING_TTL
+        })
+        
+    async def chat_presence(self, event):
+        if event.get("user_id") == self.user_id:
+            return
+        await self.protocol.send({
+            "type": "chat.presence",
+            "user_id": event.get("user_id"),
+            "status": event.get("status"),
+            "last_seen": event.get("last_seen")
         })
         
-    async def send_json(self, content):
-        await self.send(text_data=json.dumps(content))
+    async def chat_deleted(self, event):
+        # 방이 삭제되면 알린 뒤 닫는다. 알림이 먼저 나가도록 보내기 큐가 빌 때까지 기다리되,
+        # 읽지 않는 클라이언트 때문에 닫기가 막히지 않게 WS_SEND_DRAIN_TIMEOUT까지만 기다린다
+        ChatRoomService.forget_chatroom(self.chatroom_id)
+        await self.protocol.send({
+            "type": "chat.deleted",
+            "chatroom_id": event.get("chatroom_id")
+        })
+        await self.protocol.flush()
+        try:
+            await asyncio.wait_for(self.outbound.drained(), WS_SEND_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        await self.close(code=CloseCode.CHATROOM_DELETED)
+        
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if self.closing:
+            return
+        if text_data is not None:
+            message = {"type": "websocket.send", "text": text_data}
+        elif bytes_data is not None:
+            message = {"type": "websocket.send", "bytes": bytes_data}
+        else:
+            raise ValueError("You must pass one of bytes_data or text_data")
+        
+        if not self.outbound.put(message):
+            # 보내지 못한 프레임이 쌓인 클라이언트는 일부만 받는 대신 끊고 재접속하게 한다
+            await self.close_slow_consumer()
+            return
+        if close:
+            # 앞서 넣은 프레임이 먼저 나가도록 종료도 큐를 거친다
+            message = {"type": "websocket.close"}
+            if close is not True:
+                message["code"] = close
+            self.outbound.put(message)
+        
+    async def close_slow_consumer(self):
+        self.closing = True
+        slow_consumers.inc()
+        self.outbound.close()
+        await self.close(code=CloseCode.SLOW_CONSUMER)
         
     async def send_error(self, message):
-        await self.send_json({
+        await self.protocol.send({
             "type": "error",
             "message": message
         })
\ No newline at end of file
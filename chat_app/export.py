@@ -0,0 +1,53 @@
+import zlib
+from config.settings import EXPORT_CHUNK_SIZE, MESSAGE_ARCHIVE
+from config import json_codec, metrics
+from .models import Message, MessageArchive
+
+EXPORT_FIELDS = ('id', 'sender_id', 'content', 'timestamp', 'is_read')
+
+exported_messages = metrics.counter('chat_export_messages_total', 'Messages written by the history export endpoint.')
+
+
+async def export_messages(chatroom, profiles, chunk_size=None):
+    # 메시지를 chunk_size개씩 읽어 NDJSON 덩어리로 내보낸다. 메모리는 방 크기와 무관하게 한 덩어리분만 쓴다
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    lines = []
+    async for message in iterate_messages(chatroom, chunk_size):
+        profile = profiles.get(message.sender_id) or {}
+        lines.append(json_codec.dumps({
+            "id": message.id,
+            "sender_id": message.sender_id,
+            "sender": profile.get('nickname'),
+            "avatar": profile.get('avatar'),
+            "content": message.content,
+            "timestamp": message.timestamp.isoformat(),
+            "is_read": message.is_read
+        }))
+        if len(lines) >= chunk_size:
+            yield flush_lines(lines)
+            lines = []
+    if lines:
+        yield flush_lines(lines)
+
+
+async def iterate_messages(chatroom, chunk_size):
+    # 보관된 메시지가 항상 더 오래되었으므로 보관 테이블을 먼저 읽으면 id 순서가 유지된다
+    models = (MessageArchive, Message) if MESSAGE_ARCHIVE else (Message,)
+    for model in models:
+        query = model.objects.filter(chatroom=chatroom).only(*EXPORT_FIELDS).order_by('id')
+        async for message in query.aiterator(chunk_size=chunk_size):
+            yield message
+
+
+def flush_lines(lines):
+    exported_messages.inc(len(lines))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+async def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,97 @@
+from redis.exceptions import RedisError
+from config.settings import HISTORY_CACHE, HISTORY_CACHE_SIZE, HISTORY_CACHE_TTL
+from config.redis_client import get_redis
+from config import json_codec, metrics
+
+history_requests = metrics.counter('history_cache_requests_total', 'First-page history lookups by result.')
+history_errors = metrics.counter('history_cache_redis_errors_total', 'Redis errors in the message history cache.')
+
+
+class HistoryCache:
+    # 채팅방별 최신 메시지를 직렬화된 응답 형태로 최신순 리스트에 보관한다.
+    # head 키는 마지막으로 추가된 메시지 id로, 채우는 도중 추가된 메시지를 놓친 리스트를 걸러낸다
+    KEY_PREFIX = 'chat:history:'
+
+    def __init__(self, size=HISTORY_CACHE_SIZE, ttl=HISTORY_CACHE_TTL, enabled=HISTORY_CACHE):
+        self.size = size
+        self.ttl = ttl
+        self.enabled = enabled
+
+    def keys(self, chatroom_id):
+        return f'{self.KEY_PREFIX}{chatroom_id}', f'{self.KEY_PREFIX}{chatroom_id}:head'
+
+    def can_serve(self, limit):
+        return self.enabled and 0 < limit <= self.size
+
+    async def get_page(self, chatroom_id, limit):
+        # 오래된 순 메시지 목록, 캐시를 쓸 수 없으면 None
+        if not self.can_serve(limit):
+            history_requests.inc(result='bypass')
+            return None
+        key, head_key = self.keys(chatroom_id)
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                pipe.lrange(key, 0, limit - 1)
+                pipe.get(head_key)
+                raws, head = await pipe.execute()
+        except RedisError:
+            history_errors.inc()
+            history_requests.inc(result='error')
+            return None
+
+        if not raws:
+            history_requests.inc(result='miss')
+            return None
+        messages = [json_codec.loads(raw) for raw in raws]
+        if head is not None and messages[0]['id'] < int(head):
+            history_requests.inc(result='stale')
+            return None
+        history_requests.inc(result='hit')
+        messages.reverse()
+        return messages
+
+    async def fill(self, chatroom_id, messages):
+        # messages는 오래된 순으로 정렬된 채팅방의 최신 메시지 (최대 size개)
+        if not self.enabled or not messages:
+            return
+        key, _ = self.keys(chatroom_id)
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.rpush(key, *[json_codec.dumps(message) for message in reversed(messages[-self.size:])])
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except RedisError:
+            history_errors.inc()
+
+    async def append(self, chatroom_id, message):
+        if not self.enabled:
+            return
+        key, head_key = self.keys(chatroom_id)
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                # 리스트가 없으면 만들지 않는다. 일부만 담긴 리스트가 첫 페이지로 쓰이지 않도록
+                pipe.lpushx(key, json_codec.dumps(message))
+                pipe.ltrim(key, 0, self.size - 1)
+                pipe.expire(key, self.ttl)
+                pipe.set(head_key, message['id'], ex=self.ttl)
+                await pipe.execute()
+        except RedisError:
+            history_errors.inc()
+            await self.invalidate(chatroom_id)
+
+    async def invalidate(self, chatroom_id):
+        if not self.enabled:
+            return
+        try:
+            await get_redis().delete(*self.keys(chatroom_id))
+        except RedisError:
+            history_errors.inc()
+
+    def hit_rate(self):
+        hits = history_requests.get(result='hit')
+        total = sum(history_requests.samples().values())
+        return hits / total if total else 0.0
+
+
+history_cache = HistoryCache()
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from config.settings import MESSAGE_ARCHIVE, MESSAGE_ARCHIVE_AFTER_DAYS, MESSAGE_ARCHIVE_BATCH_SIZE
+from chat_app.archive import archive_cutoff, archive_messages
+
+
+class Command(BaseCommand):
+    help = 'Move messages older than the archive age from the message table to the archive table in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=MESSAGE_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=MESSAGE_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None, help='stop after this many batches')
+        parser.add_argument('--sleep', type=float, default=0, help='seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        # 조회는 MESSAGE_ARCHIVE가 켜져 있을 때만 보관 테이블을 읽으므로, 꺼진 채로 옮기면 기록이 사라진 것처럼 보인다
+        if not MESSAGE_ARCHIVE:
+            raise CommandError('MESSAGE_ARCHIVE is disabled; enable it before archiving messages.')
+        cutoff = archive_cutoff(options['older_than_days'])
+        total = 0
+        for moved in archive_messages(cutoff, options['batch_size'], options['max_batches']):
+            total += moved
+            self.stdout.write(f'archived {moved} messages ({total} total)')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'archived {total} messages older than {cutoff.isoformat()}'))
@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from config.settings import CHATROOM_PURGE_BATCH_SIZE, CHATROOM_PURGE_GRACE_SECONDS
+from chat_app.purge import purge_cutoff, deleted_chatroom_ids, purge_chatroom
+
+
+class Command(BaseCommand):
+    help = 'Remove the messages of deleted chat rooms in batches, then the rooms themselves.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-seconds', type=int, default=CHATROOM_PURGE_GRACE_SECONDS,
+                            help='only purge rooms deleted at least this long ago')
+        parser.add_argument('--batch-size', type=int, default=CHATROOM_PURGE_BATCH_SIZE)
+        parser.add_argument('--max-rooms', type=int, default=None, help='stop after this many rooms')
+        parser.add_argument('--sleep', type=float, default=0, help='seconds to pause between batches')
+        parser.add_argument('--watch', type=float, default=None,
+                            help='keep running and look for newly deleted rooms every this many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            self.purge(options)
+            if options['watch'] is None:
+                return
+            time.sleep(options['watch'])
+
+    def purge(self, options):
+        chatroom_ids = deleted_chatroom_ids(purge_cutoff(options['grace_seconds']))[:options['max_rooms']]
+        if not chatroom_ids:
+            return
+        self.stdout.write(f'{len(chatroom_ids)} deleted chat rooms to purge')
+        total = 0
+        for done, chatroom_id in enumerate(chatroom_ids, 1):
+            purged = 0
+            for deleted in purge_chatroom(chatroom_id, options['batch_size']):
+                purged += deleted
+                self.stdout.write(f'chatroom {chatroom_id}: purged {deleted} messages ({purged} so far)')
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+            total += purged
+            self.stdout.write(f'chatroom {chatroom_id} removed with {purged} messages ({done}/{len(chatroom_ids)})')
+        self.stdout.write(self.style.SUCCESS(f'purged {len(chatroom_ids)} chat rooms and {total} messages'))
@@ -0,0 +1,239 @@
+import asyncio
+import atexit
+import logging
+import threading
+from collections import Counter, deque
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction, DatabaseError, IntegrityError
+from django.db.models import F, Max, Q
+from django.utils.timezone import now
+from config.settings import (
+    MESSAGE_BATCH_SIZE,
+    MESSAGE_BATCH_INTERVAL,
+    MESSAGE_QUEUE_SIZE,
+    MESSAGE_ENQUEUE_TIMEOUT,
+    MESSAGE_FLUSH_RETRIES,
+    MESSAGE_ID_BLOCK_SIZE,
+)
+from config.loop_local import LoopLocal
+from config import metrics
+from .models import ChatRoom, Message
+
+logger = logging.getLogger(__name__)
+
+messages_queued = metrics.counter('message_writer_queued_total', 'Messages accepted by the write-behind queue.')
+messages_rejected = metrics.counter('message_writer_rejected_total', 'Messages rejected because the write queue was full.')
+messages_flushed = metrics.counter('message_writer_flushed_total', 'Messages committed by the write-behind writer.')
+messages_dropped = metrics.counter('message_writer_dropped_total', 'Messages dropped after exhausting flush retries.')
+batches_flushed = metrics.counter('message_writer_batches_total', 'Batches committed by the write-behind writer.')
+flush_errors = metrics.counter('message_writer_errors_total', 'Failed batch flush attempts.')
+
+
+class MessageQueueFull(Exception):
+    pass
+
+
+class MessageIdAllocator:
+    # INSERT 전에 메시지 id를 미리 받아 둔다. 기본은 메시지마다 nextval 한 번이라 여러 워커에서도 id가 전송 순서를 따른다
+    def __init__(self, block_size=MESSAGE_ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self._ids = deque()
+        self._next_local_id = None
+        self._lock = threading.Lock()
+
+    async def allocate(self):
+        try:
+            return self._ids.popleft()
+        except IndexError:
+            await sync_to_async(self._reserve_block)()
+            return self._ids.popleft()
+
+    def _reserve_block(self):
+        with self._lock:
+            if len(self._ids) >= self.block_size:
+                return
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                        [Message._meta.db_table, self.block_size]
+                    )
+                    self._ids.extend(row[0] for row in cursor.fetchall())
+                return
+            # sqlite 등 시퀀스가 없는 DB는 단일 프로세스 개발 환경에서만 쓰므로 프로세스 내 카운터로 대체
+            if self._next_local_id is None:
+                self._next_local_id = (Message.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+            start = self._next_local_id
+            self._next_local_id += self.block_size
+            self._ids.extend(range(start, self._next_local_id))
+
+
+class MessageBatch:
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(queue_size)
+        # 큐에서 꺼냈지만 아직 커밋되지 않은 메시지
+        self.in_flight = []
+        self.worker = None
+
+    def drain(self):
+        pending = list(self.in_flight)
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        return pending
+
+
+class MessageWriter:
+    def __init__(
+        self,
+        batch_size=MESSAGE_BATCH_SIZE,
+        interval=MESSAGE_BATCH_INTERVAL,
+        queue_size=MESSAGE_QUEUE_SIZE,
+        enqueue_timeout=MESSAGE_ENQUEUE_TIMEOUT,
+        flush_retries=MESSAGE_FLUSH_RETRIES,
+    ):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue_size = queue_size
+        self.enqueue_timeout = enqueue_timeout
+        self.flush_retries = flush_retries
+        self.allocator = MessageIdAllocator()
+        self._batches = LoopLocal(self._start)
+        self._running = []
+        self._atexit_registered = False
+
+    def _start(self):
+        batch = MessageBatch(self.queue_size)
+        batch.worker = asyncio.ensure_future(self._run(batch))
+        self._running.append(batch)
+        if not self._atexit_registered:
+            atexit.register(self.flush_on_exit)
+            self._atexit_registered = True
+        return batch
+
+    async def submit(self, chatroom, sender_id, content):
+        message = Message(
+            id=await self.allocator.allocate(),
+            chatroom=chatroom,
+            sender_id=sender_id,
+            content=content,
+            timestamp=now(),
+        )
+        try:
+            await asyncio.wait_for(self._batches.get().queue.put(message), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            messages_rejected.inc()
+            raise MessageQueueFull()
+        messages_queued.inc()
+        return message
+
+    async def flush(self):
+        await self._batches.get().queue.join()
+
+    async def close(self):
+        batch = self._batches.pop()
+        if batch is None:
+            return
+        await batch.queue.join()
+        batch.worker.cancel()
+        self._running.remove(batch)
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        queue = batch.queue
+        while True:
+            messages = [await queue.get()]
+            deadline = loop.time() + self.interval
+            while len(messages) < self.batch_size:
+                try:
+                    messages.append(queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    messages.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            batch.in_flight = messages
+            try:
+                await self._flush(messages)
+            finally:
+                batch.in_flight = []
+                for _ in messages:
+                    queue.task_done()
+
+    async def _flush(self, messages):
+        for attempt in range(self.flush_retries + 1):
+            try:
+                await sync_to_async(self.write)(messages)
+                return
+            except IntegrityError:
+                flush_errors.inc()
+                if len(messages) > 1:
+                    # 한 행(예: 정리된 방의 메시지) 때문에 다른 방의 메시지까지 버리지 않도록 하나씩 다시 쓴다
+                    for message in messages:
+                        await self._flush([message])
+                    return
+                logger.exception('Failed to write message %s', messages[0].id)
+                break
+            except Exception:
+                flush_errors.inc()
+                logger.exception('Failed to flush %d messages (attempt %d)', len(messages), attempt + 1)
+                if attempt < self.flush_retries:
+                    await asyncio.sleep(min(0.1 * (2 ** attempt), 5))
+        messages_dropped.inc(len(messages))
+
+    @staticmethod
+    @transaction.atomic
+    def write(messages):
+        # id가 미리 정해져 있으므로 재시도나 종료 시 다시 쓰는 메시지 중 이미 커밋된 것은 건너뛴다.
+        # 안 읽은 수도 새로 저장한 메시지만큼만 늘린다
+        existing = set(Message.objects.filter(id__in=[message.id for message in messages]).values_list('id', flat=True))
+        messages = [message for message in messages if message.id not in existing]
+        if not messages:
+            return
+        Message.objects.bulk_create(messages, ignore_conflicts=True)
+
+        latest = {}
+        unread = Counter()
+        for message in messages:
+            current = latest.get(message.chatroom_id)
+            if current is None or message.id > current.id:
+                latest[message.chatroom_id] = message
+            unread[message.chatroom_id, message.chatroom.receiver_unread_field(message.sender_id)] += 1
+        for chatroom_id, message in latest.items():
+            # 다른 워커가 이미 더 최신 메시지를 반영했다면 덮어쓰지 않는다
+            ChatRoom.objects.filter(
+                Q(last_message_id__isnull=True) | Q(last_message_id__lt=message.id),
+                id=chatroom_id,
+            ).update(**ChatRoom.last_message_fields(message))
+        for (chatroom_id, unread_field), count in unread.items():
+            ChatRoom.objects.filter(id=chatroom_id).update(**{unread_field: F(unread_field) + count})
+
+        messages_flushed.inc(len(messages))
+        batches_flushed.inc()
+
+    def flush_on_exit(self):
+        # 이벤트 루프가 멈춘 뒤 남은 메시지를 동기적으로 저장
+        pending = [message for batch in self._running for message in batch.drain()]
+        if not pending:
+            return
+        try:
+            self.write(pending)
+        except IntegrityError:
+            # 실패한 행만 버린다
+            for message in pending:
+                try:
+                    self.write([message])
+                except DatabaseError:
+                    messages_dropped.inc()
+                    logger.exception('Failed to write message %s on shutdown', message.id)
+        except DatabaseError:
+            messages_dropped.inc(len(pending))
+            logger.exception('Failed to flush %d messages on shutdown', len(pending))
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-19 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_app', '0003_chatroom_last_message_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['user1_id', '-updated_at', '-id'], name='chatroom_user1_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['user2_id', '-updated_at', '-id'], name='chatroom_user2_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chatroom', 'is_read'], name='message_chatroom_unread_idx'),
+        ),
+    ]
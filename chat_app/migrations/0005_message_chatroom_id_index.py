@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-19 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_app', '0004_chatroom_inbox_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chatroom', '-id'], name='message_chatroom_id_idx'),
+        ),
+    ]
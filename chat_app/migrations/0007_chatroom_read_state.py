@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-19 03:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counts(apps, schema_editor):
+    ChatRoom = apps.get_model('chat_app', 'ChatRoom')
+    Message = apps.get_model('chat_app', 'Message')
+
+    def unread_from(sender_field):
+        unread = Message.objects.filter(
+            chatroom=OuterRef('pk'), is_read=False, sender_id=OuterRef(sender_field)
+        ).order_by().values('chatroom').annotate(count=Count('id')).values('count')
+        return Coalesce(Subquery(unread), Value(0))
+
+    ChatRoom.objects.update(
+        user1_unread_count=unread_from('user2_id'),
+        user2_unread_count=unread_from('user1_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_app', '0006_message_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='user1_last_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user1_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user2_last_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user2_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# 검색 색인은 ORM 모델에 없는 DB 전용 객체라서 엔진별 SQL로 만든다.
+# postgresql: content에서 생성되는 tsvector 컬럼과 GIN 인덱스 (한국어 사전이 없으므로 'simple' 설정)
+# sqlite: content를 외부 콘텐츠로 쓰는 FTS5 테이블과 동기화 트리거.
+# sqlite에서 chat_app_message 테이블을 다시 만드는 마이그레이션(필드 변경 등)은 트리거를 지우므로 이 SQL을 다시 실행해야 한다
+FORWARD = {
+    'postgresql': [
+        """
+        ALTER TABLE chat_app_message
+        ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED
+        """,
+        'CREATE INDEX message_search_vector_idx ON chat_app_message USING GIN (search_vector)',
+    ],
+    'sqlite': [
+        """
+        CREATE VIRTUAL TABLE chat_app_message_fts USING fts5(
+            content, content='chat_app_message', content_rowid='id'
+        )
+        """,
+        """
+        CREATE TRIGGER chat_app_message_fts_insert AFTER INSERT ON chat_app_message BEGIN
+            INSERT INTO chat_app_message_fts(rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER chat_app_message_fts_delete AFTER DELETE ON chat_app_message BEGIN
+            INSERT INTO chat_app_message_fts(chat_app_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER chat_app_message_fts_update AFTER UPDATE OF content ON chat_app_message BEGIN
+            INSERT INTO chat_app_message_fts(chat_app_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO chat_app_message_fts(rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        "INSERT INTO chat_app_message_fts(chat_app_message_fts) VALUES ('rebuild')",
+    ],
+}
+
+BACKWARD = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS message_search_vector_idx',
+        'ALTER TABLE chat_app_message DROP COLUMN IF EXISTS search_vector',
+    ],
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS chat_app_message_fts_insert',
+        'DROP TRIGGER IF EXISTS chat_app_message_fts_delete',
+        'DROP TRIGGER IF EXISTS chat_app_message_fts_update',
+        'DROP TABLE IF EXISTS chat_app_message_fts',
+    ],
+}
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_app', '0008_message_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(FORWARD), run_statements(BACKWARD)),
+    ]
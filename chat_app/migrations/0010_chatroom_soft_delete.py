@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_app', '0009_message_search'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='chatroom',
+            name='unique_chatroom_pair',
+        ),
+        migrations.RemoveConstraint(
+            model_name='chatroom',
+            name='unique_chatroom_pair_reverse',
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='chatroom_deleted_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='chatroom',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('user1_id', 'user2_id'), name='unique_chatroom_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='chatroom',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('user2_id', 'user1_id'), name='unique_chatroom_pair_reverse'),
+        ),
+    ]
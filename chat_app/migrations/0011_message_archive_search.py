@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# 0009_message_search와 같은 검색 색인을 보관 테이블에도 만든다. 옮겨진 메시지도 검색되도록
+FORWARD = {
+    'postgresql': [
+        """
+        ALTER TABLE chat_app_messagearchive
+        ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED
+        """,
+        'CREATE INDEX message_archive_search_vector_idx ON chat_app_messagearchive USING GIN (search_vector)',
+    ],
+    'sqlite': [
+        """
+        CREATE VIRTUAL TABLE chat_app_messagearchive_fts USING fts5(
+            content, content='chat_app_messagearchive', content_rowid='id'
+        )
+        """,
+        """
+        CREATE TRIGGER chat_app_messagearchive_fts_insert AFTER INSERT ON chat_app_messagearchive BEGIN
+            INSERT INTO chat_app_messagearchive_fts(rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER chat_app_messagearchive_fts_delete AFTER DELETE ON chat_app_messagearchive BEGIN
+            INSERT INTO chat_app_messagearchive_fts(chat_app_messagearchive_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER chat_app_messagearchive_fts_update AFTER UPDATE OF content ON chat_app_messagearchive BEGIN
+            INSERT INTO chat_app_messagearchive_fts(chat_app_messagearchive_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO chat_app_messagearchive_fts(rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        "INSERT INTO chat_app_messagearchive_fts(chat_app_messagearchive_fts) VALUES ('rebuild')",
+    ],
+}
+
+BACKWARD = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS message_archive_search_vector_idx',
+        'ALTER TABLE chat_app_messagearchive DROP COLUMN IF EXISTS search_vector',
+    ],
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS chat_app_messagearchive_fts_insert',
+        'DROP TRIGGER IF EXISTS chat_app_messagearchive_fts_delete',
+        'DROP TRIGGER IF EXISTS chat_app_messagearchive_fts_update',
+        'DROP TABLE IF EXISTS chat_app_messagearchive_fts',
+    ],
+}
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_app', '0010_chatroom_soft_delete'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(FORWARD), run_statements(BACKWARD)),
+    ]
@@ -1,26 +1,55 @@
 from django.db import models
+from django.utils.timezone import now
+
+LAST_MESSAGE_PREVIEW_LENGTH = 100
+
+
+class ActiveChatRoomManager(models.Manager):
+    # 삭제 표시된 방은 메시지가 정리될 때까지 행이 남지만 일반 조회에는 나오지 않는다
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class ChatRoom(models.Model):
     user1_id = models.BigIntegerField()
     user2_id = models.BigIntegerField()
     updated_at = models.DateTimeField(auto_now=True)
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=LAST_MESSAGE_PREVIEW_LENGTH, blank=True, default='')
+    last_message_sender_id = models.BigIntegerField(null=True, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # 사용자별 마지막으로 읽은 메시지 id와 그 이후 상대가 보낸 메시지 수
+    user1_last_read_id = models.BigIntegerField(default=0)
+    user2_last_read_id = models.BigIntegerField(default=0)
+    user1_unread_count = models.PositiveIntegerField(default=0)
+    user2_unread_count = models.PositiveIntegerField(default=0)
+    # 삭제 요청 시각. purge_chatrooms 명령이 메시지를 배치로 지운 뒤 행을 지운다
+    deleted_at = models.DateTimeField(null=True, blank=True)
     
-    @property
-    def last_message(self):
-        return self.message_set.order_by('-timestamp').first()
+    objects = ActiveChatRoomManager()
+    all_objects = models.Manager()
     
     class Meta:
+        # 같은 두 사용자는 이전 방이 정리되기 전에도 새 방을 만들 수 있다
         constraints = [
             models.UniqueConstraint(
                 fields=['user1_id', 'user2_id'],
+                condition=models.Q(deleted_at__isnull=True),
                 name='unique_chatroom_pair',
             ),
             models.UniqueConstraint(
                 fields=['user2_id', 'user1_id'],
+                condition=models.Q(deleted_at__isnull=True),
                 name='unique_chatroom_pair_reverse'
             ),
         ]
+        indexes = [
+            models.Index(fields=['user1_id', '-updated_at', '-id'], name='chatroom_user1_updated_idx'),
+            models.Index(fields=['user2_id', '-updated_at', '-id'], name='chatroom_user2_updated_idx'),
+            models.Index(
+                fields=['deleted_at'], condition=models.Q(deleted_at__isnull=False), name='chatroom_deleted_idx'
+            ),
+        ]
     
     def save(self, *args, **kwargs):
         if self.user1_id > self.user2_id:
@@ -32,12 +61,32 @@ class ChatRoom(models.Model):
         if self.user1_id == sender_id:
             return self.user2_id
         return self.user1_id
+    
+    def read_fields(self, user_id):
+        member = 'user1' if self.user1_id == user_id else 'user2'
+        return f'{member}_last_read_id', f'{member}_unread_count'
+    
+    def unread_count_for(self, user_id):
+        return getattr(self, self.read_fields(user_id)[1])
+    
+    def receiver_unread_field(self, sender_id):
+        return self.read_fields(self.get_receiver_id(sender_id))[1]
+    
+    @staticmethod
+    def last_message_fields(message):
+        return {
+            'last_message_id': message.id,
+            'last_message_preview': message.content[:LAST_MESSAGE_PREVIEW_LENGTH],
+            'last_message_sender_id': message.sender_id,
+            'last_message_at': message.timestamp,
+            'updated_at': message.timestamp,
+        }
 
 class Message(models.Model):
     chatroom = models.ForeignKey(ChatRoom, on_delete=models.CASCADE)
     sender_id = models.BigIntegerField()
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=now, editable=False)
     is_read = models.BooleanField(default=False)
     
     @property
@@ -47,4 +96,26 @@ class Message(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['timestamp']),
-        ]
\ No newline at end of file
+            models.Index(fields=['chatroom', 'is_read'], name='message_chatroom_unread_idx'),
+            models.Index(fields=['chatroom', '-id'], name='message_chatroom_id_idx'),
+        ]
+
+class MessageArchive(models.Model):
+    # MESSAGE_ARCHIVE가 켜져 있을 때 오래된 메시지를 옮겨 두는 테이블. id는 Message의 id를 그대로 쓴다
+    id = models.BigIntegerField(primary_key=True)
+    chatroom = models.ForeignKey(ChatRoom, on_delete=models.CASCADE)
+    sender_id = models.BigIntegerField()
+    content = models.TextField()
+    timestamp = models.DateTimeField()
+    is_read = models.BooleanField(default=False)
+    
+    ARCHIVED_FIELDS = ('id', 'chatroom_id', 'sender_id', 'content', 'timestamp', 'is_read')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['chatroom', '-id'], name='archive_chatroom_id_idx'),
+        ]
+    
+    @classmethod
+    def from_message(cls, message):
+        return cls(**{field: getattr(message, field) for field in cls.ARCHIVED_FIELDS})
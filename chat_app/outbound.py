@@ -0,0 +1,56 @@
+import asyncio
+from config.settings import WS_SEND_QUEUE_SIZE
+from config import metrics
+
+outbound_queued = metrics.counter('ws_outbound_queued_total', 'Frames queued for delivery to WebSocket clients.')
+outbound_dropped = metrics.counter('ws_outbound_dropped_total', 'Frames dropped because the client send queue was full.')
+outbound_depth = metrics.histogram(
+    'ws_outbound_queue_depth', 'Client send queue depth observed when a frame is queued.',
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+)
+
+
+class OutboundQueue:
+    # 소켓 쓰기를 채널 레이어 수신과 분리해 느린 클라이언트 때문에 채널 큐가 차지 않게 한다
+    def __init__(self, send, maxsize=WS_SEND_QUEUE_SIZE):
+        self.send = send
+        self.queue = asyncio.Queue(maxsize)
+        self.task = None
+
+    def put(self, message):
+        # 큐가 가득 차면 False. 호출한 쪽이 연결을 정리한다
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+        outbound_depth.observe(self.queue.qsize())
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            outbound_dropped.inc()
+            return False
+        outbound_queued.inc()
+        return True
+
+    async def _run(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await self.send(message)
+            finally:
+                self.queue.task_done()
+    
+    async def drained(self):
+        # 대량으로 보내는 쪽이 큐를 넘기지 않도록 쌓인 프레임이 다 나갈 때까지 기다린다
+        await self.queue.join()
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        dropped = self.queue.qsize()
+        if dropped:
+            outbound_dropped.inc(dropped)
+        # drained()에서 기다리는 쪽이 풀리도록 남은 프레임을 처리된 것으로 표시한다
+        for _ in range(dropped):
+            self.queue.get_nowait()
+            self.queue.task_done()
+        self.queue = asyncio.Queue(self.queue.maxsize)
@@ -0,0 +1,30 @@
+import base64
+from rest_framework.exceptions import ValidationError
+
+CURSOR_SEPARATOR = '|'
+
+
+def encode_cursor(*values):
+    raw = CURSOR_SEPARATOR.join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, *parsers):
+    try:
+        values = base64.urlsafe_b64decode(cursor.encode()).decode().split(CURSOR_SEPARATOR)
+        if len(values) != len(parsers):
+            raise ValueError
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def parse_limit(value, default, maximum):
+    # 정수가 아니면 400, 범위를 벗어나면 1..maximum으로 맞춘다
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({'limit': 'limit must be an integer.'})
+    return max(1, min(limit, maximum))
@@ -0,0 +1,111 @@
+import time
+from datetime import datetime
+from redis.exceptions import RedisError
+from config.settings import PRESENCE_TTL, LAST_SEEN_TTL, TYPING_TTL
+from config.services import format_datetime
+from config.redis_client import get_redis
+from config import metrics
+
+presence_errors = metrics.counter('presence_redis_errors_total', 'Redis errors while updating typing or presence state.')
+
+
+class PresenceService:
+    # user id -> {channel name: 만료 시각}. 비정상 종료된 워커의 연결은 점수가 지나면 오프라인으로 취급된다.
+    # 온라인/오프라인 이벤트는 방 단위로 보내므로 (user id, chatroom id)별 연결도 따로 센다
+    CONNECTIONS_KEY = 'chat:presence:{}'
+    ROOM_CONNECTIONS_KEY = 'chat:presence:{}:{}'
+    LAST_SEEN_KEY = 'chat:last_seen:{}'
+    TYPING_KEY = 'chat:typing:{}:{}'
+
+    @staticmethod
+    def keys(user_id, chatroom_id):
+        return PresenceService.CONNECTIONS_KEY.format(user_id), PresenceService.ROOM_CONNECTIONS_KEY.format(user_id, chatroom_id)
+
+    @staticmethod
+    async def connect(user_id, chatroom_id, channel_name):
+        # 이 방에서 이 사용자의 첫 연결이면 True. 다른 방에 이미 접속해 있어도 이 방에는 온라인을 알린다
+        now = time.time()
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                for key in PresenceService.keys(user_id, chatroom_id):
+                    pipe.zremrangebyscore(key, '-inf', now)
+                    pipe.zcard(key)
+                    pipe.zadd(key, {channel_name: now + PRESENCE_TTL})
+                    pipe.expire(key, PRESENCE_TTL)
+                results = await pipe.execute()
+        except RedisError:
+            presence_errors.inc()
+            return False
+        return results[5] == 0
+
+    @staticmethod
+    async def refresh(user_id, chatroom_id, channel_name):
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                for key in PresenceService.keys(user_id, chatroom_id):
+                    pipe.zadd(key, {channel_name: time.time() + PRESENCE_TTL})
+                    pipe.expire(key, PRESENCE_TTL)
+                await pipe.execute()
+        except RedisError:
+            presence_errors.inc()
+
+    @staticmethod
+    async def disconnect(user_id, chatroom_id, channel_name):
+        # 이 방에 남은 연결이 없으면 마지막 접속 시각을 반환. 다른 방에 접속해 있어도 이 방에는 오프라인을 알린다
+        now = time.time()
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                for key in PresenceService.keys(user_id, chatroom_id):
+                    pipe.zrem(key, channel_name)
+                    pipe.zremrangebyscore(key, '-inf', now)
+                    pipe.zcard(key)
+                pipe.set(PresenceService.LAST_SEEN_KEY.format(user_id), now, ex=LAST_SEEN_TTL)
+                results = await pipe.execute()
+        except RedisError:
+            presence_errors.inc()
+            return None
+        if results[5]:
+            return None
+        return PresenceService.format_last_seen(now)
+
+    @staticmethod
+    async def get_presence(user_ids):
+        now = time.time()
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(PresenceService.CONNECTIONS_KEY.format(user_id), now, '+inf')
+                pipe.get(PresenceService.LAST_SEEN_KEY.format(user_id))
+            results = await pipe.execute()
+
+        presence = {}
+        for i, user_id in enumerate(user_ids):
+            connections, last_seen = results[2 * i], results[2 * i + 1]
+            presence[user_id] = {
+                'online': connections > 0,
+                'last_seen': PresenceService.format_last_seen(float(last_seen)) if last_seen else None,
+            }
+        return presence
+
+    @staticmethod
+    async def start_typing(chatroom_id, user_id):
+        # NX로 워커와 탭이 여러 개여도 TTL 동안 한 번만 알린다
+        try:
+            return bool(await get_redis().set(
+                PresenceService.TYPING_KEY.format(chatroom_id, user_id), 1, nx=True, ex=TYPING_TTL
+            ))
+        except RedisError:
+            presence_errors.inc()
+            return False
+
+    @staticmethod
+    async def stop_typing(chatroom_id, user_id):
+        try:
+            return bool(await get_redis().delete(PresenceService.TYPING_KEY.format(chatroom_id, user_id)))
+        except RedisError:
+            presence_errors.inc()
+            return False
+
+    @staticmethod
+    def format_last_seen(timestamp):
+        # USE_TZ=False라 다른 시각처럼 TIME_ZONE 기준 로컬 시각으로 쓴다
+        return format_datetime(datetime.fromtimestamp(timestamp))
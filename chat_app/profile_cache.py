@@ -0,0 +1,186 @@
+import asyncio
+import json
+from redis.exceptions import RedisError
+from config.settings import (
+    PROFILE_CACHE_SIZE,
+    PROFILE_CACHE_TTL,
+    PROFILE_CACHE_NEGATIVE_TTL,
+    PROFILE_CACHE_REDIS,
+)
+from config.cache import TTLCache, MISS
+from config.loop_local import LoopLocal
+from config.redis_client import get_redis
+from config import metrics
+
+cache_requests = metrics.counter('profile_cache_requests_total', 'Profile cache lookups by tier and result.')
+cache_coalesced = metrics.counter('profile_cache_coalesced_total', 'Profile lookups that joined an in-flight fetch.')
+cache_errors = metrics.counter('profile_cache_redis_errors_total', 'Redis errors in the shared profile cache tier.')
+
+
+class ProfileUnavailable(Exception):
+    # user 서비스가 프로필 유무를 확인해 주지 못했다 (5xx, 인증 실패, 타임아웃). 404와 달리 캐시하지 않는다
+    pass
+
+
+class ProfileCache:
+    KEY_PREFIX = 'chat:profile:'
+
+    def __init__(
+        self,
+        maxsize=PROFILE_CACHE_SIZE,
+        ttl=PROFILE_CACHE_TTL,
+        negative_ttl=PROFILE_CACHE_NEGATIVE_TTL,
+        use_redis=PROFILE_CACHE_REDIS,
+    ):
+        self.local = TTLCache(maxsize)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.use_redis = use_redis
+        self._inflight = LoopLocal(dict)
+
+    def ttl_for(self, profile):
+        return self.ttl if profile is not None else self.negative_ttl
+
+    async def get(self, user_id, fetch):
+        profile = self.local.get(user_id)
+        if profile is not MISS:
+            cache_requests.inc(tier='local', result='hit')
+            return profile
+
+        task = self._join(user_id)
+        if task is None:
+            task = self._track(user_id, self._load(user_id, fetch))
+        # 먼저 요청한 쪽이 취소되어도 같은 조회를 기다리는 쪽에는 결과가 전달되도록 shield
+        return await asyncio.shield(task)
+
+    async def get_many(self, user_ids, fetch_many):
+        # fetch_many(user_ids)는 확인된 결과만 담은 {user_id: profile or None}을 반환
+        profiles = {}
+        missing = []
+        for user_id in user_ids:
+            profile = self.local.get(user_id)
+            if profile is MISS:
+                missing.append(user_id)
+            else:
+                cache_requests.inc(tier='local', result='hit')
+                profiles[user_id] = profile
+
+        if missing and self.use_redis:
+            raws = await self._redis_mget(missing)
+            still_missing = []
+            for user_id, raw in zip(missing, raws):
+                if raw is None:
+                    still_missing.append(user_id)
+                    continue
+                cache_requests.inc(tier='redis', result='hit')
+                profile = json.loads(raw)
+                self.local.set(user_id, profile, self.ttl_for(profile))
+                profiles[user_id] = profile
+            missing = still_missing
+
+        tasks = {}
+        to_fetch = []
+        for user_id in missing:
+            task = self._join(user_id)
+            if task is None:
+                to_fetch.append(user_id)
+            else:
+                tasks[user_id] = task
+
+        if to_fetch:
+            cache_requests.inc(len(to_fetch), tier='redis' if self.use_redis else 'local', result='miss')
+            batch = asyncio.ensure_future(self._fetch_many(to_fetch, fetch_many))
+            for user_id in to_fetch:
+                tasks[user_id] = self._track(user_id, self._pick(batch, user_id))
+
+        results = await asyncio.gather(
+            *[asyncio.shield(task) for task in tasks.values()],
+            return_exceptions=True
+        )
+        for user_id, result in zip(tasks, results):
+            profiles[user_id] = None if isinstance(result, BaseException) else result
+        return profiles
+
+    def _join(self, user_id):
+        task = self._inflight.get().get(user_id)
+        if task is not None:
+            cache_coalesced.inc()
+        return task
+
+    def _track(self, user_id, coro):
+        inflight = self._inflight.get()
+        task = inflight[user_id] = asyncio.ensure_future(coro)
+        task.add_done_callback(lambda _: inflight.pop(user_id, None))
+        return task
+
+    async def _fetch_many(self, user_ids, fetch_many):
+        profiles = await fetch_many(user_ids)
+        await self.set_many(profiles)
+        return profiles
+
+    @staticmethod
+    async def _pick(batch, user_id):
+        return (await batch).get(user_id)
+
+    async def _load(self, user_id, fetch):
+        if self.use_redis:
+            raw = await self._redis_get(user_id)
+            if raw is not None:
+                cache_requests.inc(tier='redis', result='hit')
+                profile = json.loads(raw)
+                self.local.set(user_id, profile, self.ttl_for(profile))
+                return profile
+
+        cache_requests.inc(tier='redis' if self.use_redis else 'local', result='miss')
+        try:
+            profile = await fetch()
+        except ProfileUnavailable:
+            return None
+        await self.set(user_id, profile)
+        return profile
+
+    async def set(self, user_id, profile):
+        ttl = self.ttl_for(profile)
+        self.local.set(user_id, profile, ttl)
+        if self.use_redis:
+            try:
+                await get_redis().set(f'{self.KEY_PREFIX}{user_id}', json.dumps(profile), ex=ttl)
+            except RedisError:
+                cache_errors.inc()
+
+    async def set_many(self, profiles):
+        for user_id, profile in profiles.items():
+            self.local.set(user_id, profile, self.ttl_for(profile))
+        if self.use_redis and profiles:
+            try:
+                async with get_redis().pipeline(transaction=False) as pipe:
+                    for user_id, profile in profiles.items():
+                        pipe.set(f'{self.KEY_PREFIX}{user_id}', json.dumps(profile), ex=self.ttl_for(profile))
+                    await pipe.execute()
+            except RedisError:
+                cache_errors.inc()
+
+    async def invalidate(self, user_id):
+        self.local.delete(user_id)
+        if self.use_redis:
+            try:
+                await get_redis().delete(f'{self.KEY_PREFIX}{user_id}')
+            except RedisError:
+                cache_errors.inc()
+
+    async def _redis_get(self, user_id):
+        try:
+            return await get_redis().get(f'{self.KEY_PREFIX}{user_id}')
+        except RedisError:
+            cache_errors.inc()
+            return None
+
+    async def _redis_mget(self, user_ids):
+        try:
+            return await get_redis().mget([f'{self.KEY_PREFIX}{user_id}' for user_id in user_ids])
+        except RedisError:
+            cache_errors.inc()
+            return [None] * len(user_ids)
+
+
+profile_cache = ProfileCache()
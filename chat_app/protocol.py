@@ -0,0 +1,156 @@
+import asyncio
+import msgpack
+from config.settings import WS_COALESCE_WINDOW, WS_COALESCE_MAX_EVENTS
+from config import json_codec, metrics
+
+MSGPACK_SUBPROTOCOL = 'chat.msgpack.v1'
+
+frames_sent = metrics.counter('ws_frames_sent_total', 'WebSocket frames sent by protocol.')
+events_sent = metrics.counter('ws_events_sent_total', 'Events delivered to WebSocket clients by protocol.')
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_chat_message(message_id, sender_id, sender, avatar, content, timestamp):
+    # 그룹 이벤트는 수신자마다 다시 직렬화하지 않도록 두 포맷으로 한 번만 인코딩해 채널 레이어로 보낸다
+    return {
+        'type': 'chat.message',
+        'id': message_id,
+        'sender_id': sender_id,
+        'sender': sender,
+        'avatar': avatar,
+        'json': json_codec.dumps({
+            "type": "chat.message",
+            "id": message_id,
+            "sender": sender,
+            "avatar": avatar,
+            "content": content,
+            "timestamp": timestamp
+        }),
+        'msgpack': msgpack.packb({
+            "type": "chat.message",
+            "id": message_id,
+            "sender_id": sender_id,
+            "content": content,
+            "timestamp": timestamp
+        }),
+    }
+
+
+class JsonProtocol:
+    # 서브프로토콜을 협상하지 않은 클라이언트용 기존 텍스트 프레임 포맷
+    subprotocol = None
+    name = 'json'
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+
+    def decode(self, text_data, bytes_data):
+        if text_data is None:
+            raise ProtocolError("Invalid JSON format.")
+        try:
+            data = json_codec.loads(text_data)
+        except json_codec.JSONDecodeError:
+            raise ProtocolError("Invalid JSON format.")
+        if not isinstance(data, dict):
+            raise ProtocolError("Invalid message type.")
+        return data
+
+    async def send(self, payload):
+        await self.send_encoded(json_codec.dumps(payload))
+
+    async def send_encoded(self, text):
+        await self.consumer.send(text_data=text)
+        frames_sent.inc(protocol=self.name)
+        events_sent.inc(protocol=self.name)
+
+    async def send_chat_message(self, event):
+        await self.send_encoded(event['json'])
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class MsgpackProtocol:
+    # 바이너리 프레임 하나에 이벤트 배열을 담는다. 이벤트는 미리 인코딩된 바이트로 모아 두었다가
+    # 배열 헤더만 붙여 그대로 이어 붙인다.
+    # 발신자 프로필은 연결마다 한 번만 보내고 이후 메시지는 sender_id로 참조한다
+    subprotocol = MSGPACK_SUBPROTOCOL
+    name = 'msgpack'
+    window = WS_COALESCE_WINDOW
+    max_events = WS_COALESCE_MAX_EVENTS
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.profiles = {}
+        self.pending = []
+        self.flush_task = None
+
+    def decode(self, text_data, bytes_data):
+        if bytes_data is None:
+            raise ProtocolError("Invalid msgpack format.")
+        try:
+            data = msgpack.unpackb(bytes_data, raw=False)
+        except (msgpack.UnpackException, ValueError):
+            raise ProtocolError("Invalid msgpack format.")
+        if not isinstance(data, dict):
+            raise ProtocolError("Invalid message type.")
+        return data
+
+    async def send(self, payload):
+        await self.send_encoded(msgpack.packb(payload))
+
+    async def send_encoded(self, data):
+        self.pending.append(data)
+        if len(self.pending) >= self.max_events:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.window)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if self.flush_task is not None and self.flush_task is not asyncio.current_task():
+            self.flush_task.cancel()
+            self.flush_task = None
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        header = msgpack.Packer().pack_array_header(len(pending))
+        await self.consumer.send(bytes_data=header + b''.join(pending))
+        frames_sent.inc(protocol=self.name)
+        events_sent.inc(len(pending), protocol=self.name)
+
+    async def send_chat_message(self, event):
+        sender_id = event.get("sender_id")
+        profile = (event.get("sender"), event.get("avatar"))
+        # 닉네임이나 아바타가 바뀐 경우에만 프로필을 다시 보낸다
+        if self.profiles.get(sender_id) != profile:
+            self.profiles[sender_id] = profile
+            await self.send({
+                "type": "profile",
+                "id": sender_id,
+                "sender": profile[0],
+                "avatar": profile[1]
+            })
+        await self.send_encoded(event['msgpack'])
+
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.pending = []
+
+
+def negotiate(consumer, subprotocols):
+    if MSGPACK_SUBPROTOCOL in subprotocols:
+        return MsgpackProtocol(consumer)
+    return JsonProtocol(consumer)
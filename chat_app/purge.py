@@ -0,0 +1,48 @@
+from datetime import timedelta
+from django.db import router
+from django.utils.timezone import now
+from config.settings import CHATROOM_PURGE_BATCH_SIZE, CHATROOM_PURGE_GRACE_SECONDS
+from config import metrics
+from .models import ChatRoom, Message, MessageArchive
+
+purged_messages = metrics.counter('chat_purged_messages_total', 'Messages of deleted chat rooms removed by the purge.')
+purged_chatrooms = metrics.counter('chat_purged_chatrooms_total', 'Deleted chat rooms removed after their messages were purged.')
+
+
+def purge_cutoff(grace_seconds=None):
+    return now() - timedelta(seconds=CHATROOM_PURGE_GRACE_SECONDS if grace_seconds is None else grace_seconds)
+
+
+def deleted_chatroom_ids(cutoff):
+    return list(
+        ChatRoom.all_objects.using(router.db_for_write(ChatRoom))
+        .filter(deleted_at__lt=cutoff)
+        .order_by('deleted_at')
+        .values_list('id', flat=True)
+    )
+
+
+def purge_batch(model, chatroom_id, batch_size=None):
+    # id만 읽어 배치 크기만큼씩 지운다. 메시지를 가리키는 관계가 없어 delete()가 DELETE ... WHERE id IN (...) 한 번으로 끝난다
+    db = router.db_for_write(model)
+    ids = list(
+        model.objects.using(db).filter(chatroom_id=chatroom_id)
+        .values_list('id', flat=True)[:batch_size or CHATROOM_PURGE_BATCH_SIZE]
+    )
+    if not ids:
+        return 0
+    deleted, _ = model.objects.using(db).filter(id__in=ids).delete()
+    purged_messages.inc(deleted)
+    return deleted
+
+
+def purge_chatroom(chatroom_id, batch_size=None):
+    # 배치마다 지운 메시지 수를 돌려준다. 메시지가 모두 지워지면 방 행을 지운다
+    for model in (Message, MessageArchive):
+        while deleted := purge_batch(model, chatroom_id, batch_size):
+            yield deleted
+    # 마지막 배치 뒤에 들어온 메시지가 있어도 남은 몇 개는 일반 삭제의 캐스케이드가 함께 지운다
+    ChatRoom.all_objects.using(router.db_for_write(ChatRoom)).filter(
+        id=chatroom_id, deleted_at__isnull=False
+    ).delete()
+    purged_chatrooms.inc()
@@ -0,0 +1,75 @@
+import time
+from redis.exceptions import RedisError
+from config.settings import (
+    CHAT_RATE_PER_USER,
+    CHAT_BURST_PER_USER,
+    CHAT_USER_RATE_LIMIT,
+)
+from config.loop_local import LoopLocal
+from config.redis_client import get_redis
+from config import metrics
+
+rate_limit_errors = metrics.counter('chat_rate_limit_redis_errors_total', 'Redis errors in the shared rate limiter.')
+
+# 워커마다 시계가 다를 수 있어 Redis 서버 시각 기준으로 토큰을 채운다
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return allowed
+"""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def allow(self, cost=1):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+class RedisTokenBucket:
+    KEY_PREFIX = 'chat:ratelimit:'
+
+    def __init__(self, rate=CHAT_RATE_PER_USER, burst=CHAT_BURST_PER_USER, enabled=CHAT_USER_RATE_LIMIT):
+        self.rate = rate
+        self.burst = burst
+        self.enabled = enabled
+        self._scripts = LoopLocal(lambda: get_redis().register_script(TOKEN_BUCKET_SCRIPT))
+
+    async def allow(self, key, cost=1):
+        if not self.enabled:
+            return True
+        try:
+            return bool(await self._scripts.get()(
+                keys=[f'{self.KEY_PREFIX}{key}'], args=[self.rate, self.burst, cost]
+            ))
+        except RedisError:
+            # Redis 장애로 채팅 전체가 막히지 않도록 연결 단위 제한만 남기고 통과시킨다
+            rate_limit_errors.inc()
+            return True
+
+
+user_rate_limiter = RedisTokenBucket()
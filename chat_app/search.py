@@ -0,0 +1,105 @@
+import re
+from django.db import connection
+from rest_framework.exceptions import ValidationError
+from asgiref.sync import sync_to_async
+from config import metrics
+from config.settings import MESSAGE_ARCHIVE
+from .models import Message, MessageArchive
+from .pagination import encode_cursor, decode_cursor
+
+# FTS5 unicode61과 postgresql 'simple' 파서 모두 밑줄을 구분자로 취급한다
+SEARCH_TERM = re.compile(r'[^\W_]+')
+
+search_seconds = metrics.histogram('chat_search_seconds', 'Message search query latency by database vendor.')
+
+# rank가 클수록 관련도가 높다. 다음 페이지는 (rank, id)가 마지막 결과보다 작은 행부터.
+# 테이블마다 상위 limit개를 고른 뒤 합쳐서 다시 정렬한다
+POSTGRES_SEARCH = """
+SELECT * FROM (
+    SELECT m.id, m.chatroom_id, m.sender_id, m.content, m.timestamp, ts_rank(m.search_vector, q.query) AS rank
+    FROM {table} m
+    JOIN chat_app_chatroom r ON r.id = m.chatroom_id
+    CROSS JOIN plainto_tsquery('simple', %s) AS q(query)
+    WHERE m.search_vector @@ q.query AND (r.user1_id = %s OR r.user2_id = %s) AND r.deleted_at IS NULL {after}
+    ORDER BY rank DESC, m.id DESC
+    LIMIT %s
+) AS {table}_results
+"""
+POSTGRES_AFTER = 'AND (ts_rank(m.search_vector, q.query), m.id) < (%s, %s)'
+
+SQLITE_SEARCH = """
+SELECT * FROM (
+    SELECT m.id, m.chatroom_id, m.sender_id, m.content, m.timestamp, -bm25({table}_fts) AS rank
+    FROM {table}_fts
+    JOIN {table} m ON m.id = {table}_fts.rowid
+    JOIN chat_app_chatroom r ON r.id = m.chatroom_id
+    WHERE {table}_fts MATCH %s AND (r.user1_id = %s OR r.user2_id = %s) AND r.deleted_at IS NULL {after}
+    ORDER BY rank DESC, m.id DESC
+    LIMIT %s
+) AS {table}_results
+"""
+SQLITE_AFTER = 'AND (-bm25({table}_fts), m.id) < (%s, %s)'
+
+MERGED_SEARCH = """
+SELECT * FROM ({parts}) AS results
+ORDER BY rank DESC, id DESC
+LIMIT %s
+"""
+
+
+class MessageSearchService:
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 50
+    MAX_TERMS = 8
+
+    @staticmethod
+    def parse_terms(query):
+        return list(dict.fromkeys(SEARCH_TERM.findall(query.lower())))[:MessageSearchService.MAX_TERMS]
+
+    @staticmethod
+    async def search(user_id, query, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        # 사용자가 속한 채팅방의 메시지 중 모든 검색어를 포함하는 것을 관련도 순으로
+        terms = MessageSearchService.parse_terms(query)
+        if not terms:
+            raise ValidationError({'q': 'Enter at least one search term.'})
+        after = decode_cursor(cursor, float, int) if cursor else None
+
+        with search_seconds.time(vendor=connection.vendor):
+            messages = await sync_to_async(MessageSearchService.run_query)(user_id, terms, after, limit + 1)
+        next_cursor = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            last = messages[-1]
+            next_cursor = encode_cursor(repr(last.rank), last.id)
+        for message in messages:
+            message.highlights = MessageSearchService.highlight(message.content, terms)
+        return messages, next_cursor
+
+    @staticmethod
+    def run_query(user_id, terms, after, limit):
+        if connection.vendor == 'postgresql':
+            sql, after_sql, match = POSTGRES_SEARCH, POSTGRES_AFTER, ' '.join(terms)
+        else:
+            # 검색어를 각각 따옴표로 감싸 FTS5 문법(AND, NEAR, * 등)으로 해석되지 않게 한다
+            sql, after_sql, match = SQLITE_SEARCH, SQLITE_AFTER, ' '.join(f'"{term}"' for term in terms)
+        # MESSAGE_ARCHIVE가 켜져 있으면 보관 테이블로 옮겨진 메시지도 함께 검색한다
+        tables = [Message._meta.db_table]
+        if MESSAGE_ARCHIVE:
+            tables.append(MessageArchive._meta.db_table)
+        parts = []
+        params = []
+        for table in tables:
+            parts.append(sql.format(table=table, after=after_sql.format(table=table) if after else ''))
+            params.extend([match, user_id, user_id, *(after or ()), limit])
+        params.append(limit)
+        return list(Message.objects.raw(MERGED_SEARCH.format(parts=' UNION ALL '.join(parts)), params))
+
+    @staticmethod
+    def highlight(content, terms):
+        # 일치한 단어의 [시작, 끝) 위치. HTML 태그를 넣지 않으므로 클라이언트가 안전하게 강조 표시할 수 있다
+        terms = set(terms)
+        return [
+            [match.start(), match.end()]
+            for match in SEARCH_TERM.finditer(content)
+            if match.group().lower() in terms
+        ]
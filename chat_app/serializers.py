@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from asgiref.sync import async_to_sync
+from rest_framework.settings import api_settings
 from .models import ChatRoom, Message
 from .services import ChatRoomService
 
@@ -13,27 +13,65 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatRoom
         fields = ['id', 'user1_id', 'user2_id', 'updated_at', 'last_message']
+        # 자동 생성되는 유니크 검사는 동기 ORM을 쓰므로 avalidate에서 직접 한다
+        validators = []
         
     def get_last_message(self, obj):
-        last_message = obj.last_message
-        return last_message.content if last_message else None
+        return obj.last_message_preview if obj.last_message_id else None
         
-    def validate(self, data):
-        user1_id = data['user1_id']
-        user2_id = data['user2_id']
+    async def avalidate(self):
+        # is_valid() 이후 DB와 사용자 서비스가 필요한 검사
+        user1_id = self.validated_data['user1_id']
+        user2_id = self.validated_data['user2_id']
         token = self.context['token']
 
-        if not async_to_sync(ChatRoomService.validate_users)(user1_id, user2_id, token):
-            raise serializers.ValidationError("users are invalid.")
-
-        return data
+        if await ChatRoomService.chatroom_exist(user1_id, user2_id):
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: ["The fields user1_id, user2_id must make a unique set."]},
+                code='unique'
+            )
+        if not await ChatRoomService.validate_users(user1_id, user2_id, token):
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: ["users are invalid."]},
+                code='invalid'
+            )
     
-    def create(self, validated_data):
-        return async_to_sync(ChatRoomService.create_chatroom)(
-            user1_id=validated_data['user1_id'],
-            user2_id=validated_data['user2_id']
+    async def asave(self):
+        self.instance = await ChatRoomService.create_chatroom(
+            user1_id=self.validated_data['user1_id'],
+            user2_id=self.validated_data['user2_id']
         )
+        return self.instance
         
+class ChatRoomListSerializer(serializers.ModelSerializer):
+    partner_id = serializers.SerializerMethodField()
+    nickname = serializers.SerializerMethodField()
+    avatar = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = ChatRoom
+        fields = [
+            'id', 'partner_id', 'nickname', 'avatar', 'updated_at',
+            'last_message', 'last_message_at', 'unread_count'
+        ]
+    
+    def get_partner_id(self, obj):
+        return obj.get_receiver_id(self.context['user_id'])
+    
+    def get_partner_profile(self, obj):
+        return self.context['profiles'].get(self.get_partner_id(obj)) or {}
+    
+    def get_nickname(self, obj):
+        return self.get_partner_profile(obj).get('nickname')
+    
+    def get_avatar(self, obj):
+        return self.get_partner_profile(obj).get('avatar')
+    
+    def get_last_message(self, obj):
+        return obj.last_message_preview if obj.last_message_id else None
+
 class MessageSerializer(serializers.ModelSerializer):
     avatar = serializers.CharField(read_only=True)
     sender = serializers.CharField(read_only=True)
@@ -1,25 +1,112 @@
-from .models import ChatRoom, Message
-from django.db.models import Q
-import aiohttp
-from config.settings import USER_SERVICE_URL
+from .models import ChatRoom, Message, MessageArchive
+from django.db import transaction, DEFAULT_DB_ALIAS
+from django.db.models import Q, F, Case, When
+from django.db.models.functions import Greatest
+from datetime import datetime
+from django.utils.timezone import now
+from channels.layers import get_channel_layer
+from config.http_client import user_service_client
+from config.settings import (
+    USER_SERVICE_BATCH_PATH,
+    USER_SERVICE_MAX_CONCURRENCY,
+    MESSAGE_WRITE_BEHIND,
+    MESSAGE_ARCHIVE,
+    ROOM_MEMBERSHIP_CACHE_SIZE,
+    ROOM_MEMBERSHIP_CACHE_TTL,
+    POSTGRES_REPLICA_HOSTS,
+)
+from config.cache import TTLCache, MISS
+from config.redis_client import get_redis
+from config.db_router import anote_write
+from .profile_cache import profile_cache, ProfileUnavailable
+from .message_writer import message_writer
+from .pagination import encode_cursor, decode_cursor
 from rest_framework.exceptions import PermissionDenied
+from redis.exceptions import RedisError
 import asyncio
+import aiohttp
+import logging
 from asgiref.sync import sync_to_async
 
+logger = logging.getLogger(__name__)
+
 class UserService:
+    # 일괄 조회를 지원하지 않는 user 서비스로 확인되면 None으로 바뀐다
+    batch_path = USER_SERVICE_BATCH_PATH
+    
     @staticmethod
     async def get_user(user_id, token):
-        user_service_url = f'{USER_SERVICE_URL}profile/{user_id}/'
-        headers = {'Authorization': f'Bearer {token}'}
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(user_service_url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    return await response.json()
-                return None
+        return await profile_cache.get(user_id, lambda: UserService.fetch_user(user_id, token))
+
+    @staticmethod
+    async def fetch_user(user_id, token):
+        # 없는 사용자(404)만 None으로 돌려 캐시하고, 그 밖의 실패는 이 요청에서만 실패로 처리한다
+        try:
+            status, data = await user_service_client.get(f'profile/{user_id}/', token)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise ProfileUnavailable(str(e)) from e
+        if status == 200:
+            return data
+        if status == 404:
+            return None
+        raise ProfileUnavailable(f'user service returned {status}')
+
+    @staticmethod
+    async def get_users(user_ids, token):
+        return await profile_cache.get_many(
+            list(user_ids), lambda missing: UserService.fetch_users(missing, token)
+        )
+
+    @staticmethod
+    async def fetch_users(user_ids, token):
+        if UserService.batch_path:
+            profiles = await UserService.fetch_users_batch(user_ids, token)
+            if profiles is not None:
+                return profiles
+
+        semaphore = asyncio.Semaphore(USER_SERVICE_MAX_CONCURRENCY)
+
+        async def fetch(user_id):
+            async with semaphore:
+                return await UserService.fetch_user(user_id, token)
+
+        results = await asyncio.gather(
+            *[fetch(user_id) for user_id in user_ids],
+            return_exceptions=True
+        )
+        # 실패한 조회는 캐시에 남기지 않도록 결과에서 제외
+        return {
+            user_id: result for user_id, result in zip(user_ids, results)
+            if not isinstance(result, BaseException)
+        }
+
+    @staticmethod
+    async def fetch_users_batch(user_ids, token):
+        try:
+            status, data = await user_service_client.get(
+                UserService.batch_path, token,
+                params={'ids': ','.join(str(user_id) for user_id in user_ids)}
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+        if status in (404, 405, 501):
+            UserService.batch_path = None
+        if status != 200:
+            return None
+
+        profiles = dict.fromkeys(user_ids)
+        profiles.update({profile['id']: profile for profile in data})
+        return profiles
         
 class ChatRoomService:
     DEFAULT_PAGE_SIZE = 50
+    MESSAGE_LIST_FIELDS = ('id', 'sender_id', 'content', 'timestamp')
+    DEFAULT_ROOM_PAGE_SIZE = 20
+    MAX_ROOM_PAGE_SIZE = 100
+    # chatroom id -> (user1_id, user2_id). 채팅방 멤버는 바뀌지 않으므로 삭제 시에만 무효화
+    room_members = TTLCache(ROOM_MEMBERSHIP_CACHE_SIZE)
+    DELETED_KEY_PREFIX = 'chat:deleted:'
     
     @staticmethod
     def check_user_permission(chatroom, user_id):
@@ -28,21 +115,94 @@ class ChatRoomService:
         
     @staticmethod
     async def get_messages(chatroom, last_loaded_message_id=None, limit=DEFAULT_PAGE_SIZE):
-        query = Message.objects.filter(chatroom=chatroom)
+        query = Message.objects.filter(chatroom=chatroom).only(*ChatRoomService.MESSAGE_LIST_FIELDS)
         if last_loaded_message_id:
             query = query.filter(id__lt=last_loaded_message_id)
         messages = await sync_to_async(list)(query.order_by('-id')[:limit])
+        if MESSAGE_ARCHIVE and len(messages) < limit:
+            # 최근 테이블에서 모자란 만큼은 보관 테이블에서 이어 읽는다. 보관된 메시지는 항상 더 오래되어 id가 작다
+            before = messages[-1].id if messages else last_loaded_message_id
+            archived = MessageArchive.objects.filter(chatroom=chatroom).only(*ChatRoomService.MESSAGE_LIST_FIELDS)
+            if before:
+                archived = archived.filter(id__lt=before)
+            messages += await sync_to_async(list)(archived.order_by('-id')[:limit - len(messages)])
         messages.reverse()
         return messages
     
+    @staticmethod
+    async def get_messages_after(chatroom, after_message_id, limit):
+        # 재접속한 소켓이 놓친 메시지를 오래된 순으로 이어 읽는 커서 조회
+        query = Message.objects.filter(
+            chatroom=chatroom, id__gt=after_message_id
+        ).only(*ChatRoomService.MESSAGE_LIST_FIELDS).order_by('id')
+        return await sync_to_async(list)(query[:limit])
+    
+    @staticmethod
+    async def save_message(chatroom, sender_id, content):
+        # 보낸 사람과, 방의 첫 페이지를 읽을 받는 사람 모두 복제 지연 동안 기본 DB에서 읽게 한다
+        await anote_write(sender_id, chatroom.id)
+        if MESSAGE_WRITE_BEHIND:
+            return await message_writer.submit(chatroom, sender_id, content)
+        return await ChatRoomService.create_message(chatroom, sender_id, content)
+    
+    @staticmethod
+    @sync_to_async
+    @transaction.atomic
+    def create_message(chatroom, sender_id, content):
+        message = Message.objects.create(chatroom=chatroom, sender_id=sender_id, content=content)
+        unread_field = chatroom.receiver_unread_field(sender_id)
+        # 동시에 보낸 더 최신 메시지가 먼저 반영됐다면 요약은 덮어쓰지 않는다. 안 읽은 수는 항상 늘린다
+        ChatRoom.objects.filter(
+            Q(last_message_id__isnull=True) | Q(last_message_id__lt=message.id),
+            id=chatroom.id,
+        ).update(**ChatRoom.last_message_fields(message))
+        ChatRoom.objects.filter(id=chatroom.id).update(**{unread_field: F(unread_field) + 1})
+        return message
+    
+    @staticmethod
+    async def mark_read(chatroom_id, user_id, message_id):
+        await anote_write(user_id, chatroom_id)
+        return await ChatRoomService.advance_read(chatroom_id, user_id, message_id)
+
+    @staticmethod
+    @sync_to_async
+    @transaction.atomic
+    def advance_read(chatroom_id, user_id, message_id):
+        # 읽음 위치를 앞으로만 옮기고, 그 사이 상대가 보낸 메시지를 한 번의 UPDATE로 읽음 처리
+        chatroom = ChatRoom.objects.select_for_update().filter(id=chatroom_id).first()
+        if chatroom is None:
+            return None
+        last_read_field, unread_field = chatroom.read_fields(user_id)
+        last_read_id = getattr(chatroom, last_read_field)
+        # 아직 없는 메시지까지 읽음 처리되지 않도록 마지막 메시지 id로 제한
+        message_id = min(message_id, chatroom.last_message_id or 0)
+        if message_id <= last_read_id:
+            return None
+        
+        marked = Message.objects.filter(
+            chatroom_id=chatroom_id, id__gt=last_read_id, id__lte=message_id, is_read=False
+        ).exclude(sender_id=user_id).update(is_read=True)
+        if MESSAGE_ARCHIVE:
+            marked += MessageArchive.objects.filter(
+                chatroom_id=chatroom_id, id__gt=last_read_id, id__lte=message_id, is_read=False
+            ).exclude(sender_id=user_id).update(is_read=True)
+        ChatRoom.objects.filter(id=chatroom_id).update(**{
+            last_read_field: message_id,
+            unread_field: Greatest(F(unread_field) - marked, 0),
+        })
+        return message_id
+    
     @staticmethod
     async def add_avatars_to_messages(messages, token):
         sender_ids = {message.sender_id for message in messages}
         profiles = await ChatRoomService.fetch_profiles(sender_ids, token)
-        
+        return ChatRoomService.attach_profiles(messages, profiles)
+    
+    @staticmethod
+    def attach_profiles(messages, profiles):
         result = []
         for message in messages:
-            profile = profiles.get(message.sender_id)
+            profile = profiles.get(message.sender_id) or {}
             result.append({
                 "id": message.id,
                 "sender": profile.get('nickname'),
@@ -55,12 +215,33 @@ class ChatRoomService:
     
     @staticmethod
     async def fetch_profiles(sender_ids, token):
-        tasks = [
-            UserService.get_user(user_id, token) for user_id in sender_ids
-        ]
+        profiles = await UserService.get_users(sender_ids, token)
+        return {user_id: profile for user_id, profile in profiles.items() if profile}
+    
+    @staticmethod
+    async def get_user_chatrooms(user_id, cursor=None, limit=DEFAULT_ROOM_PAGE_SIZE):
+        query = ChatRoom.objects.filter(
+            Q(user1_id=user_id) | Q(user2_id=user_id)
+        ).annotate(unread_count=Case(
+            When(user1_id=user_id, then=F('user1_unread_count')),
+            default=F('user2_unread_count'),
+        ))
+        if cursor:
+            updated_at, chatroom_id = decode_cursor(cursor, datetime.fromisoformat, int)
+            query = query.filter(
+                Q(updated_at__lt=updated_at) |
+                Q(updated_at=updated_at, id__lt=chatroom_id)
+            )
         
-        profiles = await asyncio.gather(*tasks)
-        return {profile['id']: profile for profile in profiles}
+        chatrooms = [
+            chatroom async for chatroom in query.order_by('-updated_at', '-id')[:limit + 1]
+        ]
+        next_cursor = None
+        if len(chatrooms) > limit:
+            chatrooms = chatrooms[:limit]
+            last = chatrooms[-1]
+            next_cursor = encode_cursor(last.updated_at.isoformat(), last.id)
+        return chatrooms, next_cursor
     
     @staticmethod
     async def chatroom_exist(user1_id, user2_id):
@@ -69,8 +250,18 @@ class ChatRoomService:
             Q(user1_id=user2_id, user2_id=user1_id)
         ).aexists()
 
+    @staticmethod
+    async def shared_partner_ids(user_id, user_ids):
+        # user_ids 중 user_id와 (삭제되지 않은) 채팅방을 함께 쓰는 사용자
+        pairs = ChatRoom.objects.filter(
+            Q(user1_id=user_id, user2_id__in=user_ids) | Q(user2_id=user_id, user1_id__in=user_ids)
+        ).values_list('user1_id', 'user2_id')
+        return {user1_id if user2_id == user_id else user2_id async for user1_id, user2_id in pairs}
+
     @staticmethod    
     async def create_chatroom(user1_id, user2_id):
+        # 중복 확인도 복제 지연 없이 기본 DB에서 읽는다
+        await anote_write(user1_id)
         if await ChatRoomService.chatroom_exist(user1_id, user2_id):
             raise ValueError("Chat room already exists.")
         
@@ -81,15 +272,66 @@ class ChatRoomService:
     async def validate_users(user1_id, user2_id, token):
         if user1_id == user2_id:
             return False
-        if not await UserService.get_user(user1_id, token):
-            return False
-        if not await UserService.get_user(user2_id, token):
-            return False
-        return True
+        users = await asyncio.gather(
+            UserService.get_user(user1_id, token),
+            UserService.get_user(user2_id, token)
+        )
+        return all(users)
+
+    @staticmethod
+    async def delete_chatroom(chatroom):
+        # 메시지는 purge_chatrooms 명령이 배치로 지운다. 여기서는 삭제 표시만 하고 열린 소켓을 닫게 한다
+        deleted = await ChatRoom.objects.filter(id=chatroom.id).aupdate(deleted_at=now())
+        ChatRoomService.forget_chatroom(chatroom.id)
+        if deleted:
+            await ChatRoomService.mark_deleted(chatroom.id)
+            await get_channel_layer().group_send(
+                f'chat_{chatroom.id}', {'type': 'chat.deleted', 'chatroom_id': chatroom.id}
+            )
+        return bool(deleted)
 
     @staticmethod
     async def get_chatroom_by_id(chatroom_id):
-        return await ChatRoom.objects.filter(id=chatroom_id).afirst()
+        chatroom = await ChatRoom.objects.filter(id=chatroom_id).afirst()
+        if chatroom is None and POSTGRES_REPLICA_HOSTS:
+            # 상대가 방금 만든 방이 아직 복제본에 없을 수 있다
+            chatroom = await ChatRoom.objects.using(DEFAULT_DB_ALIAS).filter(id=chatroom_id).afirst()
+        if chatroom:
+            ChatRoomService.remember_members(chatroom)
+        return chatroom
+
+    @staticmethod
+    def remember_members(chatroom):
+        ChatRoomService.room_members.set(
+            str(chatroom.id), (chatroom.user1_id, chatroom.user2_id), ROOM_MEMBERSHIP_CACHE_TTL
+        )
+
+    @staticmethod
+    def get_cached_members(chatroom_id):
+        members = ChatRoomService.room_members.get(str(chatroom_id))
+        return None if members is MISS else members
+
+    @staticmethod
+    def forget_chatroom(chatroom_id):
+        ChatRoomService.room_members.delete(str(chatroom_id))
+
+    @staticmethod
+    async def mark_deleted(chatroom_id):
+        # 다른 워커의 멤버십 캐시는 직접 지울 수 없으므로 캐시 TTL 동안 모든 워커가 보는 삭제 표시를 남긴다
+        try:
+            await get_redis().set(
+                f'{ChatRoomService.DELETED_KEY_PREFIX}{chatroom_id}', 1, ex=ROOM_MEMBERSHIP_CACHE_TTL
+            )
+        except RedisError:
+            logger.exception('Failed to mark chatroom %s as deleted', chatroom_id)
+
+    @staticmethod
+    async def is_deleted(chatroom_id):
+        # 멤버십 캐시로 방 조회를 건너뛸 때 쓴다. Redis를 못 쓰면 DB에서 삭제 여부를 확인한다
+        try:
+            return bool(await get_redis().exists(f'{ChatRoomService.DELETED_KEY_PREFIX}{chatroom_id}'))
+        except RedisError:
+            return not await ChatRoom.objects.filter(id=chatroom_id).aexists()
 
     @staticmethod
     async def is_user_in_chatroom(user_id, chatroom: ChatRoom):
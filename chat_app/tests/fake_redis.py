@@ -0,0 +1,83 @@
+class FakeRedis:
+    # 테스트용 인메모리 Redis. 이 앱이 쓰는 명령만 흉내 내고 만료는 무시한다
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        command = getattr(self, f'_{name}')
+
+        async def run(*args, **kwargs):
+            return command(*args, **kwargs)
+        return run
+
+    def _set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def _get(self, key):
+        return self.data.get(key)
+
+    def _exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    def _delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def _expire(self, key, seconds):
+        return key in self.data
+
+    def _zadd(self, key, mapping):
+        members = self.data.setdefault(key, {})
+        added = len(set(mapping) - set(members))
+        members.update(mapping)
+        return added
+
+    def _zrem(self, key, *names):
+        members = self.data.get(key, {})
+        return sum(members.pop(name, None) is not None for name in names)
+
+    def _zremrangebyscore(self, key, low, high):
+        members = self.data.get(key, {})
+        removed = [name for name, score in members.items() if float(low) <= score <= float(high)]
+        for name in removed:
+            del members[name]
+        return len(removed)
+
+    def _zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def _zcount(self, key, low, high):
+        return sum(float(low) <= score <= float(high) for score in self.data.get(key, {}).values())
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        command = getattr(self.redis, f'_{name}')
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
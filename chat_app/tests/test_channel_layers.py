@@ -0,0 +1,72 @@
+import asyncio
+from collections import Counter
+from unittest.mock import patch, AsyncMock
+from channels_redis.core import RedisChannelLayer
+from django.test import SimpleTestCase
+from config.channel_layers import HashRing, LocalRedisChannelLayer
+
+HOSTS = [f'redis://10.0.0.{i}:6379' for i in range(1, 5)]
+GROUPS = [f'chat_{i}' for i in range(10000)]
+
+
+class HashRingTests(SimpleTestCase):
+    def test_spreads_groups_evenly(self):
+        ring = HashRing(HOSTS)
+        counts = Counter(ring.get(group) for group in GROUPS)
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        for count in counts.values():
+            self.assertTrue(1800 < count < 3200, counts)
+
+    def test_adding_a_host_only_moves_keys_to_it(self):
+        before = HashRing(HOSTS)
+        after = HashRing(HOSTS + ['redis://10.0.0.5:6379'])
+        moved = [group for group in GROUPS if before.get(group) != after.get(group)]
+        self.assertTrue(0 < len(moved) < len(GROUPS) * 0.3)
+        self.assertEqual({after.get(group) for group in moved}, {4})
+
+
+@patch.object(RedisChannelLayer, 'group_discard', new_callable=AsyncMock)
+@patch.object(RedisChannelLayer, 'group_add', new_callable=AsyncMock)
+class LocalRedisChannelLayerTests(SimpleTestCase):
+    async def test_delivers_to_local_members_in_memory(self, group_add, group_discard):
+        layer = LocalRedisChannelLayer(hosts=HOSTS)
+        local = await layer.new_channel()
+        other = LocalRedisChannelLayer(hosts=HOSTS)
+        remote = await other.new_channel()
+        await layer.group_add('chat_1', local)
+        await layer.group_add('chat_1', remote)
+        self.assertEqual(group_add.await_count, 2)
+
+        with patch.object(RedisChannelLayer, 'group_send', new_callable=AsyncMock) as group_send:
+            await layer.group_send('chat_1', {'type': 'chat.message', 'id': 1})
+        group_send.assert_awaited_once()
+        self.assertEqual(await layer.receive(local), {'type': 'chat.message', 'id': 1})
+
+        # Redis로는 다른 워커의 채널만 보낸다
+        channel_keys, _, _ = layer._map_channel_keys_to_connection([local, remote], {'type': 'chat.message'})
+        self.assertEqual([layer.prefix + other.non_local_name(remote)], [key for keys in channel_keys.values() for key in keys])
+        self.assertEqual(layer._map_channel_keys_to_connection([local], {'type': 'chat.message'})[0], {})
+
+        await layer.group_discard('chat_1', local)
+        self.assertNotIn('chat_1', layer.local_groups)
+        group_discard.assert_awaited_once()
+
+    async def test_wakes_the_receiver_holding_the_redis_lock(self, group_add, group_discard):
+        async def wait_for_redis(self, channel):
+            await asyncio.Event().wait()
+
+        layer = LocalRedisChannelLayer(hosts=HOSTS)
+        first = await layer.new_channel()
+        second = await layer.new_channel()
+        await layer.group_add('chat_1', first)
+        await layer.group_add('chat_1', second)
+
+        with patch.object(RedisChannelLayer, 'receive_single', wait_for_redis), \
+                patch.object(RedisChannelLayer, 'group_send', new_callable=AsyncMock):
+            # 둘 중 하나는 수신 잠금을 잡고 BRPOP에서 기다린다. 둘 다 로컬 메시지를 받아야 한다
+            receivers = [asyncio.ensure_future(layer.receive(channel)) for channel in (first, second)]
+            await asyncio.sleep(0.01)
+            await layer.group_send('chat_1', {'type': 'chat.message', 'id': 1})
+            received = await asyncio.wait_for(asyncio.gather(*receivers), 1)
+            await layer.close_pools()
+        self.assertEqual(received, [{'type': 'chat.message', 'id': 1}] * 2)
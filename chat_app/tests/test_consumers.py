@@ -0,0 +1,413 @@
+import asyncio
+import msgpack
+from unittest.mock import patch, AsyncMock
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from chat_app.close_codes import CloseCode
+from chat_app.consumers import active_connections, publish_latency
+from chat_app.models import ChatRoom, Message
+from chat_app.outbound import OutboundQueue
+from chat_app.presence import PresenceService
+from chat_app.rate_limit import user_rate_limiter
+from chat_app.protocol import MSGPACK_SUBPROTOCOL, MsgpackProtocol
+from chat_app.routing import websocket_urlpatterns
+from chat_app.services import ChatRoomService
+from config import json_codec
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+PROFILES = {
+    1: {'id': 1, 'nickname': 'alice', 'avatar': 'alice.png'},
+    2: {'id': 2, 'nickname': 'bob', 'avatar': 'bob.png'},
+    3: {'id': 3, 'nickname': 'carol', 'avatar': None},
+}
+
+
+async def fake_get_user(user_id, token):
+    return PROFILES.get(user_id)
+
+
+def communicator(chatroom_id, user_id, subprotocols=None, query_string=''):
+    path = f'ws/chat/{chatroom_id}/' + (f'?{query_string}' if query_string else '')
+    communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path, subprotocols=subprotocols)
+    communicator.scope['user_id'] = user_id
+    communicator.scope['token'] = 'token'
+    return communicator
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+@patch('chat_app.services.UserService.get_user', side_effect=fake_get_user)
+class ChatConsumerConnectTests(TestCase):
+    def setUp(self):
+        ChatRoomService.room_members.clear()
+
+    async def test_member_connects(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        ws = communicator(chatroom.id, 1)
+        active = active_connections.get()
+        connected, _ = await ws.connect()
+        self.assertTrue(connected)
+        self.assertEqual(active_connections.get(), active + 1)
+        await ws.disconnect()
+        self.assertEqual(active_connections.get(), active)
+
+    async def test_cached_membership_rejects_without_lookups(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        await ChatRoomService.get_chatroom_by_id(chatroom.id)
+        mock_get_user.reset_mock()
+
+        ws = communicator(chatroom.id, 3)
+        with patch.object(ChatRoomService, 'get_chatroom_by_id', new_callable=AsyncMock) as mock_get_chatroom:
+            connected, code = await ws.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, CloseCode.INVALID_USER)
+        mock_get_chatroom.assert_not_awaited()
+        mock_get_user.assert_not_awaited()
+
+    async def test_unknown_chatroom(self, mock_get_user):
+        connected, code = await communicator(999, 1).connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, CloseCode.CHATROOM_NOT_FOUND)
+
+    async def test_deleted_chatroom_closes_sockets(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        ws = communicator(chatroom.id, 2)
+        await ws.connect()
+
+        self.assertTrue(await ChatRoomService.delete_chatroom(chatroom))
+        self.assertEqual(
+            json_codec.loads(await ws.receive_from()),
+            {'type': 'chat.deleted', 'chatroom_id': chatroom.id}
+        )
+        self.assertEqual((await ws.receive_output())['code'], CloseCode.CHATROOM_DELETED)
+        await ws.disconnect()
+
+        connected, code = await communicator(chatroom.id, 1).connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, CloseCode.CHATROOM_NOT_FOUND)
+
+    async def test_deleted_chatroom_closes_even_if_send_queue_never_drains(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        ws = communicator(chatroom.id, 2)
+        await ws.connect()
+
+        never = AsyncMock(side_effect=lambda: asyncio.Event().wait())
+        with patch.object(OutboundQueue, 'drained', never), \
+                patch('chat_app.consumers.WS_SEND_DRAIN_TIMEOUT', 0.05):
+            self.assertTrue(await ChatRoomService.delete_chatroom(chatroom))
+            await ws.receive_from()
+            self.assertEqual((await ws.receive_output())['code'], CloseCode.CHATROOM_DELETED)
+        await ws.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+@patch('chat_app.services.UserService.get_user', side_effect=fake_get_user)
+class ChatConsumerProtocolTests(TestCase):
+    def setUp(self):
+        ChatRoomService.room_members.clear()
+
+    async def test_json_client_keeps_text_format(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        ws = communicator(chatroom.id, 1)
+        await ws.connect()
+        await ws.send_json_to({'type': 'chat', 'content': 'hello'})
+        event = await ws.receive_json_from()
+        self.assertEqual(event['sender'], 'alice')
+        self.assertEqual(event['avatar'], 'alice.png')
+        self.assertEqual(event['content'], 'hello')
+        await ws.disconnect()
+
+    @patch.object(MsgpackProtocol, 'window', 0.2)
+    async def test_msgpack_sends_profile_once_and_coalesces(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        sender = communicator(chatroom.id, 1)
+        receiver = communicator(chatroom.id, 2, subprotocols=[MSGPACK_SUBPROTOCOL])
+        await sender.connect()
+        connected, subprotocol = await receiver.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, MSGPACK_SUBPROTOCOL)
+
+        for i in range(3):
+            await sender.send_json_to({'type': 'chat', 'content': f'message {i}'})
+            await sender.receive_json_from()
+        events = msgpack.unpackb(await receiver.receive_from(), raw=False)
+        self.assertEqual(events[0], {'type': 'profile', 'id': 1, 'sender': 'alice', 'avatar': 'alice.png'})
+        self.assertEqual([event['content'] for event in events[1:]], ['message 0', 'message 1', 'message 2'])
+        self.assertEqual({event['sender_id'] for event in events[1:]}, {1})
+        self.assertNotIn('avatar', events[1])
+
+        await receiver.send_to(bytes_data=msgpack.packb({'type': 'chat', 'content': 'hi'}))
+        events = msgpack.unpackb(await receiver.receive_from(), raw=False)
+        self.assertEqual(events[0]['type'], 'profile')
+        self.assertEqual(events[1]['content'], 'hi')
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_broadcast_is_serialized_once(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        sockets = [communicator(chatroom.id, user_id) for user_id in (1, 1, 2, 2)]
+        for ws in sockets:
+            await ws.connect()
+
+        published = publish_latency.get(type='chat.message')['count']
+        with patch('chat_app.protocol.json_codec.dumps', wraps=json_codec.dumps) as dumps:
+            await sockets[0].send_json_to({'type': 'chat', 'content': 'hello'})
+            events = [await ws.receive_json_from() for ws in sockets]
+        self.assertEqual(dumps.call_count, 1)
+        self.assertEqual(publish_latency.get(type='chat.message')['count'], published + 1)
+        self.assertEqual({event['content'] for event in events}, {'hello'})
+        for ws in sockets:
+            await ws.disconnect()
+
+    async def test_msgpack_rejects_text_frames(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        ws = communicator(chatroom.id, 1, subprotocols=[MSGPACK_SUBPROTOCOL])
+        await ws.connect()
+        await ws.send_to(text_data='{"type": "chat", "content": "hi"}')
+        events = msgpack.unpackb(await ws.receive_from(), raw=False)
+        self.assertEqual(events, [{'type': 'error', 'message': 'Invalid msgpack format.'}])
+        await ws.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+@patch('chat_app.consumers.READ_RECEIPT_WINDOW', 0.05)
+@patch('chat_app.services.UserService.get_user', side_effect=fake_get_user)
+class ChatConsumerReadTests(TestCase):
+    def setUp(self):
+        ChatRoomService.room_members.clear()
+
+    async def test_read_requests_are_coalesced_into_one_receipt(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        sender = communicator(chatroom.id, 1)
+        reader = communicator(chatroom.id, 2)
+        await sender.connect()
+        await reader.connect()
+
+        ids = []
+        for i in range(3):
+            await sender.send_json_to({'type': 'chat', 'content': f'message {i}'})
+            ids.append((await sender.receive_json_from())['id'])
+            await reader.receive_json_from()
+
+        with patch.object(ChatRoomService, 'mark_read', wraps=ChatRoomService.mark_read) as mark_read:
+            for message_id in ids:
+                await reader.send_json_to({'type': 'read', 'message_id': message_id})
+            receipt = await sender.receive_json_from()
+        self.assertEqual(receipt, {'type': 'chat.read', 'user_id': 2, 'message_id': ids[-1]})
+        self.assertEqual(mark_read.call_count, 1)
+        self.assertEqual(await reader.receive_json_from(), receipt)
+
+        chatroom = await ChatRoom.objects.aget(id=chatroom.id)
+        self.assertEqual(chatroom.unread_count_for(2), 0)
+        await sender.disconnect()
+        await reader.disconnect()
+
+    async def test_invalid_read(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        ws = communicator(chatroom.id, 1)
+        await ws.connect()
+        await ws.send_json_to({'type': 'read', 'message_id': 'latest'})
+        self.assertEqual(await ws.receive_json_from(), {'type': 'error', 'message': 'message_id is required.'})
+        await ws.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+@patch('chat_app.services.UserService.get_user', side_effect=fake_get_user)
+class ChatConsumerPresenceTests(TestCase):
+    def setUp(self):
+        ChatRoomService.room_members.clear()
+        patcher = patch.multiple(
+            PresenceService,
+            connect=AsyncMock(return_value=True),
+            disconnect=AsyncMock(return_value='2024-01-01 00:00:00'),
+            start_typing=AsyncMock(return_value=True),
+            stop_typing=AsyncMock(return_value=True),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_presence_is_broadcast_to_partner(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        alice = communicator(chatroom.id, 1)
+        await alice.connect()
+        bob = communicator(chatroom.id, 2)
+        await bob.connect()
+
+        self.assertEqual(await alice.receive_json_from(), {
+            'type': 'chat.presence', 'user_id': 2, 'status': 'online', 'last_seen': None
+        })
+        await bob.disconnect()
+        self.assertEqual(await alice.receive_json_from(), {
+            'type': 'chat.presence', 'user_id': 2, 'status': 'offline', 'last_seen': '2024-01-01 00:00:00'
+        })
+        self.assertTrue(await bob.receive_nothing())
+        await alice.disconnect()
+
+    async def test_typing_is_rate_limited(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        alice = communicator(chatroom.id, 1)
+        bob = communicator(chatroom.id, 2)
+        await alice.connect()
+        await bob.connect()
+        await alice.receive_json_from()
+
+        for _ in range(5):
+            await bob.send_json_to({'type': 'typing'})
+        event = await alice.receive_json_from()
+        self.assertEqual(event['type'], 'chat.typing')
+        self.assertTrue(event['is_typing'])
+        self.assertEqual(PresenceService.start_typing.await_count, 1)
+
+        await bob.send_json_to({'type': 'typing', 'is_typing': False})
+        event = await alice.receive_json_from()
+        self.assertFalse(event['is_typing'])
+        self.assertTrue(await bob.receive_nothing())
+        await alice.disconnect()
+        await bob.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+@patch('chat_app.consumers.WS_REPLAY_BATCH_SIZE', 2)
+@patch('chat_app.services.UserService.get_user', side_effect=fake_get_user)
+class ChatConsumerResumeTests(TestCase):
+    def setUp(self):
+        ChatRoomService.room_members.clear()
+        self.chatroom = ChatRoom.objects.create(user1_id=1, user2_id=2)
+        self.ids = [
+            Message.objects.create(chatroom=self.chatroom, sender_id=1 + i % 2, content=f'message {i}').id
+            for i in range(5)
+        ]
+
+    async def receive_replay(self, ws):
+        events = []
+        while not events or events[-1]['type'] != 'chat.replay':
+            events.append(await ws.receive_json_from())
+        return events[:-1], events[-1]
+
+    async def test_resumes_from_query_string_in_batches(self, mock_get_user):
+        ws = communicator(self.chatroom.id, 1, query_string=f'since_message_id={self.ids[1]}')
+        with patch.object(ChatRoomService, 'get_messages_after', wraps=ChatRoomService.get_messages_after) as query:
+            connected, _ = await ws.connect()
+            messages, replay = await self.receive_replay(ws)
+        self.assertTrue(connected)
+        self.assertEqual([message['id'] for message in messages], self.ids[2:])
+        self.assertEqual([message['sender'] for message in messages], ['alice', 'bob', 'alice'])
+        self.assertEqual(replay, {'type': 'chat.replay', 'status': 'complete', 'count': 3, 'last_message_id': self.ids[-1]})
+        self.assertEqual(query.await_count, 2)
+        await ws.disconnect()
+
+    @patch('chat_app.consumers.WS_REPLAY_MAX_MESSAGES', 3)
+    async def test_truncates_long_gaps(self, mock_get_user):
+        ws = communicator(self.chatroom.id, 1, query_string='since_message_id=0')
+        await ws.connect()
+        messages, replay = await self.receive_replay(ws)
+        self.assertEqual([message['id'] for message in messages], self.ids[:3])
+        self.assertEqual(replay['status'], 'truncated')
+        self.assertEqual(replay['last_message_id'], self.ids[2])
+        await ws.disconnect()
+
+    async def test_resumes_with_unbounded_send_queue(self, mock_get_user):
+        # WS_SEND_QUEUE_SIZE=0 (제한 없는 큐)에서도 배치 크기가 0이 되지 않아야 한다
+        with patch.object(OutboundQueue.__init__, '__defaults__', (0,)):
+            ws = communicator(self.chatroom.id, 1, query_string=f'since_message_id={self.ids[2]}')
+            await ws.connect()
+            messages, replay = await self.receive_replay(ws)
+        self.assertEqual([message['id'] for message in messages], self.ids[3:])
+        self.assertEqual(replay['status'], 'complete')
+        await ws.disconnect()
+
+    @patch('chat_app.consumers.MESSAGE_WRITE_BEHIND', True)
+    async def test_write_behind_disables_resume(self, mock_get_user):
+        ws = communicator(self.chatroom.id, 1, query_string=f'since_message_id={self.ids[0]}')
+        await ws.connect()
+        messages, replay = await self.receive_replay(ws)
+        self.assertEqual(messages, [])
+        self.assertEqual(replay, {'type': 'chat.replay', 'status': 'unavailable', 'count': 0, 'last_message_id': self.ids[0]})
+        await ws.disconnect()
+
+    async def test_first_frame_resume_does_not_duplicate_handoff_messages(self, mock_get_user):
+        sender = communicator(self.chatroom.id, 2)
+        reader = communicator(self.chatroom.id, 1)
+        await sender.connect()
+        await reader.connect()
+        get_messages_after = ChatRoomService.get_messages_after
+
+        async def send_during_replay(chatroom, after_message_id, limit):
+            # 재전송 조회 직전에 메시지가 저장되고 라이브 이벤트도 발행된다
+            if after_message_id == self.ids[-1]:
+                await sender.send_json_to({'type': 'chat', 'content': 'during handoff'})
+                await sender.receive_json_from()
+            return await get_messages_after(chatroom, after_message_id, limit)
+
+        with patch.object(ChatRoomService, 'get_messages_after', side_effect=send_during_replay):
+            await reader.send_json_to({'type': 'resume', 'since_message_id': self.ids[2]})
+            messages, replay = await self.receive_replay(reader)
+        self.assertEqual([message['content'] for message in messages], ['message 3', 'message 4', 'during handoff'])
+        self.assertEqual(replay['count'], 3)
+        self.assertTrue(await reader.receive_nothing(0.1))
+
+        await sender.send_json_to({'type': 'chat', 'content': 'live'})
+        self.assertEqual((await reader.receive_json_from())['content'], 'live')
+        await reader.send_json_to({'type': 'resume', 'since_message_id': 0})
+        self.assertEqual(await reader.receive_json_from(), {'type': 'error', 'message': 'resume must be the first frame.'})
+        await sender.disconnect()
+        await reader.disconnect()
+
+    async def test_resume_skips_messages_already_sent_live_before_first_frame(self, mock_get_user):
+        sender = communicator(self.chatroom.id, 2)
+        reader = communicator(self.chatroom.id, 1)
+        await sender.connect()
+        await reader.connect()
+
+        # 접속 직후 첫 프레임을 보내기 전에 라이브로 받은 메시지
+        await sender.send_json_to({'type': 'chat', 'content': 'gap'})
+        await sender.receive_json_from()
+        gap = await reader.receive_json_from()
+        self.assertEqual(gap['content'], 'gap')
+
+        await reader.send_json_to({'type': 'resume', 'since_message_id': self.ids[-1]})
+        messages, replay = await self.receive_replay(reader)
+        self.assertEqual(messages, [])
+        self.assertEqual(replay, {'type': 'chat.replay', 'status': 'complete', 'count': 0, 'last_message_id': gap['id']})
+        self.assertTrue(await reader.receive_nothing(0.1))
+        await sender.disconnect()
+        await reader.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+@patch('chat_app.services.UserService.get_user', side_effect=fake_get_user)
+class ChatConsumerFlowControlTests(TestCase):
+    def setUp(self):
+        ChatRoomService.room_members.clear()
+
+    @patch('chat_app.consumers.CHAT_BURST_PER_CONNECTION', 2)
+    @patch('chat_app.consumers.CHAT_RATE_PER_CONNECTION', 0.01)
+    async def test_connection_rate_limit(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        ws = communicator(chatroom.id, 1)
+        await ws.connect()
+        for i in range(3):
+            await ws.send_json_to({'type': 'chat', 'content': f'message {i}'})
+        events = [await ws.receive_json_from() for _ in range(3)]
+        self.assertEqual([event['type'] for event in events], ['chat.message', 'chat.message', 'error'])
+        self.assertEqual(await Message.objects.filter(chatroom=chatroom).acount(), 2)
+        await ws.disconnect()
+
+    async def test_user_rate_limit(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        ws = communicator(chatroom.id, 1)
+        await ws.connect()
+        with patch.object(user_rate_limiter, 'allow', AsyncMock(return_value=False)):
+            await ws.send_json_to({'type': 'chat', 'content': 'hello'})
+            self.assertEqual(await ws.receive_json_from(), {'type': 'error', 'message': 'Rate limit exceeded. Slow down.'})
+        await ws.disconnect()
+
+    async def test_slow_consumer_is_closed(self, mock_get_user):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        ws = communicator(chatroom.id, 1)
+        await ws.connect()
+        with patch('chat_app.consumers.OutboundQueue.put', return_value=False):
+            await ws.send_json_to({'type': 'chat', 'content': 'hello'})
+            output = await ws.receive_output()
+        self.assertEqual(output, {'type': 'websocket.close', 'code': CloseCode.SLOW_CONSUMER})
+        await ws.disconnect()
@@ -0,0 +1,79 @@
+import time
+from unittest.mock import patch
+from django.db import transaction
+from django.test import SimpleTestCase, override_settings
+from chat_app.models import ChatRoom
+from chat_app.tests.fake_redis import FakeRedis
+from config.db_router import (
+    ReplicaRouter, primary_until, recent_writers, note_write, pin_if_recent_writer, anote_write, apin_if_recent_writer,
+)
+
+
+@override_settings(DATABASE_REPLICA_PIN_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        self.token = primary_until.set(0.0)
+        recent_writers.clear()
+        self.router = ReplicaRouter(replicas=['replica_0', 'replica_1'])
+
+    def tearDown(self):
+        primary_until.reset(self.token)
+        recent_writers.clear()
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        self.assertIn(self.router.db_for_read(ChatRoom), {'replica_0', 'replica_1'})
+        self.assertEqual(self.router.db_for_write(ChatRoom), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'chat_app'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'chat_app'))
+
+    def test_reads_without_replicas_use_primary(self):
+        self.assertEqual(ReplicaRouter(replicas=[]).db_for_read(ChatRoom), 'default')
+
+    def test_write_pins_reads_to_primary(self):
+        note_write(7)
+        self.assertEqual(self.router.db_for_read(ChatRoom), 'default')
+
+        # 다른 요청(새 컨텍스트)이라도 최근에 쓴 사용자면 기본 DB에서 읽는다
+        primary_until.set(0.0)
+        pin_if_recent_writer(8)
+        self.assertIn(self.router.db_for_read(ChatRoom), {'replica_0', 'replica_1'})
+        pin_if_recent_writer(7)
+        self.assertEqual(self.router.db_for_read(ChatRoom), 'default')
+
+    def test_reads_inside_transaction_use_primary(self):
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(ChatRoom), 'default')
+
+
+@override_settings(DATABASE_REPLICA_PIN_SECONDS=5)
+@patch('config.db_router.has_replicas', return_value=True)
+class SharedRecentWriterTests(SimpleTestCase):
+    def setUp(self):
+        self.token = primary_until.set(0.0)
+        recent_writers.clear()
+        self.redis = FakeRedis()
+        patcher = patch('config.db_router.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        primary_until.reset(self.token)
+        recent_writers.clear()
+
+    async def test_write_on_another_worker_pins_reads(self, has_replicas):
+        await anote_write(7, chatroom_id=3)
+        # 다른 워커: 메모리 표시도 없고 새 요청 컨텍스트다
+        recent_writers.clear()
+        primary_until.set(0.0)
+
+        await apin_if_recent_writer(8)
+        self.assertLess(primary_until.get(), time.monotonic())
+        await apin_if_recent_writer(7)
+        self.assertGreater(primary_until.get(), time.monotonic())
+
+        # 받는 사람의 첫 페이지 읽기는 방 단위 표시로 고정된다
+        primary_until.set(0.0)
+        await apin_if_recent_writer(chatroom_id=3)
+        self.assertGreater(primary_until.get(), time.monotonic())
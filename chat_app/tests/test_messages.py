@@ -0,0 +1,267 @@
+import gzip
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils.timezone import now
+from asgiref.sync import sync_to_async
+from django.urls import reverse
+from chat_app.models import ChatRoom, Message, MessageArchive
+from chat_app.purge import purge_batch
+from chat_app.message_writer import MessageWriter, MessageIdAllocator, MessageQueueFull
+from chat_app.serializers import ChatRoomSerializer
+from chat_app.services import ChatRoomService
+from chat_app.tests.tests import generate_jwt
+
+
+class CreateMessageTests(TestCase):
+    async def test_updates_last_message_summary(self):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        await ChatRoomService.create_message(chatroom, 1, 'first')
+        message = await ChatRoomService.create_message(chatroom, 2, 'x' * 300)
+
+        chatroom = await ChatRoom.objects.aget(id=chatroom.id)
+        self.assertEqual(chatroom.last_message_id, message.id)
+        self.assertEqual(chatroom.last_message_sender_id, 2)
+        self.assertEqual(chatroom.last_message_preview, 'x' * 100)
+        self.assertEqual(chatroom.last_message_at, message.timestamp)
+        self.assertEqual(chatroom.updated_at, message.timestamp)
+
+    async def test_older_message_does_not_rewind_summary(self):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        # 더 큰 id의 메시지가 먼저 커밋된 상황
+        await ChatRoom.objects.filter(id=chatroom.id).aupdate(last_message_id=10**9, last_message_preview='newer')
+        await ChatRoomService.create_message(chatroom, 1, 'older')
+
+        chatroom = await ChatRoom.objects.aget(id=chatroom.id)
+        self.assertEqual(chatroom.last_message_preview, 'newer')
+        self.assertEqual(chatroom.unread_count_for(2), 1)
+
+    def test_serializer_reads_summary_without_queries(self):
+        chatroom = ChatRoom.objects.create(user1_id=1, user2_id=2)
+        empty = ChatRoom.objects.create(user1_id=1, user2_id=3)
+        ChatRoom.objects.filter(id=chatroom.id).update(last_message_id=1, last_message_preview='hello')
+        chatrooms = list(ChatRoom.objects.order_by('id'))
+
+        with self.assertNumQueries(0):
+            data = ChatRoomSerializer(chatrooms, many=True).data
+        self.assertEqual([room['last_message'] for room in data], ['hello', None])
+        self.assertEqual(data[1]['id'], empty.id)
+
+
+class MessageWriterTests(TestCase):
+    async def test_batches_messages_and_updates_summary(self):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        other = await ChatRoom.objects.acreate(user1_id=1, user2_id=3)
+        writer = MessageWriter(batch_size=10, interval=0.01)
+
+        messages = [await writer.submit(chatroom, 1, f'message {i}') for i in range(3)]
+        messages.append(await writer.submit(other, 3, 'hello'))
+        self.assertEqual(len({message.id for message in messages}), 4)
+        await writer.close()
+
+        self.assertEqual(await Message.objects.filter(chatroom=chatroom).acount(), 3)
+        saved = await Message.objects.aget(id=messages[0].id)
+        self.assertEqual(saved.timestamp, messages[0].timestamp)
+        chatroom = await ChatRoom.objects.aget(id=chatroom.id)
+        self.assertEqual(chatroom.last_message_id, messages[2].id)
+        self.assertEqual(chatroom.last_message_preview, 'message 2')
+
+    async def test_allocates_one_id_per_message_by_default(self):
+        # 블록을 예약하지 않아야 여러 워커의 id가 전송 순서를 따른다
+        allocator = MessageIdAllocator()
+        first = await allocator.allocate()
+        self.assertEqual(len(allocator._ids), 0)
+        self.assertEqual(await allocator.allocate(), first + 1)
+
+    async def test_rejects_when_queue_is_full(self):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        writer = MessageWriter(queue_size=1, interval=10, enqueue_timeout=0.01)
+        writer._batches.get().worker.cancel()
+
+        await writer.submit(chatroom, 1, 'first')
+        with self.assertRaises(MessageQueueFull):
+            await writer.submit(chatroom, 1, 'second')
+        writer._running.clear()
+
+    def test_write_is_idempotent(self):
+        chatroom = ChatRoom.objects.create(user1_id=1, user2_id=2)
+        message = Message(id=100, chatroom=chatroom, sender_id=1, content='hi')
+        MessageWriter.write([message])
+        MessageWriter.write([message, Message(id=101, chatroom=chatroom, sender_id=1, content='again')])
+        self.assertEqual(Message.objects.filter(id=100).count(), 1)
+        chatroom.refresh_from_db()
+        self.assertEqual(chatroom.unread_count_for(2), 2)
+
+    async def test_failing_row_does_not_drop_the_batch(self):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        gone = ChatRoom(id=9999, user1_id=1, user2_id=3)
+        write = MessageWriter.write
+
+        def write_or_fail(messages):
+            if any(message.chatroom_id == gone.id for message in messages):
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            write(messages)
+
+        writer = MessageWriter(batch_size=10, interval=0.01)
+        with patch.object(MessageWriter, 'write', side_effect=write_or_fail):
+            kept = await writer.submit(chatroom, 1, 'kept')
+            await writer.submit(gone, 1, 'lost')
+            await writer.close()
+        self.assertEqual([message.id async for message in Message.objects.all()], [kept.id])
+
+
+class MarkReadTests(TestCase):
+    async def test_watermark_marks_partner_messages_and_updates_counter(self):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        sent = [await ChatRoomService.create_message(chatroom, 2, f'message {i}') for i in range(3)]
+        own = await ChatRoomService.create_message(chatroom, 1, 'reply')
+        chatroom = await ChatRoom.objects.aget(id=chatroom.id)
+        self.assertEqual(chatroom.unread_count_for(1), 3)
+        self.assertEqual(chatroom.unread_count_for(2), 1)
+
+        self.assertEqual(await ChatRoomService.mark_read(chatroom.id, 1, sent[1].id), sent[1].id)
+        chatroom = await ChatRoom.objects.aget(id=chatroom.id)
+        self.assertEqual(chatroom.user1_last_read_id, sent[1].id)
+        self.assertEqual(chatroom.unread_count_for(1), 1)
+        self.assertEqual(await Message.objects.filter(chatroom=chatroom, is_read=True).acount(), 2)
+
+        # 이미 읽은 위치 이전이거나 없는 메시지는 무시하거나 마지막 메시지로 제한
+        self.assertIsNone(await ChatRoomService.mark_read(chatroom.id, 1, sent[0].id))
+        self.assertEqual(await ChatRoomService.mark_read(chatroom.id, 1, own.id + 100), own.id)
+        chatroom = await ChatRoom.objects.aget(id=chatroom.id)
+        self.assertEqual(chatroom.unread_count_for(1), 0)
+        self.assertFalse(await Message.objects.filter(id=own.id, is_read=True).aexists())
+
+    async def test_write_behind_counts_unread(self):
+        chatroom = await ChatRoom.objects.acreate(user1_id=1, user2_id=2)
+        writer = MessageWriter(batch_size=10, interval=0.01)
+        for i in range(3):
+            await writer.submit(chatroom, 1, f'message {i}')
+        await writer.close()
+
+        chatroom = await ChatRoom.objects.aget(id=chatroom.id)
+        self.assertEqual(chatroom.unread_count_for(2), 3)
+        self.assertEqual(chatroom.unread_count_for(1), 0)
+
+
+class MessageArchiveTests(TestCase):
+    def setUp(self):
+        self.chatroom = ChatRoom.objects.create(user1_id=1, user2_id=2)
+        old = now() - timedelta(days=400)
+        self.messages = Message.objects.bulk_create(
+            Message(chatroom=self.chatroom, sender_id=2, content=f'message {i}') for i in range(10)
+        )
+        # 앞의 7개만 보관 대상이 되도록 작성 시각을 과거로 돌린다
+        Message.objects.filter(id__in=[message.id for message in self.messages[:7]]).update(timestamp=old)
+
+    def test_command_requires_archive_reads(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_messages', stdout=StringIO())
+        self.assertFalse(MessageArchive.objects.exists())
+
+    @patch('chat_app.management.commands.archive_messages.MESSAGE_ARCHIVE', True)
+    def test_command_moves_old_messages_in_batches(self):
+        out = StringIO()
+        call_command('archive_messages', '--older-than-days', 180, '--batch-size', 3, '--max-batches', 2, stdout=out)
+        self.assertEqual(MessageArchive.objects.count(), 6)
+        self.assertIn('archived 3 messages (6 total)', out.getvalue())
+
+        call_command('archive_messages', '--older-than-days', 180, '--batch-size', 3, stdout=StringIO())
+        self.assertEqual(
+            list(MessageArchive.objects.order_by('id').values_list('id', flat=True)),
+            [message.id for message in self.messages[:7]]
+        )
+        self.assertEqual(Message.objects.count(), 3)
+
+    @patch('chat_app.management.commands.archive_messages.MESSAGE_ARCHIVE', True)
+    @patch('chat_app.services.MESSAGE_ARCHIVE', True)
+    async def test_reads_and_marks_across_tiers(self):
+        await sync_to_async(call_command)('archive_messages', '--older-than-days', 180, stdout=StringIO())
+        ids = [message.id for message in self.messages]
+
+        page = await ChatRoomService.get_messages(self.chatroom, limit=5)
+        self.assertEqual([message.id for message in page], ids[5:])
+        page = await ChatRoomService.get_messages(self.chatroom, ids[5], limit=5)
+        self.assertEqual([message.id for message in page], ids[:5])
+
+        await ChatRoom.objects.filter(id=self.chatroom.id).aupdate(last_message_id=ids[-1], user1_unread_count=10)
+        await ChatRoomService.mark_read(self.chatroom.id, 1, ids[-1])
+        chatroom = await ChatRoom.objects.aget(id=self.chatroom.id)
+        self.assertEqual(chatroom.unread_count_for(1), 0)
+        self.assertFalse(await MessageArchive.objects.filter(is_read=False).aexists())
+
+
+class PurgeChatroomsTests(TestCase):
+    def setUp(self):
+        self.deleted = ChatRoom.objects.create(user1_id=1, user2_id=2)
+        self.kept = ChatRoom.objects.create(user1_id=1, user2_id=3)
+        for chatroom in (self.deleted, self.kept):
+            Message.objects.bulk_create(
+                Message(chatroom=chatroom, sender_id=1, content=f'message {i}') for i in range(7)
+            )
+        ChatRoom.objects.filter(id=self.deleted.id).update(deleted_at=now() - timedelta(minutes=5))
+
+    def test_hides_deleted_rooms_until_purged_in_batches(self):
+        self.assertFalse(ChatRoom.objects.filter(id=self.deleted.id).exists())
+        # 같은 두 사용자는 이전 방이 남아 있어도 새 방을 만들 수 있다
+        ChatRoom.objects.create(user1_id=1, user2_id=2)
+
+        out = StringIO()
+        call_command('purge_chatrooms', '--grace-seconds', 60, '--batch-size', 3, stdout=out)
+        self.assertIn(f'chatroom {self.deleted.id}: purged 3 messages (6 so far)', out.getvalue())
+        self.assertIn(f'chatroom {self.deleted.id} removed with 7 messages (1/1)', out.getvalue())
+        self.assertFalse(ChatRoom.all_objects.filter(id=self.deleted.id).exists())
+        self.assertFalse(Message.objects.filter(chatroom_id=self.deleted.id).exists())
+        self.assertEqual(Message.objects.filter(chatroom=self.kept).count(), 7)
+
+    def test_batch_is_one_select_and_one_delete(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(purge_batch(Message, self.deleted.id, 5), 5)
+        self.assertEqual(Message.objects.filter(chatroom_id=self.deleted.id).count(), 2)
+
+    def test_waits_for_grace_period(self):
+        call_command('purge_chatrooms', '--grace-seconds', 3600, stdout=StringIO())
+        self.assertTrue(ChatRoom.all_objects.filter(id=self.deleted.id).exists())
+
+
+@patch('chat_app.services.UserService.get_users')
+class ChatRoomExportViewTests(TestCase):
+    def setUp(self):
+        self.chatroom = ChatRoom.objects.create(user1_id=1, user2_id=2)
+        Message.objects.bulk_create(
+            Message(chatroom=self.chatroom, sender_id=1 + i % 2, content=f'message {i}') for i in range(25)
+        )
+        self.url = reverse('message_export', args=[self.chatroom.id])
+        self.headers = {'Authorization': f'Bearer {generate_jwt(1)}'}
+
+    async def read(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_streams_ndjson_in_chunks(self, mock_get_users):
+        mock_get_users.return_value = {1: {'id': 1, 'nickname': 'alice', 'avatar': None}}
+        with patch('chat_app.export.EXPORT_CHUNK_SIZE', 10):
+            response = await self.async_client.get(self.url, headers=self.headers)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(chunks), 3)
+        lines = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual([line['content'] for line in lines], [f'message {i}' for i in range(25)])
+        self.assertEqual(lines[0]['sender'], 'alice')
+        self.assertIsNone(lines[1]['sender'])
+
+    async def test_streams_gzip(self, mock_get_users):
+        mock_get_users.return_value = {}
+        response = await self.async_client.get(self.url, {'compression': 'gzip'}, headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(await self.read(response)).splitlines()
+        self.assertEqual(len(lines), 25)
+
+    async def test_requires_membership(self, mock_get_users):
+        headers = {'Authorization': f'Bearer {generate_jwt(3)}'}
+        response = await self.async_client.get(self.url, headers=headers)
+        self.assertEqual(response.status_code, 403)
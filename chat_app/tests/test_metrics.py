@@ -0,0 +1,88 @@
+import time
+from asgiref.sync import async_to_sync
+from unittest.mock import patch
+from django.test import TestCase, RequestFactory
+from django.urls import reverse
+from rest_framework.test import APIClient
+from chat_app.models import ChatRoom
+from chat_app.tests.tests import generate_jwt
+from config import metrics
+from config.middleware import is_metrics_path
+from config.profiler import SamplingProfiler
+from config.views import profiler_view
+
+
+class PrometheusRenderTests(TestCase):
+    @patch.dict(metrics.REGISTRY, clear=True)
+    def test_renders_text_exposition_format(self):
+        metrics.counter('requests_total', 'Requests.').inc(2, view='a"b')
+        metrics.gauge('sockets', 'Open sockets.').dec()
+        metrics.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1)).observe(0.5)
+
+        lines = metrics.render_prometheus().splitlines()
+        self.assertIn('# TYPE requests_total counter', lines)
+        self.assertIn('requests_total{view="a\\"b"} 2', lines)
+        self.assertIn('sockets -1', lines)
+        self.assertIn('# TYPE latency_seconds histogram', lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 0', lines)
+        self.assertIn('latency_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 1', lines)
+        self.assertIn('latency_seconds_sum 0.5', lines)
+        self.assertIn('latency_seconds_count 1', lines)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_counts_queries_per_request_and_skips_auth(self):
+        ChatRoom.objects.create(user1_id=1, user2_id=2)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_jwt(1)}')
+        before = metrics.REGISTRY['http_request_db_queries'].get(view='room_list')
+        with patch('chat_app.services.UserService.get_users', return_value={}):
+            self.assertEqual(client.get(reverse('room_list')).status_code, 200)
+        after = metrics.REGISTRY['http_request_db_queries'].get(view='room_list')
+        self.assertEqual(after['count'], before['count'] + 1)
+        self.assertGreaterEqual(after['sum'] - before['sum'], 1)
+
+        response = APIClient().get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'http_request_db_queries_count{view="room_list"}', response.content)
+        self.assertIn(b'db_query_seconds_count{statement="SELECT"}', response.content)
+
+
+class SamplingProfilerTests(TestCase):
+    def test_collects_collapsed_stacks_while_running(self):
+        profiler = SamplingProfiler(interval=0.001)
+        self.assertTrue(profiler.start())
+        self.assertFalse(profiler.start())
+        deadline = time.monotonic() + 1
+        while profiler.status()['samples'] < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(profiler.stop())
+        self.assertFalse(profiler.running)
+
+        collapsed = profiler.collapsed()
+        self.assertIn('test_collects_collapsed_stacks_while_running', collapsed)
+        stack, count = collapsed.splitlines()[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertNotIn('_run (', stack)
+
+    def test_clamps_interval_and_stops_after_max_seconds(self):
+        profiler = SamplingProfiler(interval=0.01, min_interval=0.005, max_seconds=0.05)
+        self.assertTrue(profiler.start(interval=1e-9, seconds=60))
+        self.assertEqual(profiler.status()['interval'], 0.005)
+        self.assertEqual(profiler.status()['seconds'], 0.05)
+        profiler.thread.join(1)
+        self.assertFalse(profiler.running)
+        self.assertTrue(profiler.start())
+        profiler.stop()
+
+    def test_control_requires_allowed_user(self):
+        self.assertFalse(is_metrics_path('/metrics/profile'))
+        request = RequestFactory().post('/metrics/profile', {'action': 'stop'})
+        request.user_id = 1
+        response = async_to_sync(profiler_view)(request)
+        self.assertEqual(response.status_code, 403)
+        with patch('config.views.PROFILER_USER_IDS', [1]):
+            response = async_to_sync(profiler_view)(request)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,52 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+from redis.exceptions import ConnectionError
+from chat_app.outbound import OutboundQueue, outbound_dropped
+from chat_app.rate_limit import TokenBucket, RedisTokenBucket, rate_limit_errors
+
+
+class TokenBucketTests(TestCase):
+    @patch('chat_app.rate_limit.time.monotonic')
+    def test_allows_burst_then_refills_at_rate(self, monotonic):
+        monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=2, burst=3)
+        self.assertEqual([bucket.allow() for _ in range(4)], [True, True, True, False])
+
+        monotonic.return_value = 100.5
+        self.assertTrue(bucket.allow())
+        self.assertFalse(bucket.allow())
+
+
+class RedisTokenBucketTests(IsolatedAsyncioTestCase):
+    async def test_fails_open_without_redis(self):
+        bucket = RedisTokenBucket(rate=1, burst=1)
+        errors = rate_limit_errors.get()
+        with patch('chat_app.rate_limit.get_redis') as get_redis:
+            get_redis.return_value.register_script.return_value.side_effect = ConnectionError()
+            self.assertTrue(await bucket.allow(1))
+        self.assertEqual(rate_limit_errors.get(), errors + 1)
+
+
+class OutboundQueueTests(IsolatedAsyncioTestCase):
+    async def test_rejects_frames_when_full(self):
+        unblock = asyncio.Event()
+        sent = []
+
+        async def send(message):
+            await unblock.wait()
+            sent.append(message)
+
+        queue = OutboundQueue(send, maxsize=2)
+        dropped = outbound_dropped.get()
+        self.assertTrue(queue.put(1))
+        await asyncio.sleep(0)
+        self.assertTrue(queue.put(2))
+        self.assertTrue(queue.put(3))
+        self.assertFalse(queue.put(4))
+        self.assertEqual(outbound_dropped.get(), dropped + 1)
+
+        unblock.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(sent, [1, 2, 3])
+        queue.close()
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+from config.http_client import UserServiceClient, user_service_client, pool_hits
+from config.lifespan import lifespan
+from chat_app.profile_cache import ProfileCache, ProfileUnavailable
+from chat_app.services import UserService, ChatRoomService
+from .user_service_stub import UserServiceStub
+
+PROFILES = {
+    1: {'id': 1, 'nickname': 'alice', 'avatar': 'alice.png'},
+    2: {'id': 2, 'nickname': 'bob', 'avatar': 'bob.png'},
+}
+
+
+class UserServiceClientTests(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stub = await UserServiceStub(PROFILES).start()
+        self.client = UserServiceClient(base_url=self.stub.url, retry_backoff=0)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.stub.close()
+
+    async def test_reuses_pooled_connection(self):
+        hits = pool_hits.get()
+        self.assertEqual(await self.client.get_json('profile/1/', 'token'), PROFILES[1])
+        self.assertEqual(await self.client.get_json('profile/2/', 'token'), PROFILES[2])
+        self.assertEqual(pool_hits.get(), hits + 1)
+
+    async def test_retries_unavailable_service(self):
+        self.stub.fail_next = 2
+        self.assertEqual(await self.client.get_json('profile/1/', 'token'), PROFILES[1])
+        self.assertEqual(len(self.stub.requests), 3)
+
+    async def test_missing_profile_returns_none(self):
+        self.assertIsNone(await self.client.get_json('profile/3/', 'token'))
+
+
+class ClientLifecycleTests(IsolatedAsyncioTestCase):
+    async def test_lifespan_shutdown_closes_sessions_of_every_loop(self):
+        client = UserServiceClient()
+        session = client.session
+
+        other_loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=other_loop.run_forever)
+        thread.start()
+
+        async def open_session():
+            return client.session
+        other_session = asyncio.run_coroutine_threadsafe(open_session(), other_loop).result()
+
+        messages = asyncio.Queue()
+        for message_type in ('lifespan.startup', 'lifespan.shutdown'):
+            messages.put_nowait({'type': message_type})
+        sent = []
+
+        async def send(message):
+            sent.append(message['type'])
+
+        try:
+            with patch('config.lifespan.user_service_client', client):
+                await lifespan({'type': 'lifespan'}, messages.get, send)
+        finally:
+            other_loop.call_soon_threadsafe(other_loop.stop)
+            thread.join()
+            other_loop.close()
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertTrue(session.closed)
+        self.assertTrue(other_session.closed)
+
+
+class StoppedLoopCloseTests(TestCase):
+    def test_closes_sessions_left_on_stopped_loop(self):
+        # daphne처럼 lifespan 없이 리액터만 멈춘 경우
+        client = UserServiceClient()
+        loop = asyncio.new_event_loop()
+
+        async def open_session():
+            return client.session
+        session = loop.run_until_complete(open_session())
+        client.close_stopped()
+        self.assertTrue(session.closed)
+        loop.close()
+
+
+class ProfileCacheTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = ProfileCache(maxsize=10, ttl=60, negative_ttl=60, use_redis=False)
+        self.calls = []
+
+    def fetcher(self, user_id):
+        async def fetch():
+            self.calls.append(user_id)
+            await asyncio.sleep(0.01)
+            return PROFILES.get(user_id)
+        return fetch
+
+    async def test_caches_profiles_and_missing_users(self):
+        for _ in range(2):
+            self.assertEqual(await self.cache.get(1, self.fetcher(1)), PROFILES[1])
+            self.assertIsNone(await self.cache.get(3, self.fetcher(3)))
+        self.assertEqual(self.calls, [1, 3])
+
+    async def test_does_not_cache_unavailable_lookups(self):
+        async def unavailable():
+            self.calls.append(1)
+            raise ProfileUnavailable('user service returned 503')
+
+        self.assertIsNone(await self.cache.get(1, unavailable))
+        self.assertEqual(await self.cache.get(1, self.fetcher(1)), PROFILES[1])
+        self.assertEqual(self.calls, [1, 1])
+
+    async def test_coalesces_concurrent_misses(self):
+        results = await asyncio.gather(*[self.cache.get(2, self.fetcher(2)) for _ in range(5)])
+        self.assertEqual(results, [PROFILES[2]] * 5)
+        self.assertEqual(self.calls, [2])
+
+
+class FetchProfilesTests(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stub = await UserServiceStub(PROFILES).start()
+        self.patches = [
+            patch.object(user_service_client, 'base_url', self.stub.url),
+            patch.object(UserService, 'batch_path', 'profiles/'),
+            patch('chat_app.services.profile_cache', ProfileCache(use_redis=False)),
+        ]
+        for p in self.patches:
+            p.start()
+
+    async def asyncTearDown(self):
+        for p in self.patches:
+            p.stop()
+        await user_service_client.close()
+        await self.stub.close()
+
+    async def test_batch_endpoint(self):
+        self.stub.batch_enabled = True
+        profiles = await ChatRoomService.fetch_profiles({1, 2, 3}, 'token')
+        self.assertEqual(profiles, {1: PROFILES[1], 2: PROFILES[2]})
+        self.assertEqual(len(self.stub.requests), 1)
+
+    async def test_only_missing_users_are_cached_as_missing(self):
+        self.stub.fail_next = 1
+        with patch.object(user_service_client, 'max_retries', 0):
+            self.assertIsNone(await UserService.get_user(1, 'token'))
+        self.assertEqual(await UserService.get_user(1, 'token'), PROFILES[1])
+        self.assertIsNone(await UserService.get_user(3, 'token'))
+        self.assertIsNone(await UserService.get_user(3, 'token'))
+        self.assertEqual(len(self.stub.requests), 3)
+
+    async def test_falls_back_to_single_requests(self):
+        profiles = await ChatRoomService.fetch_profiles({1, 2, 3}, 'token')
+        self.assertEqual(profiles, {1: PROFILES[1], 2: PROFILES[2]})
+        self.assertIsNone(UserService.batch_path)
+        self.assertEqual(len(self.stub.requests), 4)
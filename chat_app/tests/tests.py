@@ -1,20 +1,31 @@
 from rest_framework.test import APITestCase, APIClient
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock, MagicMock
+from redis.exceptions import ConnectionError as RedisConnectionError
 from django.urls import reverse
-from chat_app.models import ChatRoom
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import SimpleTestCase, override_settings
+from django.utils.timezone import now
+from chat_app.models import ChatRoom, Message, MessageArchive
+from chat_app.history_cache import HistoryCache
+from chat_app.services import ChatRoomService
+from chat_app.presence import PresenceService
+from chat_app.tests.fake_redis import FakeRedis
+from config.settings import JWT_SECRET_KEY
+from config.tokens import token_cache_requests
 import jwt
 from datetime import datetime, timedelta
 
-SECRET_KEY = 'your_secret_key'
+SECRET_KEY = JWT_SECRET_KEY
 
-def generate_jwt(user_id):
+def generate_jwt(user_id, expires_in=timedelta(hours=1), secret_key=SECRET_KEY):
     """JWT 생성"""
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(hours=1),  # 1시간 유효
+        'exp': datetime.utcnow() + expires_in,  # 기본 1시간 유효
         'iat': datetime.utcnow()  # 발행 시간
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+    return jwt.encode(payload, secret_key, algorithm='HS256')
 
 class ChatRoomCreateViewTests(APITestCase):
     def setUp(self):
@@ -90,3 +101,318 @@ class ChatRoomCreateViewTests(APITestCase):
             response.data['non_field_errors'][0].code,
             'unique'
         )
+
+class ChatRoomListViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('room_list')
+        self.user_id = 1
+        self.token = generate_jwt(self.user_id)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        base = datetime(2024, 1, 1)
+        for partner_id in range(2, 7):
+            chatroom = ChatRoom.objects.create(user1_id=self.user_id, user2_id=partner_id)
+            Message.objects.create(chatroom=chatroom, sender_id=partner_id, content=f'hi from {partner_id}')
+            ChatRoom.objects.filter(id=chatroom.id).update(
+                updated_at=base + timedelta(minutes=partner_id),
+                last_message_id=partner_id,
+                last_message_preview=f'hi from {partner_id}',
+                user1_unread_count=1,
+            )
+        ChatRoom.objects.create(user1_id=7, user2_id=8)
+
+    @patch('chat_app.services.UserService.get_users')
+    def test_lists_rooms_with_keyset_pagination(self, mock_get_users):
+        mock_get_users.side_effect = lambda user_ids, token: {
+            user_id: {'id': user_id, 'nickname': f'user{user_id}', 'avatar': None} for user_id in user_ids
+        }
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        first_page = response.data['results']
+        self.assertEqual([room['partner_id'] for room in first_page], [6, 5, 4])
+        self.assertEqual(first_page[0]['nickname'], 'user6')
+        self.assertEqual(first_page[0]['last_message'], 'hi from 6')
+        self.assertEqual(first_page[0]['unread_count'], 1)
+
+        response = self.client.get(self.url, {'limit': 3, 'cursor': response.data['next_cursor']})
+        self.assertEqual([room['partner_id'] for room in response.data['results']], [3, 2])
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('chat_app.services.UserService.get_users', return_value={})
+    def test_validates_and_clamps_limit(self, mock_get_users):
+        self.assertEqual(self.client.get(self.url, {'limit': 'x'}).status_code, 400)
+        for limit, count in (('0', 1), ('-1', 1), ('1000', 5)):
+            response = self.client.get(self.url, {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), count)
+
+    @patch('chat_app.services.UserService.get_users', return_value={})
+    def test_session_cookie_does_not_break_async_view(self, mock_get_users):
+        # 같은 도메인의 admin 세션 쿠키가 붙어 와도 세션 사용자를 async로 읽어야 한다
+        session = SessionStore()
+        session.create()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+class ChatRoomMessageListViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_jwt(1)}')
+        self.chatroom = ChatRoom.objects.create(user1_id=1, user2_id=2)
+        for i in range(5):
+            Message.objects.create(chatroom=self.chatroom, sender_id=2, content=f'message {i}')
+        self.url = reverse('message_list', args=[self.chatroom.id])
+        ChatRoomService.room_members.clear()
+        self.history_cache = HistoryCache(size=4, enabled=True)
+        patcher = patch('chat_app.views.history_cache', self.history_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('chat_app.services.UserService.get_users')
+    def test_fills_cache_on_miss(self, mock_get_users):
+        mock_get_users.return_value = {2: {'id': 2, 'nickname': 'bob', 'avatar': None}}
+        with patch.object(self.history_cache, 'get_page', return_value=None), \
+                patch.object(self.history_cache, 'fill') as fill:
+            response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual([message['content'] for message in response.data], ['message 3', 'message 4'])
+        cached = fill.call_args.args[1]
+        self.assertEqual([message['content'] for message in cached], [f'message {i}' for i in range(1, 5)])
+        self.assertEqual(cached[0]['sender'], 'bob')
+
+    @patch('chat_app.services.ChatRoomService.is_deleted', new_callable=AsyncMock, return_value=False)
+    def test_serves_first_page_from_cache_without_queries(self, is_deleted):
+        ChatRoomService.remember_members(self.chatroom)
+        page = [{'id': 5, 'sender': 'bob', 'avatar': None, 'content': 'message 4', 'timestamp': '2024-01-01T00:00:00Z'}]
+        with patch.object(self.history_cache, 'get_page', return_value=page), self.assertNumQueries(0):
+            response = self.client.get(self.url, {'limit': 1})
+        self.assertEqual(response.data, page)
+
+    def test_cached_members_do_not_serve_room_deleted_on_another_worker(self):
+        # 삭제한 워커가 아니면 멤버십 캐시가 남아 있다
+        ChatRoomService.remember_members(self.chatroom)
+        ChatRoom.objects.filter(id=self.chatroom.id).update(deleted_at=now())
+        redis = MagicMock()
+        redis.exists = AsyncMock(return_value=1)
+        with patch('chat_app.services.get_redis', return_value=redis):
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertIsNone(ChatRoomService.get_cached_members(self.chatroom.id))
+
+        # Redis를 못 쓰면 DB에서 삭제 여부를 확인한다
+        ChatRoomService.remember_members(self.chatroom)
+        redis.exists = AsyncMock(side_effect=RedisConnectionError())
+        with patch('chat_app.services.get_redis', return_value=redis):
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_cache_respects_membership(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_jwt(3)}')
+        with patch.object(self.history_cache, 'get_page') as get_page:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+        get_page.assert_not_called()
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatRoomDeleteViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('delete')
+        self.chatroom = ChatRoom.objects.create(user1_id=1, user2_id=2)
+
+    def test_member_deletes_chatroom(self):
+        Message.objects.create(chatroom=self.chatroom, sender_id=1, content='hello')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_jwt(1)}')
+        response = self.client.post(self.url, {'chatroom_id': self.chatroom.id}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ChatRoom.objects.exists())
+        # 메시지는 purge_chatrooms가 지울 때까지 남고 방은 삭제 표시만 된다
+        self.assertIsNotNone(ChatRoom.all_objects.get(id=self.chatroom.id).deleted_at)
+        self.assertTrue(Message.objects.filter(chatroom_id=self.chatroom.id).exists())
+
+        response = self.client.post(self.url, {'chatroom_id': self.chatroom.id}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_delete_leaves_tombstone_for_other_workers(self):
+        redis = MagicMock()
+        redis.set = AsyncMock()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_jwt(1)}')
+        with patch('chat_app.services.get_redis', return_value=redis):
+            self.client.post(self.url, {'chatroom_id': self.chatroom.id}, format='json')
+        redis.set.assert_awaited_once_with(
+            f'chat:deleted:{self.chatroom.id}', 1, ex=settings.ROOM_MEMBERSHIP_CACHE_TTL
+        )
+
+    def test_non_member_cannot_delete_chatroom(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_jwt(3)}')
+        response = self.client.post(self.url, {'chatroom_id': self.chatroom.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(ChatRoom.objects.exists())
+
+@patch('chat_app.services.UserService.get_users')
+class MessageSearchViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('message_search')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_jwt(1)}')
+        chatroom = ChatRoom.objects.create(user1_id=1, user2_id=2)
+        other = ChatRoom.objects.create(user1_id=2, user2_id=3)
+        self.messages = [
+            Message.objects.create(chatroom=chatroom, sender_id=2, content=content)
+            for content in ['lunch at noon?', 'Lunch lunch LUNCH', 'see you at dinner', 'lunch_box']
+        ]
+        Message.objects.create(chatroom=other, sender_id=3, content='lunch elsewhere')
+
+    def test_ranks_matches_in_own_rooms_with_highlights(self, mock_get_users):
+        mock_get_users.return_value = {2: {'id': 2, 'nickname': 'bob', 'avatar': None}}
+        response = self.client.get(self.url, {'q': 'LUNCH'})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        # 밑줄은 단어 구분자이고, 짧은 메시지일수록 관련도가 높다
+        self.assertEqual(
+            [result['id'] for result in results],
+            [self.messages[1].id, self.messages[3].id, self.messages[0].id]
+        )
+        self.assertEqual(results[0]['highlights'], [[0, 5], [6, 11], [12, 17]])
+        self.assertEqual(results[1]['highlights'], [[0, 5]])
+        self.assertEqual(results[0]['sender'], 'bob')
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_keyset_pagination(self, mock_get_users):
+        mock_get_users.return_value = {}
+        first = self.client.get(self.url, {'q': 'lunch', 'limit': 2}).data
+        second = self.client.get(self.url, {'q': 'lunch', 'limit': 2, 'cursor': first['next_cursor']}).data
+        self.assertEqual([result['id'] for result in first['results']], [self.messages[1].id, self.messages[3].id])
+        self.assertEqual([result['id'] for result in second['results']], [self.messages[0].id])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_validates_and_clamps_limit(self, mock_get_users):
+        mock_get_users.return_value = {}
+        self.assertEqual(self.client.get(self.url, {'q': 'lunch', 'limit': 'x'}).status_code, 400)
+        response = self.client.get(self.url, {'q': 'lunch', 'limit': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.data['results']], [self.messages[1].id])
+        self.assertIsNotNone(response.data['next_cursor'])
+
+    def test_excludes_deleted_rooms(self, mock_get_users):
+        mock_get_users.return_value = {}
+        ChatRoom.objects.filter(user1_id=1).update(deleted_at=now())
+        response = self.client.get(self.url, {'q': 'lunch'})
+        self.assertEqual(response.data['results'], [])
+
+    @patch('chat_app.search.MESSAGE_ARCHIVE', True)
+    def test_searches_archived_messages(self, mock_get_users):
+        mock_get_users.return_value = {}
+        archived_id = self.messages[1].id
+        MessageArchive.from_message(self.messages[1]).save()
+        Message.objects.filter(id=archived_id).delete()
+        ids = [result['id'] for result in self.client.get(self.url, {'q': 'lunch'}).data['results']]
+        self.assertEqual(sorted(ids), sorted([self.messages[0].id, archived_id, self.messages[3].id]))
+
+        first = self.client.get(self.url, {'q': 'lunch', 'limit': 2}).data
+        second = self.client.get(self.url, {'q': 'lunch', 'limit': 2, 'cursor': first['next_cursor']}).data
+        self.assertEqual([result['id'] for result in first['results'] + second['results']], ids)
+
+    def test_requires_terms_and_ignores_query_syntax(self, mock_get_users):
+        mock_get_users.return_value = {}
+        self.assertEqual(self.client.get(self.url, {'q': '  ?! '}).status_code, 400)
+        response = self.client.get(self.url, {'q': 'lunch" OR dinner*'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+class PresenceViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('presence')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_jwt(1)}')
+        ChatRoom.objects.create(user1_id=1, user2_id=2)
+        ChatRoom.objects.create(user1_id=3, user2_id=1)
+
+    @patch('chat_app.views.PresenceService.get_presence')
+    def test_returns_presence_for_each_user(self, mock_get_presence):
+        mock_get_presence.return_value = {
+            2: {'online': True, 'last_seen': None},
+            3: {'online': False, 'last_seen': '2024-01-01 00:00:00'},
+        }
+        response = self.client.get(self.url, {'user_ids': '2,3,2'})
+        self.assertEqual(response.status_code, 200)
+        mock_get_presence.assert_called_once_with([2, 3])
+        self.assertTrue(response.data['results'][2]['online'])
+
+    @patch('chat_app.views.PresenceService.get_presence')
+    def test_only_reports_users_sharing_a_room(self, mock_get_presence):
+        ChatRoom.objects.create(user1_id=4, user2_id=5)
+        ChatRoom.objects.filter(user1_id__in=[1, 3], user2_id__in=[1, 3]).update(deleted_at=now())
+        mock_get_presence.return_value = {2: {'online': True, 'last_seen': None}}
+        response = self.client.get(self.url, {'user_ids': '2,3,4,5'})
+        self.assertEqual(response.status_code, 200)
+        mock_get_presence.assert_called_once_with([2])
+
+        mock_get_presence.reset_mock()
+        response = self.client.get(self.url, {'user_ids': '4'})
+        self.assertEqual(response.data, {'results': {}})
+        mock_get_presence.assert_not_called()
+
+    def test_last_seen_is_local_time(self):
+        # TIME_ZONE = 'Asia/Seoul'
+        self.assertEqual(PresenceService.format_last_seen(0), '1970-01-01 09:00:00')
+
+    def test_rejects_invalid_user_ids(self):
+        self.assertEqual(self.client.get(self.url, {'user_ids': 'a,b'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+class PresenceServiceTests(SimpleTestCase):
+    def setUp(self):
+        patcher = patch('chat_app.presence.get_redis', return_value=FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_online_and_offline_are_per_room(self):
+        # 방 10에 접속해 있는 사용자가 방 20에 들어오고 나가도 방 20에는 알린다
+        self.assertTrue(await PresenceService.connect(1, 10, 'a'))
+        self.assertTrue(await PresenceService.connect(1, 20, 'b'))
+        self.assertFalse(await PresenceService.connect(1, 20, 'c'))
+
+        self.assertIsNone(await PresenceService.disconnect(1, 20, 'b'))
+        self.assertIsNotNone(await PresenceService.disconnect(1, 20, 'c'))
+        self.assertTrue((await PresenceService.get_presence([1]))[1]['online'])
+
+        self.assertIsNotNone(await PresenceService.disconnect(1, 10, 'a'))
+        self.assertFalse((await PresenceService.get_presence([1]))[1]['online'])
+
+class JwtMiddlewareTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('room_list')
+
+    def test_rejects_invalid_signature(self):
+        token = generate_jwt(1, secret_key='another_secret_key')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+    def test_rejects_expired_token(self):
+        token = generate_jwt(1, expires_in=timedelta(hours=-1))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+    def test_rejects_token_without_expiry(self):
+        token = jwt.encode({'user_id': 1}, SECRET_KEY, algorithm='HS256')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_caches_verified_token(self):
+        token = generate_jwt(1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        misses = token_cache_requests.get(result='miss')
+        hits = token_cache_requests.get(result='hit')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(token_cache_requests.get(result='miss'), misses)
+        self.assertEqual(token_cache_requests.get(result='hit'), hits + 1)
@@ -0,0 +1,49 @@
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+class UserServiceStub:
+    # 테스트용 로컬 user 서비스
+    def __init__(self, profiles=None):
+        self.profiles = profiles or {}
+        self.requests = []
+        self.fail_next = 0
+        self.batch_enabled = False
+        self.server = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/profile/{user_id}/', self.get_profile)
+        self.app.router.add_get('/profiles/', self.get_profiles)
+
+    @property
+    def url(self):
+        return str(self.server.make_url('/'))
+
+    async def start(self):
+        self.server = TestServer(self.app)
+        await self.server.start_server()
+        return self
+
+    async def close(self):
+        await self.server.close()
+
+    async def get_profile(self, request):
+        self.requests.append(request.path)
+        if self.fail_next:
+            self.fail_next -= 1
+            return web.json_response({'error': 'unavailable'}, status=503)
+
+        profile = self.profiles.get(int(request.match_info['user_id']))
+        if profile is None:
+            return web.json_response({'error': 'not found'}, status=404)
+        return web.json_response(profile)
+
+    async def get_profiles(self, request):
+        self.requests.append(request.path_qs)
+        if not self.batch_enabled:
+            return web.json_response({'error': 'not found'}, status=404)
+
+        user_ids = [int(user_id) for user_id in request.query['ids'].split(',')]
+        return web.json_response([
+            self.profiles[user_id] for user_id in user_ids if user_id in self.profiles
+        ])
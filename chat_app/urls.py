@@ -2,12 +2,20 @@ from django.urls import path
 from .views import ChatRoomCreateView
 from .views import (
     ChatRoomCreateView,
+    ChatRoomListView,
     ChatRoomMessageListView,
-    ChatRoomDeleteView
+    ChatRoomExportView,
+    ChatRoomDeleteView,
+    MessageSearchView,
+    PresenceView
 )
 
 urlpatterns = [
     path('create/', ChatRoomCreateView.as_view(), name='create'),
+    path('rooms/', ChatRoomListView.as_view(), name='room_list'),
+    path('search/', MessageSearchView.as_view(), name='message_search'),
+    path('presence/', PresenceView.as_view(), name='presence'),
     path('<int:chatroom_id>/messages/', ChatRoomMessageListView.as_view(), name='message_list'),
+    path('<int:chatroom_id>/export/', ChatRoomExportView.as_view(), name='message_export'),
     path('delete/', ChatRoomDeleteView.as_view(), name='delete')
 ]
\ No newline at end of file
@@ -1,43 +1,171 @@
-from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
-from .serializers import ChatRoomSerializer, MessageSerializer
+from rest_framework import status, serializers
+from .serializers import ChatRoomSerializer, ChatRoomListSerializer, MessageSerializer
 from .services import ChatRoomService
-from django.shortcuts import get_object_or_404
+from .presence import PresenceService
+from .search import MessageSearchService
+from .history_cache import history_cache
+from .export import export_messages, gzip_stream
+from .pagination import parse_limit
+from config.settings import PRESENCE_MAX_USERS
+from config.views import AsyncAPIView
+from config.db_router import anote_write, apin_if_recent_writer
+from redis.exceptions import RedisError
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
 from .models import ChatRoom
-from asgiref.sync import async_to_sync
+import asyncio
+import logging
 
-class ChatRoomCreateView(APIView):
-    def post(self, request):
+logger = logging.getLogger(__name__)
+
+class ChatRoomCreateView(AsyncAPIView):
+    async def post(self, request):
         serializer = ChatRoomSerializer(data=request.data, context={'token': request.token})
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            await serializer.avalidate()
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        
+        await serializer.asave()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+class ChatRoomListView(AsyncAPIView):
+    async def get(self, request):
+        limit = parse_limit(
+            request.query_params.get('limit'), ChatRoomService.DEFAULT_ROOM_PAGE_SIZE, ChatRoomService.MAX_ROOM_PAGE_SIZE
+        )
+        cursor = request.query_params.get('cursor')
+        user_id = request.user_id
+        
+        chatrooms, next_cursor = await ChatRoomService.get_user_chatrooms(user_id, cursor, limit)
+        partner_ids = {chatroom.get_receiver_id(user_id) for chatroom in chatrooms}
+        profiles = await ChatRoomService.fetch_profiles(partner_ids, request.token)
+        serializer = ChatRoomListSerializer(
+            chatrooms, many=True, context={'user_id': user_id, 'profiles': profiles}
+        )
+        
+        return Response({'results': serializer.data, 'next_cursor': next_cursor})
+
+class MessageSearchView(AsyncAPIView):
+    async def get(self, request):
+        limit = parse_limit(
+            request.query_params.get('limit'), MessageSearchService.DEFAULT_PAGE_SIZE, MessageSearchService.MAX_PAGE_SIZE
+        )
+        messages, next_cursor = await MessageSearchService.search(
+            request.user_id, request.query_params.get('q', ''), request.query_params.get('cursor'), limit
+        )
+        profiles = await ChatRoomService.fetch_profiles({message.sender_id for message in messages}, request.token)
+        results = [
+            {**data, "chatroom_id": message.chatroom_id, "highlights": message.highlights}
+            for message, data in zip(messages, ChatRoomService.attach_profiles(messages, profiles))
+        ]
+        
+        return Response({'results': results, 'next_cursor': next_cursor})
 
-class ChatRoomMessageListView(APIView):
-    def get(self, request, chatroom_id):
+class PresenceView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            user_ids = [int(user_id) for user_id in request.query_params.get('user_ids', '').split(',') if user_id]
+        except ValueError:
+            return Response({"error": "user_ids must be a comma-separated list of integers."}, status=status.HTTP_400_BAD_REQUEST)
+        if not user_ids or len(user_ids) > PRESENCE_MAX_USERS:
+            return Response({"error": f"Provide between 1 and {PRESENCE_MAX_USERS} user_ids."}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 함께 쓰는 채팅방이 있는 상대의 접속 상태만 알려 준다. 나머지 id는 결과에서 빠진다
+        partner_ids = await ChatRoomService.shared_partner_ids(request.user_id, user_ids)
+        user_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id in partner_ids]
+        if not user_ids:
+            return Response({'results': {}})
+        try:
+            presence = await PresenceService.get_presence(user_ids)
+        except RedisError:
+            return Response({"error": "Presence is unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        
+        return Response({'results': presence})
+
+class ChatRoomMessageListView(AsyncAPIView):
+    async def get(self, request, chatroom_id):
         limit = int(request.query_params.get('limit', ChatRoomService.DEFAULT_PAGE_SIZE))
         last_loaded_message_id = request.query_params.get('last_loaded_message_id')
         token = self.request.token
 
-        chatroom = get_object_or_404(ChatRoom, id=chatroom_id)
+        members = ChatRoomService.get_cached_members(chatroom_id)
+        if members is None:
+            chatroom = await ChatRoomService.get_chatroom_by_id(chatroom_id)
+            if chatroom is None:
+                raise Http404
+        else:
+            # 다른 워커에서 삭제된 방은 이 워커의 멤버십 캐시에 남아 있을 수 있다
+            if await ChatRoomService.is_deleted(chatroom_id):
+                ChatRoomService.forget_chatroom(chatroom_id)
+                raise Http404
+            chatroom = ChatRoom(id=chatroom_id, user1_id=members[0], user2_id=members[1])
         ChatRoomService.check_user_permission(chatroom, request.user_id)
         
-        messages = async_to_sync(ChatRoomService.get_messages)(chatroom, last_loaded_message_id, limit)
-        messages = async_to_sync(ChatRoomService.add_avatars_to_messages)(messages, token)
-        serializer = MessageSerializer(messages, many=True)
+        first_page = not last_loaded_message_id
+        if first_page:
+            cached = await history_cache.get_page(chatroom_id, limit)
+            if cached is not None:
+                return Response(cached)
+        
+        # 방금 메시지가 저장된 방의 첫 페이지는 받는 사람도 복제 지연 동안 기본 DB에서 읽는다
+        if first_page:
+            await apin_if_recent_writer(chatroom_id=chatroom_id)
+        # 캐시를 채울 수 있으면 첫 페이지는 캐시 크기만큼 읽는다
+        fill = first_page and history_cache.can_serve(limit)
+        size = history_cache.size if fill else limit
+        # 1:1 채팅방의 발신자는 두 멤버뿐이라 메시지 조회와 프로필 조회를 동시에 한다
+        messages, profiles = await asyncio.gather(
+            ChatRoomService.get_messages(chatroom, last_loaded_message_id, size),
+            ChatRoomService.fetch_profiles({chatroom.user1_id, chatroom.user2_id}, token)
+        )
+        messages = ChatRoomService.attach_profiles(messages, profiles)
+        data = MessageSerializer(messages, many=True).data
+        
+        # 프로필을 못 가져온 메시지가 있으면 빈 닉네임이 TTL 동안 남지 않도록 채우지 않는다
+        if fill and all(message['sender'] is not None for message in data):
+            await history_cache.fill(chatroom_id, data)
+        return Response(data[-limit:] if fill else data)
+
+class ChatRoomExportView(AsyncAPIView):
+    async def get(self, request, chatroom_id):
+        compression = request.query_params.get('compression')
+        if compression not in (None, 'gzip'):
+            return Response({"error": "compression must be gzip."}, status=status.HTTP_400_BAD_REQUEST)
+        
+        chatroom = await aget_object_or_404(ChatRoom, id=chatroom_id)
+        ChatRoomService.check_user_permission(chatroom, request.user_id)
+        # 발신자는 두 멤버뿐이므로 프로필은 시작할 때 한 번만 가져온다
+        profiles = await ChatRoomService.fetch_profiles({chatroom.user1_id, chatroom.user2_id}, request.token)
         
-        return Response(serializer.data)
+        content = export_messages(chatroom, profiles)
+        filename = f'chat-{chatroom.id}.ndjson'
+        content_type = 'application/x-ndjson'
+        if compression == 'gzip':
+            content = gzip_stream(content)
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
-class ChatRoomDeleteView(APIView):
-    def post(self, request):
+class ChatRoomDeleteView(AsyncAPIView):
+    async def post(self, request):
         user_id = request.user_id
         chatroom_id = request.data.get('chatroom_id')
-        chatroom = get_object_or_404(ChatRoom, id=chatroom_id)
+        chatroom = await aget_object_or_404(ChatRoom, id=chatroom_id)
         
-        if not ChatRoomService.is_user_in_chatroom(user_id, chatroom):
+        if not await ChatRoomService.is_user_in_chatroom(user_id, chatroom):
             return Response({"error": "User is not in chat room."}, status=status.HTTP_400_BAD_REQUEST)     
     
-        chatroom.delete()
+        await anote_write(user_id, chatroom.id)
+        try:
+            await ChatRoomService.delete_chatroom(chatroom)
+        except RedisError:
+            # 삭제 표시는 이미 커밋됐다. 열린 소켓은 알림을 못 받지만 재접속하면 방을 찾지 못해 거절된다
+            logger.exception('Failed to notify sockets of deleted chatroom %s', chatroom.id)
+        await history_cache.invalidate(chatroom_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -7,11 +7,13 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django_asgi_app = get_asgi_application()
 
 from config.middleware import CustomWsMiddleware
+from config.lifespan import lifespan
 from chat_app.routing import websocket_urlpatterns
 
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
+    "lifespan": lifespan,
     "websocket": CustomWsMiddleware(
         URLRouter(
             websocket_urlpatterns
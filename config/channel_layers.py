@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+from bisect import bisect
+from channels_redis.core import RedisChannelLayer, BoundedQueue
+from config import metrics
+
+local_deliveries = metrics.counter('channel_layer_local_deliveries_total', 'Group messages delivered in memory to channels on this worker.')
+remote_sends = metrics.counter('channel_layer_remote_sends_total', 'Group messages that had to be published to Redis for other workers.')
+
+
+class HashRing:
+    # 호스트마다 replicas개의 가상 노드를 링에 둔다. 호스트를 추가하거나 빼도 다른 호스트의 키는 그대로 남는다
+    def __init__(self, nodes, replicas=160):
+        points = sorted(
+            (self.hash(f'{node}#{replica}'), index)
+            for index, node in enumerate(nodes)
+            for replica in range(replicas)
+        )
+        self.points = [point for point, _ in points]
+        self.indexes = [index for _, index in points]
+
+    @staticmethod
+    def hash(value):
+        if isinstance(value, str):
+            value = value.encode()
+        return int.from_bytes(hashlib.md5(value).digest()[:8], 'big')
+
+    def get(self, value):
+        position = bisect(self.points, self.hash(value)) % len(self.points)
+        return self.indexes[position]
+
+
+class LocalRedisChannelLayer(RedisChannelLayer):
+    # 같은 프로세스의 그룹 멤버에게는 Redis를 거치지 않고 수신 버퍼에 바로 넣고,
+    # 다른 워커의 멤버에게만 Redis로 보낸다. 그룹과 채널 키는 해시 링으로 여러 Redis에 나눈다
+    def __init__(self, *args, ring_replicas=160, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ring = HashRing([host.get('address', repr(sorted(host.items()))) for host in self.hosts], ring_replicas)
+        self.local_groups = {}
+        # 로컬 전달은 수신 잠금을 가진 receive()를 거쳐 각 채널 버퍼로 간다
+        self.local_inbox = BoundedQueue(self.capacity)
+        self.pending_receive = None
+
+    def consistent_hash(self, value):
+        if self.ring_size == 1:
+            return 0
+        return self.ring.get(value)
+
+    def is_local(self, channel):
+        return '!' in channel and self.non_local_name(channel).endswith(self.client_prefix + '!')
+
+    async def group_add(self, group, channel):
+        # 다른 워커가 이 채널을 찾을 수 있도록 Redis에도 등록한다
+        await super().group_add(group, channel)
+        if self.is_local(channel):
+            self.local_groups.setdefault(group, set()).add(channel)
+
+    async def group_discard(self, group, channel):
+        channels = self.local_groups.get(group)
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del self.local_groups[group]
+        await super().group_discard(group, channel)
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+        for channel in self.local_groups.get(group, ()):
+            # Redis 경로처럼 수신자마다 별도 dict를 받는다. 용량을 넘으면 BoundedQueue가 가장 오래된 메시지를 버린다
+            self.local_inbox.put_nowait((channel, dict(message)))
+            local_deliveries.inc()
+        await super().group_send(group, message)
+
+    async def receive_single(self, channel):
+        # receive()는 수신 잠금을 가진 한 코루틴만 여기서 Redis를 기다리게 하고, 나머지는 자기 버퍼만 본다.
+        # 버퍼에 바로 넣으면 잠금을 가진 채널은 BRPOP이 끝날 때까지 로컬 메시지를 못 받으므로
+        # 로컬 메시지도 여기서 돌려준다. 진행 중인 BRPOP은 취소하지 않고 다음 호출에서 이어 기다린다
+        if '!' not in channel:
+            return await super().receive_single(channel)
+        if not self.local_inbox.empty():
+            return self.local_inbox.get_nowait()
+        if self.pending_receive is None:
+            self.pending_receive = asyncio.ensure_future(super().receive_single(channel))
+        local = asyncio.ensure_future(self.local_inbox.get())
+        try:
+            await asyncio.wait([self.pending_receive, local], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not local.done():
+                local.cancel()
+        if local.done() and not local.cancelled():
+            return local.result()
+        pending, self.pending_receive = self.pending_receive, None
+        return pending.result()
+
+    async def close_pools(self):
+        if self.pending_receive is not None:
+            self.pending_receive.cancel()
+            self.pending_receive = None
+        await super().close_pools()
+
+    def _map_channel_keys_to_connection(self, channel_names, message):
+        # 부모의 group_send가 Redis에 쓸 채널 목록을 만드는 지점. 이미 메모리로 전달한 로컬 채널은 뺀다
+        remote = [channel for channel in channel_names if not self.is_local(channel)]
+        if remote:
+            remote_sends.inc()
+        return super()._map_channel_keys_to_connection(remote, message)
@@ -0,0 +1,40 @@
+import time
+from contextvars import ContextVar
+from config import metrics
+
+db_query_seconds = metrics.histogram('db_query_seconds', 'Database query latency by statement type.')
+
+# 요청 단위 집계 객체. sync_to_async는 컨텍스트를 복사하지만 같은 객체를 가리키므로 ORM 스레드의 쿼리도 여기 더해진다
+query_stats = ContextVar('query_stats', default=None)
+
+
+class QueryStats:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def observe_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        db_query_seconds.observe(elapsed, statement=statement_type(sql))
+        stats = query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+
+def statement_type(sql):
+    head = sql.lstrip()[:16].split(None, 1)
+    return head[0].upper() if head else 'UNKNOWN'
+
+
+def install_query_observer(sender, connection, **kwargs):
+    # connection_created 수신기. 스레드마다 새로 만들어지는 연결에도 빠짐없이 붙는다
+    if observe_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(observe_query)
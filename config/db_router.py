@@ -0,0 +1,103 @@
+import random
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from redis.exceptions import RedisError
+from config.cache import TTLCache, MISS
+from config.redis_client import get_redis
+
+# 요청/소켓(태스크) 단위로 이 시각까지는 읽기도 기본 DB로 보낸다
+primary_until = ContextVar('primary_until', default=0.0)
+# 최근에 쓴 사용자와 채팅방. 이 워커에서는 메모리에서 바로 확인하고,
+# 다른 워커로 간 다음 요청도 복제 지연 동안 기본 DB에서 읽도록 같은 표시를 Redis에도 남긴다
+recent_writers = TTLCache(maxsize=100000)
+RECENT_WRITE_KEY_PREFIX = 'db:recent_write:'
+
+
+def pin_to_primary(seconds=None):
+    if seconds is None:
+        seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+    primary_until.set(max(primary_until.get(), time.monotonic() + seconds))
+
+
+def has_replicas():
+    return any(alias != DEFAULT_DB_ALIAS for alias in settings.DATABASES)
+
+
+def recent_write_keys(user_id=None, chatroom_id=None):
+    keys = []
+    if user_id is not None:
+        keys.append(f'user:{user_id}')
+    if chatroom_id is not None:
+        keys.append(f'room:{chatroom_id}')
+    return keys
+
+
+def note_write(user_id=None, chatroom_id=None):
+    pin_to_primary()
+    for key in recent_write_keys(user_id, chatroom_id):
+        recent_writers.set(key, True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+async def anote_write(user_id=None, chatroom_id=None):
+    note_write(user_id, chatroom_id)
+    keys = recent_write_keys(user_id, chatroom_id)
+    if not keys or not has_replicas():
+        return
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(f'{RECENT_WRITE_KEY_PREFIX}{key}', 1, px=int(settings.DATABASE_REPLICA_PIN_SECONDS * 1000))
+            await pipe.execute()
+    except RedisError:
+        # 이 워커의 표시는 남아 있으므로 다른 워커에서만 복제 지연이 보일 수 있다
+        pass
+
+
+def pin_if_recent_writer(user_id=None, chatroom_id=None):
+    # 동기 경로용. 이 워커에서 남긴 표시만 본다
+    if any(recent_writers.get(key) is not MISS for key in recent_write_keys(user_id, chatroom_id)):
+        pin_to_primary()
+        return True
+    return False
+
+
+async def apin_if_recent_writer(user_id=None, chatroom_id=None):
+    if pin_if_recent_writer(user_id, chatroom_id):
+        return
+    keys = recent_write_keys(user_id, chatroom_id)
+    if not keys or not has_replicas():
+        return
+    try:
+        found = await get_redis().exists(*(f'{RECENT_WRITE_KEY_PREFIX}{key}' for key in keys))
+    except RedisError:
+        return
+    if found:
+        pin_to_primary()
+
+
+class ReplicaRouter:
+    # 쓰기와 마이그레이션은 기본 DB, 읽기는 복제본 중 하나로 보낸다
+    def __init__(self, replicas=None):
+        if replicas is None:
+            replicas = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+        self.replicas = replicas
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or primary_until.get() > time.monotonic():
+            return DEFAULT_DB_ALIAS
+        # 트랜잭션 안의 읽기는 같은 트랜잭션에서 쓴 행을 봐야 한다
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 복제본은 기본 DB의 사본이므로 어느 쪽에서 읽은 객체끼리도 관계를 맺을 수 있다
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
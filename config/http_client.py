@@ -0,0 +1,134 @@
+import asyncio
+import time
+import aiohttp
+from config.settings import (
+    USER_SERVICE_URL,
+    USER_SERVICE_POOL_LIMIT,
+    USER_SERVICE_POOL_LIMIT_PER_HOST,
+    USER_SERVICE_KEEPALIVE_TIMEOUT,
+    USER_SERVICE_CONNECT_TIMEOUT,
+    USER_SERVICE_TIMEOUT,
+    USER_SERVICE_MAX_RETRIES,
+    USER_SERVICE_RETRY_BACKOFF,
+)
+from config.loop_local import LoopLocal
+from config import metrics
+
+pool_hits = metrics.counter('user_service_pool_hits_total', 'Requests served by a pooled keep-alive connection.')
+pool_misses = metrics.counter('user_service_pool_misses_total', 'Requests that had to open a new connection.')
+pool_waits = metrics.counter('user_service_pool_waits_total', 'Requests that waited for a free pooled connection.')
+request_errors = metrics.counter('user_service_errors_total', 'Failed user service requests by reason.')
+request_retries = metrics.counter('user_service_retries_total', 'Retried user service requests.')
+request_latency = metrics.histogram('user_service_request_seconds', 'User service request latency per attempt, by outcome.')
+
+
+class UserServiceClient:
+    RETRY_STATUSES = {502, 503, 504}
+
+    def __init__(
+        self,
+        base_url=USER_SERVICE_URL,
+        limit=USER_SERVICE_POOL_LIMIT,
+        limit_per_host=USER_SERVICE_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=USER_SERVICE_KEEPALIVE_TIMEOUT,
+        connect_timeout=USER_SERVICE_CONNECT_TIMEOUT,
+        timeout=USER_SERVICE_TIMEOUT,
+        max_retries=USER_SERVICE_MAX_RETRIES,
+        retry_backoff=USER_SERVICE_RETRY_BACKOFF,
+    ):
+        self.base_url = base_url
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._sessions = LoopLocal(self._create_session)
+
+    def _create_session(self):
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_reuseconn.append(self._on_reuse)
+        trace_config.on_connection_create_start.append(self._on_create)
+        trace_config.on_connection_queued_start.append(self._on_queued)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            trace_configs=[trace_config],
+        )
+
+    @staticmethod
+    async def _on_reuse(session, context, params):
+        pool_hits.inc()
+
+    @staticmethod
+    async def _on_create(session, context, params):
+        pool_misses.inc()
+
+    @staticmethod
+    async def _on_queued(session, context, params):
+        pool_waits.inc()
+
+    @property
+    def session(self):
+        session = self._sessions.get()
+        if session.closed:
+            self._sessions.pop()
+            session = self._sessions.get()
+        return session
+
+    async def get(self, path, token, params=None):
+        url = f'{self.base_url}{path}'
+        headers = {'Authorization': f'Bearer {token}'}
+
+        for attempt in range(self.max_retries + 1):
+            retryable = attempt < self.max_retries
+            started = time.perf_counter()
+            try:
+                async with self.session.get(url, headers=headers, params=params) as response:
+                    if response.status in self.RETRY_STATUSES:
+                        request_latency.observe(time.perf_counter() - started, outcome=str(response.status))
+                        request_errors.inc(reason=str(response.status))
+                        if not retryable:
+                            return response.status, None
+                    else:
+                        data = await response.json() if response.status == 200 else None
+                        request_latency.observe(time.perf_counter() - started, outcome=str(response.status))
+                        return response.status, data
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                request_latency.observe(time.perf_counter() - started, outcome=type(e).__name__)
+                request_errors.inc(reason=type(e).__name__)
+                if not retryable:
+                    raise
+
+            request_retries.inc()
+            await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+
+    async def get_json(self, path, token, params=None):
+        status, data = await self.get(path, token, params=params)
+        return data if status == 200 else None
+
+    async def close(self):
+        session = self._sessions.pop()
+        if session and not session.closed:
+            await session.close()
+
+    async def close_all(self):
+        await self._sessions.close_all(self._close_session)
+
+    def close_stopped(self):
+        self._sessions.close_stopped(self._close_session)
+
+    @staticmethod
+    async def _close_session(session):
+        if not session.closed:
+            await session.close()
+
+
+user_service_client = UserServiceClient()
@@ -0,0 +1,50 @@
+import json
+from config.settings import JSON_BACKEND
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibJson:
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class OrJson:
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+BACKENDS = {'json': StdlibJson, 'orjson': OrJson}
+
+# orjson.JSONDecodeError는 json.JSONDecodeError의 하위 클래스라 호출부는 백엔드와 무관하게 처리할 수 있다
+JSONDecodeError = json.JSONDecodeError
+
+
+def get_backend(name=JSON_BACKEND):
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if name == 'orjson' and orjson is None:
+        raise ImportError("JSON_BACKEND=orjson requires the orjson package.")
+    return BACKENDS[name]
+
+
+backend = get_backend()
+dumps = backend.dumps
+loads = backend.loads
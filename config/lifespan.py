@@ -0,0 +1,37 @@
+import atexit
+import logging
+from config.http_client import user_service_client
+from config.redis_client import close_redis, close_stopped_redis
+
+logger = logging.getLogger(__name__)
+
+
+async def close_clients():
+    await user_service_client.close_all()
+    await close_redis()
+
+
+async def lifespan(scope, receive, send):
+    # lifespan을 보내는 서버(uvicorn 등)에서는 루프가 살아 있는 종료 시점에 커넥션 풀을 닫는다
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            try:
+                await close_clients()
+            except Exception as e:
+                await send({'type': 'lifespan.shutdown.failed', 'message': str(e)})
+            else:
+                await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+@atexit.register
+def close_clients_at_exit():
+    # daphne는 lifespan을 보내지 않는다. 리액터가 멈춘 뒤 아직 닫히지 않은 루프에서 닫는다
+    try:
+        user_service_client.close_stopped()
+        close_stopped_redis()
+    except Exception:
+        logger.exception('failed to close clients at exit')
@@ -0,0 +1,36 @@
+import asyncio
+import weakref
+
+
+class LoopLocal:
+    # aiohttp 세션, redis 커넥션 등 이벤트 루프에 묶인 객체를 루프별로 하나씩 보관
+    def __init__(self, factory):
+        self._factory = factory
+        self._values = weakref.WeakKeyDictionary()
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        value = self._values.get(loop)
+        if value is None:
+            value = self._values[loop] = self._factory()
+        return value
+
+    def pop(self):
+        return self._values.pop(asyncio.get_running_loop(), None)
+
+    async def close_all(self, close):
+        # 루프에 묶인 객체는 그 루프에서만 닫을 수 있다. 이미 멈춘 루프의 객체는 루프와 함께 버린다
+        current = asyncio.get_running_loop()
+        for loop, value in list(self._values.items()):
+            self._values.pop(loop, None)
+            if loop is current:
+                await close(value)
+            elif loop.is_running():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(close(value), loop))
+
+    def close_stopped(self, close):
+        # 도는 루프가 없는 프로세스 종료 시점용. 멈췄지만 닫히지 않은 루프를 잠깐 돌려 그 루프의 객체를 닫는다
+        for loop, value in list(self._values.items()):
+            if not loop.is_running() and not loop.is_closed():
+                self._values.pop(loop, None)
+                loop.run_until_complete(close(value))
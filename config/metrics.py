@@ -0,0 +1,194 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+REGISTRY = {}
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] += amount
+
+    def get(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] += amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def get(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get(self, **labels):
+        state = self._values.get(tuple(sorted(labels.items())))
+        if state is None:
+            return {'count': 0, 'sum': 0.0}
+        return {'count': state[2], 'sum': state[1]}
+
+    def samples(self):
+        with self._lock:
+            return {
+                key: {
+                    'buckets': dict(zip(self.buckets + (float('inf'),), _cumulative(counts))),
+                    'sum': total,
+                    'count': count,
+                }
+                for key, (counts, total, count) in self._values.items()
+            }
+
+
+class PhaseTimer:
+    # 여러 단계로 나뉜 처리의 단계별 소요 시간을 phase 레이블로 기록한다
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = self.phase_started = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.histogram.observe(now - self.phase_started, phase=phase, **self.labels)
+        self.phase_started = now
+
+    def total(self, **labels):
+        self.histogram.observe(time.perf_counter() - self.started, phase='total', **self.labels, **labels)
+
+
+def _cumulative(counts):
+    total = 0
+    result = []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+
+def _register(cls, name, *args, **kwargs):
+    metric = REGISTRY.get(name)
+    if metric is None:
+        metric = REGISTRY[name] = cls(name, *args, **kwargs)
+    return metric
+
+
+def counter(name, documentation):
+    return _register(Counter, name, documentation)
+
+
+def gauge(name, documentation):
+    return _register(Gauge, name, documentation)
+
+
+def histogram(name, documentation, buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, documentation, buckets)
+
+
+def snapshot():
+    return {
+        name: {
+            ','.join(f'{k}={v}' for k, v in key): value
+            for key, value in metric.samples().items()
+        }
+        for name, metric in REGISTRY.items()
+    }
+
+
+PROMETHEUS_TYPES = {Counter: 'counter', Gauge: 'gauge', Histogram: 'histogram'}
+
+
+def render_prometheus():
+    # Prometheus 텍스트 형식 (version 0.0.4)
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f'# HELP {name} {_escape_help(metric.documentation)}')
+        lines.append(f'# TYPE {name} {PROMETHEUS_TYPES[type(metric)]}')
+        for key, value in sorted(metric.samples().items(), key=lambda item: str(item[0])):
+            if isinstance(metric, Histogram):
+                for bound, count in value['buckets'].items():
+                    le = '+Inf' if bound == float('inf') else _format_value(bound)
+                    lines.append(f'{name}_bucket{_format_labels(key + (("le", le),))} {count}')
+                lines.append(f'{name}_sum{_format_labels(key)} {_format_value(value["sum"])}')
+                lines.append(f'{name}_count{_format_labels(key)} {value["count"]}')
+            else:
+                lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{label}="{_escape_label(value)}"' for label, value in key) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -1,20 +1,105 @@
-import jwt
 import json
-from django.utils.deprecation import MiddlewareMixin
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from channels.middleware import BaseMiddleware
 from django.http import JsonResponse
 from urllib.parse import parse_qs
+from config.tokens import token_verifier
+from config.settings import METRICS_PATH
+from config.db_metrics import QueryStats, query_stats
+from config.db_router import pin_if_recent_writer, apin_if_recent_writer
+from config import metrics
 
+request_latency = metrics.histogram('http_request_seconds', 'HTTP request latency by view, method and status.')
+request_db_queries = metrics.histogram(
+    'http_request_db_queries', 'Database queries per HTTP request by view.',
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+request_db_seconds = metrics.histogram('http_request_db_seconds', 'Database time per HTTP request by view.')
 
-class CustomHttpMiddleware(MiddlewareMixin):
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            query_stats.reset(token)
+        self.observe(request, response, stats, started)
+        return response
+    
+    async def __acall__(self, request):
+        stats, token, started = self.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            query_stats.reset(token)
+        self.observe(request, response, stats, started)
+        return response
+    
+    def begin(self):
+        stats = QueryStats()
+        return stats, query_stats.set(stats), time.perf_counter()
+    
+    def observe(self, request, response, stats, started):
+        # URL 이름으로 묶어 경로 파라미터마다 시계열이 늘어나지 않게 한다
+        match = request.resolver_match
+        view = match.url_name if match is not None and match.url_name else 'unmatched'
+        request_latency.observe(
+            time.perf_counter() - started, view=view, method=request.method, status=response.status_code
+        )
+        request_db_queries.observe(stats.count, view=view)
+        request_db_seconds.observe(stats.seconds, view=view)
+
+
+
+class CustomHttpMiddleware:
+    # MiddlewareMixin은 async 체인에서도 process_request를 스레드로 넘기므로 직접 양쪽을 지원한다
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.process_request(request)
+        if response is not None:
+            return response
+        pin_if_recent_writer(getattr(request, 'user_id', None))
+        return self.get_response(request)
+    
+    async def __acall__(self, request):
+        response = self.process_request(request)
+        if response is not None:
+            return response
+        # 직전에 쓴 사용자의 읽기는 복제 지연 동안 기본 DB로. 다른 워커에서 쓴 경우는 Redis로 확인한다
+        await apin_if_recent_writer(getattr(request, 'user_id', None))
+        return await self.get_response(request)
+    
     def process_request(self, request):
+        if is_metrics_path(request.path):
+            return None
         token_line = request.headers.get("Authorization")
         if not token_line:
             return JsonResponse({"error": "Authentication token missing."}, status=401)
 
         try:
             token = token_line.split(" ")[1]
-            payload = jwt.decode(token, options={"verify_signature": False})
+            payload = token_verifier.verify(token)
             request.user_id = payload.get("user_id")
             request.token = token
         except Exception as e:
@@ -27,7 +112,7 @@ class CustomWsMiddleware(BaseMiddleware):
             return await self.reject_request(send, "Authentication token missing.")
         
         try:
-            payload = jwt.decode(token, options={"verify_signature": False})
+            payload = token_verifier.verify(token)
             user_id = payload.get('user_id')
             scope['user_id'] = user_id
             
@@ -51,6 +136,10 @@ class CustomWsMiddleware(BaseMiddleware):
             "body": body,
         })
         
+def is_metrics_path(path):
+    # 스크레이프 경로만 인증을 건너뛴다. 그 아래 프로파일러 제어는 JWT가 필요하다
+    return path == METRICS_PATH
+
 def get_jwt(scope):
     query_string = scope.get('query_string', b'').decode()
     query_params = parse_qs(query_string)
@@ -0,0 +1,96 @@
+import sys
+import threading
+import time
+from collections import Counter
+from config.settings import PROFILER_INTERVAL, PROFILER_MIN_INTERVAL, PROFILER_MAX_SECONDS
+from config import metrics
+
+profiler_samples = metrics.counter('profiler_samples_total', 'Stack samples taken by the sampling profiler.')
+
+
+class SamplingProfiler:
+    # 켜져 있는 동안만 별도 스레드가 interval마다 모든 스레드의 스택을 찍는다. 꺼져 있으면 비용이 없다.
+    # 결과는 flamegraph.pl / speedscope가 읽는 collapsed 형식 ("a;b;c 횟수")
+    def __init__(self, interval=PROFILER_INTERVAL, min_interval=PROFILER_MIN_INTERVAL, max_seconds=PROFILER_MAX_SECONDS):
+        self.min_interval = min_interval
+        self.max_seconds = max_seconds
+        self.interval = max(interval, min_interval)
+        self.stacks = Counter()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.seconds = max_seconds
+
+    @property
+    def running(self):
+        # max_seconds가 지나면 샘플링 스레드는 스스로 끝난다
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval=None, seconds=None):
+        with self.lock:
+            if self.running:
+                return False
+            if interval:
+                self.interval = max(interval, self.min_interval)
+            self.seconds = min(seconds, self.max_seconds) if seconds else self.max_seconds
+            self.stacks = Counter()
+            self.stop_event.clear()
+            self.started_at = time.time()
+            self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is None:
+            return False
+        self.stop_event.set()
+        thread.join()
+        return True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        while not self.stop_event.wait(self.interval) and time.monotonic() < deadline:
+            self.sample(own_id)
+
+    def sample(self, skip_thread_id=None):
+        stacks = [
+            self.collapse(frame)
+            for thread_id, frame in sys._current_frames().items()
+            if thread_id != skip_thread_id
+        ]
+        with self.lock:
+            self.stacks.update(stacks)
+        profiler_samples.inc(len(stacks))
+
+    @staticmethod
+    def collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            # 줄 번호 대신 함수 시작 줄을 써서 같은 함수의 샘플이 한 칸으로 모이게 한다
+            names.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def collapsed(self):
+        with self.lock:
+            stacks = self.stacks.most_common()
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+    def status(self):
+        with self.lock:
+            samples = self.stacks.total()
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'started_at': self.started_at,
+            'seconds': self.seconds,
+            'samples': samples,
+        }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,19 @@
+import redis.asyncio as redis
+from config.settings import REDIS_HOST, REDIS_PORT, REDIS_DB
+from config.loop_local import LoopLocal
+
+_clients = LoopLocal(
+    lambda: redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+)
+
+
+def get_redis():
+    return _clients.get()
+
+
+async def close_redis():
+    await _clients.close_all(lambda client: client.aclose())
+
+
+def close_stopped_redis():
+    _clients.close_stopped(lambda client: client.aclose())
@@ -1,16 +1,8 @@
-import aiohttp
-from config.settings import USER_SERVICE_URL
+from config.http_client import user_service_client
 from datetime import datetime
 
 async def get_user(user_id, token):
-    request_url = f'{USER_SERVICE_URL}profile/{user_id}/'
-    headers = {'Authorization': f'Bearer {token}'}
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(request_url, headers=headers, timeout=10) as response:
-            if response.status == 200:
-                return await response.json()
-            return None 
+    return await user_service_client.get_json(f'profile/{user_id}/', token)
         
 def format_datetime(dt):
     if isinstance(dt, datetime):
@@ -1,18 +1,124 @@
+from copy import deepcopy
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 
 # ENV
 SECRET_KEY = config("SECRET_KEY")
 DEBUG = config("DEBUG", cast=bool)
 
+JWT_SECRET_KEY = config('JWT_SECRET_KEY', default=SECRET_KEY)
+JWT_ALGORITHMS = config('JWT_ALGORITHMS', default='HS256', cast=Csv())
+TOKEN_CACHE_SIZE = config('TOKEN_CACHE_SIZE', default=10000, cast=int)
+
 USER_SERVICE_URL = config("USER_SERVICE_URL")
+USER_SERVICE_POOL_LIMIT = config('USER_SERVICE_POOL_LIMIT', default=100, cast=int)
+USER_SERVICE_POOL_LIMIT_PER_HOST = config('USER_SERVICE_POOL_LIMIT_PER_HOST', default=20, cast=int)
+USER_SERVICE_KEEPALIVE_TIMEOUT = config('USER_SERVICE_KEEPALIVE_TIMEOUT', default=30, cast=float)
+USER_SERVICE_CONNECT_TIMEOUT = config('USER_SERVICE_CONNECT_TIMEOUT', default=3, cast=float)
+USER_SERVICE_TIMEOUT = config('USER_SERVICE_TIMEOUT', default=10, cast=float)
+USER_SERVICE_MAX_RETRIES = config('USER_SERVICE_MAX_RETRIES', default=2, cast=int)
+USER_SERVICE_RETRY_BACKOFF = config('USER_SERVICE_RETRY_BACKOFF', default=0.1, cast=float)
+USER_SERVICE_BATCH_PATH = config('USER_SERVICE_BATCH_PATH', default='')
+USER_SERVICE_MAX_CONCURRENCY = config('USER_SERVICE_MAX_CONCURRENCY', default=10, cast=int)
 
 DATABASE_ENGINE = config('DATABASE_ENGINE', default='sqlite3')
+# postgresql 전용. 풀을 끄면 DATABASE_CONN_MAX_AGE 초 동안 커넥션을 유지한다
+DATABASE_POOL = config('DATABASE_POOL', default=True, cast=bool)
+DATABASE_POOL_MIN_SIZE = config('DATABASE_POOL_MIN_SIZE', default=2, cast=int)
+DATABASE_POOL_MAX_SIZE = config('DATABASE_POOL_MAX_SIZE', default=20, cast=int)
+DATABASE_POOL_TIMEOUT = config('DATABASE_POOL_TIMEOUT', default=10, cast=float)
+DATABASE_POOL_MAX_IDLE = config('DATABASE_POOL_MAX_IDLE', default=300, cast=float)
+DATABASE_CONN_MAX_AGE = config('DATABASE_CONN_MAX_AGE', default=0, cast=int)
+# 읽기 복제본 목록 ("host:port,host"). 비우면 모든 쿼리가 기본 DB로 간다
+POSTGRES_REPLICA_HOSTS = [
+    (host, port) for host, _, port in (
+        entry.strip().partition(':') for entry in config('POSTGRES_REPLICA_HOSTS', default='').split(',') if entry.strip()
+    )
+]
+# 쓰기 직후 이 시간 동안은 같은 사용자의 읽기를 기본 DB로 보낸다 (복제 지연 대비)
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=5, cast=float)
 
 REDIS_HOST = config('REDIS_HOST')
 REDIS_PORT = config('REDIS_PORT', cast=int)
 REDIS_DB = config('REDIS_DB', cast=int)
 REDIS_CAPACITY = config('REDIS_CAPACITY', cast=int)
+# 채널 레이어를 나눌 Redis 목록 ("host:port,host:port"). 비우면 REDIS_HOST 하나만 쓴다
+REDIS_HOSTS = [
+    (host, int(port)) for host, port in (
+        entry.strip().rsplit(':', 1) for entry in config('REDIS_HOSTS', default='').split(',') if entry.strip()
+    )
+] or [(REDIS_HOST, REDIS_PORT)]
+# 켜면 같은 워커의 그룹 멤버에게는 메모리로 바로 전달하고 그룹/채널 키는 해시 링으로 REDIS_HOSTS에 나눈다
+CHANNEL_LAYER_LOCAL_DELIVERY = config('CHANNEL_LAYER_LOCAL_DELIVERY', default=False, cast=bool)
+
+PROFILE_CACHE_SIZE = config('PROFILE_CACHE_SIZE', default=10000, cast=int)
+PROFILE_CACHE_TTL = config('PROFILE_CACHE_TTL', default=60, cast=int)
+PROFILE_CACHE_NEGATIVE_TTL = config('PROFILE_CACHE_NEGATIVE_TTL', default=10, cast=int)
+PROFILE_CACHE_REDIS = config('PROFILE_CACHE_REDIS', default=False, cast=bool)
+
+ROOM_MEMBERSHIP_CACHE_SIZE = config('ROOM_MEMBERSHIP_CACHE_SIZE', default=10000, cast=int)
+ROOM_MEMBERSHIP_CACHE_TTL = config('ROOM_MEMBERSHIP_CACHE_TTL', default=300, cast=int)
+
+# /metrics는 JWT 없이 열리므로 내부망에서만 접근하게 배포한다. 프로파일러 제어 엔드포인트는 켜야만 생긴다
+METRICS_PATH = config('METRICS_PATH', default='/metrics')
+PROFILER_ENABLED = config('PROFILER_ENABLED', default=False, cast=bool)
+PROFILER_INTERVAL = config('PROFILER_INTERVAL', default=0.01, cast=float)
+# 프로파일러 제어는 JWT 인증을 거치고 이 사용자들만 할 수 있다. 샘플 간격 하한과 한 번에 켜 둘 수 있는 최대 시간
+PROFILER_USER_IDS = config('PROFILER_USER_IDS', default='', cast=Csv(int))
+PROFILER_MIN_INTERVAL = config('PROFILER_MIN_INTERVAL', default=0.001, cast=float)
+PROFILER_MAX_SECONDS = config('PROFILER_MAX_SECONDS', default=300, cast=float)
+
+MESSAGE_WRITE_BEHIND = config('MESSAGE_WRITE_BEHIND', default=False, cast=bool)
+MESSAGE_BATCH_SIZE = config('MESSAGE_BATCH_SIZE', default=200, cast=int)
+MESSAGE_BATCH_INTERVAL = config('MESSAGE_BATCH_INTERVAL', default=0.05, cast=float)
+MESSAGE_QUEUE_SIZE = config('MESSAGE_QUEUE_SIZE', default=10000, cast=int)
+MESSAGE_ENQUEUE_TIMEOUT = config('MESSAGE_ENQUEUE_TIMEOUT', default=1, cast=float)
+MESSAGE_FLUSH_RETRIES = config('MESSAGE_FLUSH_RETRIES', default=5, cast=int)
+# 메시지 id는 전송 순서와 같아야 한다(정렬, 페이지 커서, 요약/읽음 비교가 모두 id 기준).
+# 1보다 크게 잡으면 워커마다 블록을 따로 예약해 워커 사이 순서가 뒤섞이므로 워커가 하나일 때만 쓴다
+MESSAGE_ID_BLOCK_SIZE = config('MESSAGE_ID_BLOCK_SIZE', default=1, cast=int)
+
+# 켜면 MESSAGE_ARCHIVE_AFTER_DAYS보다 오래된 메시지를 archive_messages 명령이 보관 테이블로 옮기고 조회와 검색은 두 테이블을 함께 읽는다
+MESSAGE_ARCHIVE = config('MESSAGE_ARCHIVE', default=False, cast=bool)
+MESSAGE_ARCHIVE_AFTER_DAYS = config('MESSAGE_ARCHIVE_AFTER_DAYS', default=180, cast=int)
+MESSAGE_ARCHIVE_BATCH_SIZE = config('MESSAGE_ARCHIVE_BATCH_SIZE', default=5000, cast=int)
+# 삭제된 방의 메시지를 purge_chatrooms 명령이 한 번에 지우는 행 수와, 진행 중인 쓰기가 끝나도록 삭제 후 기다리는 시간
+CHATROOM_PURGE_BATCH_SIZE = config('CHATROOM_PURGE_BATCH_SIZE', default=5000, cast=int)
+CHATROOM_PURGE_GRACE_SECONDS = config('CHATROOM_PURGE_GRACE_SECONDS', default=60, cast=int)
+
+WS_COALESCE_WINDOW = config('WS_COALESCE_WINDOW', default=0.01, cast=float)
+WS_COALESCE_MAX_EVENTS = config('WS_COALESCE_MAX_EVENTS', default=100, cast=int)
+READ_RECEIPT_WINDOW = config('READ_RECEIPT_WINDOW', default=0.5, cast=float)
+
+PRESENCE_TTL = config('PRESENCE_TTL', default=60, cast=int)
+PRESENCE_HEARTBEAT_INTERVAL = config('PRESENCE_HEARTBEAT_INTERVAL', default=20, cast=float)
+PRESENCE_MAX_USERS = config('PRESENCE_MAX_USERS', default=100, cast=int)
+LAST_SEEN_TTL = config('LAST_SEEN_TTL', default=60 * 60 * 24 * 30, cast=int)
+TYPING_TTL = config('TYPING_TTL', default=5, cast=int)
+TYPING_MIN_INTERVAL = config('TYPING_MIN_INTERVAL', default=1, cast=float)
+
+# 초당 채팅 메시지 수와 순간 허용량. 연결 단위는 워커 메모리, 사용자 단위는 Redis에서 공유
+CHAT_RATE_PER_CONNECTION = config('CHAT_RATE_PER_CONNECTION', default=5, cast=float)
+CHAT_BURST_PER_CONNECTION = config('CHAT_BURST_PER_CONNECTION', default=10, cast=int)
+CHAT_RATE_PER_USER = config('CHAT_RATE_PER_USER', default=10, cast=float)
+CHAT_BURST_PER_USER = config('CHAT_BURST_PER_USER', default=20, cast=int)
+CHAT_USER_RATE_LIMIT = config('CHAT_USER_RATE_LIMIT', default=True, cast=bool)
+WS_SEND_QUEUE_SIZE = config('WS_SEND_QUEUE_SIZE', default=256, cast=int)
+# 방 삭제로 소켓을 닫기 전에 보내기 큐가 비기를 기다리는 최대 시간(초)
+WS_SEND_DRAIN_TIMEOUT = config('WS_SEND_DRAIN_TIMEOUT', default=5, cast=float)
+
+# 재접속 시 since_message_id 이후 메시지를 배치 단위로 다시 보낸다. 최대치를 넘으면 나머지는 REST로 받게 한다
+WS_REPLAY_BATCH_SIZE = config('WS_REPLAY_BATCH_SIZE', default=100, cast=int)
+WS_REPLAY_MAX_MESSAGES = config('WS_REPLAY_MAX_MESSAGES', default=1000, cast=int)
+
+HISTORY_CACHE = config('HISTORY_CACHE', default=False, cast=bool)
+HISTORY_CACHE_SIZE = config('HISTORY_CACHE_SIZE', default=50, cast=int)
+HISTORY_CACHE_TTL = config('HISTORY_CACHE_TTL', default=60 * 60, cast=int)
+
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# auto는 orjson이 설치되어 있으면 orjson, 아니면 표준 json
+JSON_BACKEND = config('JSON_BACKEND', default='auto')
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,6 +144,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.middleware.MetricsMiddleware',
     'config.middleware.CustomHttpMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -88,8 +195,29 @@ elif DATABASE_ENGINE == 'postgresql':
             'PASSWORD': config('POSTGRES_PASSWORD', default=''),
             'HOST': config('POSTGRES_HOST', default='localhost'),
             'PORT': config('POSTGRES_PORT', default='5432'),
+            'OPTIONS': {},
         }
     }
+    # psycopg_pool 커넥션 풀. 풀이 커넥션을 재사용하므로 CONN_MAX_AGE는 0이어야 한다
+    if DATABASE_POOL:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': DATABASE_POOL_MIN_SIZE,
+            'max_size': DATABASE_POOL_MAX_SIZE,
+            'timeout': DATABASE_POOL_TIMEOUT,
+            'max_idle': DATABASE_POOL_MAX_IDLE,
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = DATABASE_CONN_MAX_AGE
+    # 읽기 전용 복제본은 기본 DB와 같은 계정/옵션을 쓰고 호스트만 다르다
+    for index, (host, port) in enumerate(POSTGRES_REPLICA_HOSTS):
+        DATABASES[f'replica_{index}'] = {
+            **deepcopy(DATABASES['default']),
+            'HOST': host,
+            'PORT': port or DATABASES['default']['PORT'],
+            'TEST': {'MIRROR': 'default'},
+        }
+    if POSTGRES_REPLICA_HOSTS:
+        DATABASE_ROUTERS = ['config.db_router.ReplicaRouter']
 else:
     raise ValueError("Unsupported DATABASE_ENGINE value")
 
@@ -141,9 +269,12 @@ ASGI_APPLICATION = 'config.asgi.application'
 # Redis 채널 레이어 추가
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': (
+            'config.channel_layers.LocalRedisChannelLayer' if CHANNEL_LAYER_LOCAL_DELIVERY
+            else 'channels_redis.core.RedisChannelLayer'
+        ),
         'CONFIG': {
-            "hosts": [(REDIS_HOST, REDIS_PORT)],
+            "hosts": REDIS_HOSTS,
             "capacity": REDIS_CAPACITY, # 메시지 큐 용량
         },
     },
@@ -0,0 +1,39 @@
+import hashlib
+import time
+import jwt
+from config.settings import JWT_SECRET_KEY, JWT_ALGORITHMS, TOKEN_CACHE_SIZE
+from config.cache import TTLCache, MISS
+from config import metrics
+
+token_cache_requests = metrics.counter('jwt_cache_requests_total', 'Verified token cache lookups by result.')
+
+
+class TokenVerifier:
+    def __init__(self, key=JWT_SECRET_KEY, algorithms=JWT_ALGORITHMS, maxsize=TOKEN_CACHE_SIZE):
+        self.key = key
+        self.algorithms = algorithms
+        self.cache = TTLCache(maxsize)
+
+    def verify(self, token):
+        # 토큰 원문 대신 digest를 키로 쓰고, 만료 시각까지만 검증 결과를 재사용
+        digest = hashlib.sha256(token.encode()).digest()
+        claims = self.cache.get(digest)
+        if claims is not MISS:
+            token_cache_requests.inc(result='hit')
+            return claims
+
+        token_cache_requests.inc(result='miss')
+        # 만료 시각이 없는 토큰은 영원히 유효하므로 받지 않는다
+        claims = jwt.decode(token, self.key, algorithms=self.algorithms, options={'require': ['exp']})
+        ttl = claims['exp'] - time.time()
+        if ttl > 0:
+            self.cache.set(digest, claims, ttl)
+        return claims
+
+    def hit_rate(self):
+        hits = token_cache_requests.get(result='hit')
+        total = hits + token_cache_requests.get(result='miss')
+        return hits / total if total else 0.0
+
+
+token_verifier = TokenVerifier()
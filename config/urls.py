@@ -1,5 +1,11 @@
 from django.urls import path, include
+from config.settings import METRICS_PATH, PROFILER_ENABLED
+from config.views import metrics_view, profiler_view
 
 urlpatterns = [
     path('api/chat/', include('chat_app.urls')),
+    path(METRICS_PATH.lstrip('/'), metrics_view, name='metrics'),
 ]
+
+if PROFILER_ENABLED:
+    urlpatterns.append(path(f"{METRICS_PATH.lstrip('/')}/profile", profiler_view, name='profiler'))
@@ -0,0 +1,68 @@
+from inspect import isawaitable
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework.views import APIView
+from config import metrics
+from config.profiler import profiler
+from config.settings import PROFILER_USER_IDS
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class AsyncAPIView(APIView):
+    # DRF의 dispatch는 동기라서 async 핸들러를 그대로 await하도록 다시 구현한다.
+    # 인증/권한/콘텐츠 협상은 I/O가 없으므로 이벤트 루프에서 바로 실행해도 된다.
+    # 세션 사용자만은 DB를 읽으므로 SessionAuthentication이 보기 전에 auser()로 미리 풀어 둔다
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        if hasattr(request, 'auser'):
+            request.user = await request.auser()
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+async def metrics_view(request):
+    return HttpResponse(metrics.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+async def profiler_view(request):
+    # GET: 모은 스택을 collapsed 형식으로, POST action=start|stop: 워커별 프로파일러 켜고 끄기.
+    # CustomHttpMiddleware가 JWT를 확인한 뒤 PROFILER_USER_IDS에 있는 사용자만 허용한다
+    if getattr(request, 'user_id', None) not in PROFILER_USER_IDS:
+        return JsonResponse({"error": "Not allowed to use the profiler."}, status=403)
+    if request.method == 'GET':
+        return HttpResponse(profiler.collapsed(), content_type='text/plain; charset=utf-8')
+
+    action = request.POST.get('action') or request.GET.get('action')
+    if action == 'start':
+        try:
+            interval = float(request.POST.get('interval') or request.GET.get('interval') or 0)
+            seconds = float(request.POST.get('seconds') or request.GET.get('seconds') or 0)
+        except ValueError:
+            return JsonResponse({"error": "interval and seconds must be numbers."}, status=400)
+        profiler.start(interval if interval > 0 else None, seconds if seconds > 0 else None)
+    elif action == 'stop':
+        profiler.stop()
+    else:
+        return JsonResponse({"error": "action must be start or stop."}, status=400)
+    return JsonResponse(profiler.status())